@@ -0,0 +1,167 @@
+"""Headless JSON API serving explorer results without Streamlit
+
+Endpoints:
+
+- ``GET /country/{name}?lang=en&place_type=hotels`` returns the same bundle
+  the Explore button shows: ``wiki``, ``facts``, ``travel``, ``coords`` and
+  ``places``, plus the resolved ``country``. Every response carries an ETag
+  and ``If-None-Match`` is answered with 304.
+- ``GET /compare?countries=France,Germany,Spain&lang=en&place_type=hotels``
+  returns ``countries``, one such bundle per country, fetched together,
+  and the names it couldn't resolve under ``unknown``.
+- ``GET /healthz`` for load balancer checks.
+- ``GET /metrics`` in Prometheus text format.
+
+It runs on Tornado, which Streamlit already depends on. It uses the same
+response cache, HTTP client, Nominatim scheduler and fetch orchestration as
+the app, and keeps no per-client state, so instances can be scaled out
+behind a load balancer; set ``EXPLORER_SHARED_STORE`` so they share one
+cache and one Nominatim rate limit.
+
+Usage::
+
+    python api_server.py --port 8080
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import tornado.web
+
+from explorer_api import MAX_COMPARE, Explorer
+from geocoding import NOMINATIM_QUERIES, normalize_place_type
+from metrics import get_metrics
+
+# Seconds clients and caches in front of the service may reuse a response
+MAX_AGE = int(os.environ.get('EXPLORER_API_MAX_AGE', 300))
+
+LANG_PATTERN = re.compile(r'^[a-z]{2,3}(-[a-z]+)?$')
+
+
+class ExplorerService:
+    """Fetch bundles on a thread pool, coalescing identical concurrent requests"""
+
+    def __init__(self, explorer: Optional[Explorer] = None, max_workers: int = 16):
+        self.explorer = explorer or Explorer()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='explore')
+        self._inflight: Dict[Tuple[str, str, str], asyncio.Future] = {}
+
+    async def _coalesced(self, key: Tuple, fetch: Callable[[], Any]) -> Any:
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, fetch)
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def explore(self, country: str, lang: str, place_type: str) -> Optional[Dict]:
+        key = (country.strip().lower(), lang, place_type)
+        return await self._coalesced(
+            key, lambda: self.explorer.explore(country, lang, place_type, fallbacks=(lang, 'en')))
+
+    async def compare(self, countries: List[str], lang: str, place_type: str) -> Dict:
+        key = (tuple(c.strip().lower() for c in countries), lang, place_type)
+        return await self._coalesced(key, lambda: self.explorer.compare(countries, lang, place_type))
+
+
+class JSONHandler(tornado.web.RequestHandler):
+    def write_json(self, data, status: int = 200):
+        self.set_status(status)
+        self.set_header('Content-Type', 'application/json; charset=utf-8')
+        self.finish(json.dumps(data, ensure_ascii=False, sort_keys=True))
+
+    def write_error(self, status_code: int, **kwargs):
+        self.write_json({'error': self._reason}, status_code)
+
+
+class ExplorerHandler(JSONHandler):
+    def initialize(self, service: ExplorerService):
+        self.service = service
+
+    def lang_and_place_type(self) -> Tuple[str, str]:
+        lang = self.get_argument('lang', 'en').lower()
+        place_type = normalize_place_type(self.get_argument('place_type', 'tourist_attractions'))
+        if not LANG_PATTERN.match(lang):
+            raise tornado.web.HTTPError(400, reason=f"Invalid lang '{lang}'")
+        if place_type not in NOMINATIM_QUERIES:
+            raise tornado.web.HTTPError(
+                400, reason=f"place_type must be one of {', '.join(sorted(NOMINATIM_QUERIES))}")
+        return lang, place_type
+
+
+class CountryHandler(ExplorerHandler):
+    async def get(self, name: str):
+        lang, place_type = self.lang_and_place_type()
+
+        with get_metrics().timer('api.country'):
+            bundle = await self.service.explore(name, lang, place_type)
+        if bundle is None:
+            raise tornado.web.HTTPError(404, reason=f"Unknown country '{name}'")
+
+        # Tornado derives the ETag from the body and turns a matching
+        # If-None-Match into a 304
+        self.set_header('Cache-Control', f'public, max-age={MAX_AGE}')
+        self.write_json(bundle)
+
+
+class CompareHandler(ExplorerHandler):
+    async def get(self):
+        lang, place_type = self.lang_and_place_type()
+        countries = [c.strip() for c in self.get_argument('countries', '').split(',') if c.strip()]
+        if not countries:
+            raise tornado.web.HTTPError(400, reason="countries is required")
+        if len(countries) > MAX_COMPARE:
+            raise tornado.web.HTTPError(400, reason=f"At most {MAX_COMPARE} countries can be compared")
+
+        with get_metrics().timer('api.compare'):
+            result = await self.service.compare(countries, lang, place_type)
+
+        self.set_header('Cache-Control', f'public, max-age={MAX_AGE}')
+        self.write_json(result)
+
+
+class HealthHandler(JSONHandler):
+    def get(self):
+        self.write_json({'status': 'ok'})
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4')
+        self.finish(get_metrics().to_prometheus())
+
+
+def make_app(service: Optional[ExplorerService] = None) -> tornado.web.Application:
+    service = service or ExplorerService()
+    return tornado.web.Application([
+        (r'/country/([^/]+)', CountryHandler, {'service': service}),
+        (r'/compare', CompareHandler, {'service': service}),
+        (r'/healthz', HealthHandler),
+        (r'/metrics', MetricsHandler),
+    ])
+
+
+async def serve(host: str, port: int, workers: int):
+    app = make_app(ExplorerService(max_workers=workers))
+    app.listen(port, address=host)
+    print(f"Serving on http://{host}:{port}")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve explorer results as JSON')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=16, help='threads fetching bundles')
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.workers))
+
+
+if __name__ == '__main__':
+    main()
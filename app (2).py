@@ -2,16 +2,26 @@
 # The main application code should be saved as the main Python file
 
 import streamlit as st
-import requests
 import json
-import folium
-from streamlit_folium import folium_static
-import pandas as pd
-from geopy.geocoders import Nominatim
 import time
-from typing import Dict, List, Optional, Tuple
+import os
+import itertools
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 import re
 
+from batch import fetch_summaries, to_dataframe as batch_to_dataframe
+from explorer_api import MAX_COMPARE, Explorer, LocationFinder, WikimediaAPI, raise_error
+from image_cache import get_image_cache
+from name_resolver import get_name_resolver
+from metrics import render_dashboard, start_http_server as start_metrics_server, timed
+from multilingual import SummaryPipeline
+from orchestrator import FetchOrchestrator
+from response_cache import bypass_cache
+from static_data import LANGUAGE_CODES, PLACE_COLORS, PLACE_TYPE_LABELS
+from viewport import LoadedPlaces, Tile, tiles_for_view, view_from_map_state
+from warmer import CacheWarmer
+
 # Page configuration
 st.set_page_config(
     page_title="🌍 Country Wikipedia Explorer",
@@ -20,265 +30,406 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Language mappings for Wikipedia APIs
-LANGUAGE_CODES = {
-    "English": "en",
-    "Spanish": "es",
-    "French": "fr",
-    "German": "de",
-    "Italian": "it",
-    "Portuguese": "pt",
-    "Russian": "ru",
-    "Chinese": "zh",
-    "Japanese": "ja",
-    "Arabic": "ar",
-    "Hindi": "hi",
-    "Dutch": "nl",
-    "Swedish": "sv",
-    "Norwegian": "no",
-    "Danish": "da",
-    "Finnish": "fi",
-    "Korean": "ko",
-    "Thai": "th",
-    "Vietnamese": "vi",
-    "Turkish": "tr"
-}
-
-class WikimediaAPI:
-    """Handler for various Wikimedia API endpoints"""
-    
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'CountryExplorer/1.0 (https://huggingface.co/spaces/)'
-        })
+# Language mappings, place types and marker colours live in static_data.py;
+# folium, streamlit_folium and pandas are imported where they're first used
+
+# Clients are shared by every session so connection pools survive reruns;
+# results are memoized per (country, lang, place_type) for RESULT_TTL seconds
+RESULT_TTL = int(os.environ.get('EXPLORER_RESULT_TTL', 3600))
+
+# The memoized fetches below raise on failure, so st.cache_data never keeps
+# an error as an empty result; reported() shows the error instead
+@st.cache_resource
+def get_wiki_api() -> WikimediaAPI:
+    return WikimediaAPI(on_error=raise_error)
+
+@st.cache_resource
+def get_location_finder() -> LocationFinder:
+    return LocationFinder(on_error=raise_error)
+
+def reported(fetch: Callable[..., Any], *args, default: Any = None) -> Any:
+    """Run a memoized fetch, showing its error on the page and returning ``default``"""
+    try:
+        return fetch(*args)
+    except Exception as e:
+        st.error(str(e))
+        return default
+
+# Popular responses are refreshed in the background ahead of expiry, every
+# WARM_INTERVAL seconds; 0 disables the in-process warmer (e.g. when
+# warmer.py runs as its own process against the same cache)
+WARM_INTERVAL = int(os.environ.get('EXPLORER_WARM_INTERVAL', 300))
+
+@st.cache_resource
+def start_cache_warmer() -> Optional[CacheWarmer]:
+    """Start the background cache warmer once per process"""
+    if WARM_INTERVAL > 0:
+        return CacheWarmer().start(WARM_INTERVAL)
+    return None
+
+@st.cache_resource
+def refresh_versions() -> Tuple[Iterator[int], Dict[Tuple, int]]:
+    """Version numbers handed out so far, and the current one of each refreshed query"""
+    return itertools.count(1), {}
+
+def query_version(query: Tuple, refresh: bool = False) -> int:
+    """Version of a query's memoized results, moved to a new one by Refresh
+
+    The cached_* functions take it as their last argument, so a refreshed
+    query misses their cache while every other query keeps its results.
+    """
+    counter, versions = refresh_versions()
+    if refresh:
+        versions[query] = next(counter)
+    return versions.get(query, 0)
+
+# The version argument only keys the memoized result (see query_version)
+@st.cache_data(ttl=RESULT_TTL, show_spinner=False)
+def cached_wikidata_info(country: str, lang: str, version: int = 0) -> Dict:
+    return get_wiki_api().get_wikidata_info(country, lang)
+
+@st.cache_data(ttl=RESULT_TTL, show_spinner=False)
+def cached_wikivoyage_info(country: str, lang: str, version: int = 0) -> Dict:
+    return get_wiki_api().get_wikivoyage_info(country, lang)
+
+@st.cache_data(ttl=RESULT_TTL, show_spinner=False)
+def cached_country_coordinates(country: str, version: int = 0) -> Optional[Tuple[float, float]]:
+    return get_location_finder().get_country_coordinates(country)
+
+@st.cache_data(ttl=RESULT_TTL, show_spinner=False)
+def cached_places_of_interest(country: str, place_type: str, version: int = 0) -> List[Dict]:
+    return get_location_finder().find_places_of_interest(country, place_type)
+
+@st.cache_data(ttl=RESULT_TTL, show_spinner=False, max_entries=2048)
+def cached_tile_places(tile: Tile, place_type: str, version: int = 0) -> List[Dict]:
+    return get_location_finder().find_places_in_tile(tile, place_type)
+
+@st.cache_data(ttl=RESULT_TTL, show_spinner=False)
+def cached_full_extract(source: str, title: str, lang: str, version: int = 0) -> str:
+    """The whole introduction, fetched only once a user expands it"""
+    if source == 'wikivoyage':
+        return get_wiki_api().get_wikivoyage_info(title, lang, max_chars=None).get('extract', '')
+    return get_wiki_api().get_wikipedia_summary(title, lang, max_chars=None).get('extract', '')
+
+@st.cache_resource
+def get_summary_pipeline() -> SummaryPipeline:
+    api = WikimediaAPI(on_error=st.error)
+    # Prefetch threads have no script context, so their errors are logged
+    return SummaryPipeline(api.get_wikipedia_summary, api.get_langlinks,
+                           prefetch_summary=WikimediaAPI().get_wikipedia_summary, ttl=RESULT_TTL)
+
+@st.cache_resource
+def get_explorer() -> Explorer:
+    return Explorer(WikimediaAPI(on_error=st.error), LocationFinder(on_error=st.error),
+                    pipeline=get_summary_pipeline())
+
+# Languages prefetched in the background after each summary
+PREFETCH_LANGUAGES = int(os.environ.get('EXPLORER_PREFETCH_LANGUAGES', 4))
+
+def likely_languages(lang_code: str) -> List[str]:
+    """Languages this session is likely to switch to next, most likely first"""
+    recent = st.session_state.setdefault('recent_languages', [])
+    if lang_code in recent:
+        recent.remove(lang_code)
+    recent.insert(0, lang_code)
+    return list(dict.fromkeys(recent[1:] + list(LANGUAGE_CODES.values())))
+
+def fetch_summary_with_fallback(title: str, en_title: str, lang_code: str, fallbacks: List[str],
+                                known_titles: Optional[Dict[str, str]] = None,
+                                refresh: bool = False) -> Dict:
+    """Summary in lang_code (or the best fallback), prefetching likely next languages"""
+    pipeline = get_summary_pipeline()
+    # Titles from the local index save the langlinks round trip
+    links = dict(known_titles) if known_titles else pipeline.titles(en_title)
+    links.setdefault(lang_code, title)
+    if refresh:
+        pipeline.forget(links)
+    summary = pipeline.get(en_title, lang_code, fallbacks, links=links)
+    pipeline.prefetch(en_title, fallbacks[:PREFETCH_LANGUAGES], links=links)
+    return summary
+
+
+def render_wikipedia(wiki_data: Dict, country: str, selected_language: str, version: int = 0):
+    """Render the Wikipedia summary panel"""
+    if wiki_data:
+        served = wiki_data.get('lang')
+        if served and LANGUAGE_CODES.get(selected_language) != served:
+            served_name = next((name for name, code in LANGUAGE_CODES.items() if code == served), served)
+            st.info(f"No {selected_language} article found; showing {served_name} instead")
         
-    def get_wikipedia_summary(self, country: str, lang: str = "en") -> Dict:
-        """Get Wikipedia summary for a country"""
-        url = f"https://{lang}.wikipedia.org/w/api.php"
-        params = {
-            'action': 'query',
-            'format': 'json',
-            'titles': country,
-            'prop': 'extracts|pageimages|info',
-            'exintro': True,
-            'explaintext': True,
-            'exsectionformat': 'plain',
-            'piprop': 'original',
-            'inprop': 'url'
-        }
+        # Thumbnail sized for the column; the original file is only
+        # downloaded (and then cached on disk) when asked for
+        if wiki_data.get('image'):
+            image_slot = st.empty()
+            image_slot.image(wiki_data['image'], caption=wiki_data['title'], use_column_width=True)
+            if wiki_data.get('image_original') and st.toggle("Full-resolution image", key='full_image'):
+                try:
+                    image_slot.image(get_image_cache().get(wiki_data['image_original']), caption=wiki_data['title'],
+                                     use_column_width=True)
+                except Exception as e:
+                    # A failed download or an unreadable file keeps the thumbnail
+                    image_slot.image(wiki_data['image'], caption=wiki_data['title'], use_column_width=True)
+                    st.caption(f"Full-resolution image unavailable: {e}")
         
-        try:
-            response = self.session.get(url, params=params, timeout=10)
-            data = response.json()
-            
-            pages = data.get('query', {}).get('pages', {})
-            if pages:
-                page_id = list(pages.keys())[0]
-                if page_id != '-1':
-                    page = pages[page_id]
-                    return {
-                        'title': page.get('title', ''),
-                        'extract': page.get('extract', ''),
-                        'image': page.get('original', {}).get('source', ''),
-                        'url': page.get('fullurl', '')
-                    }
-        except Exception as e:
-            st.error(f"Error fetching Wikipedia data: {str(e)}")
+        st.subheader(wiki_data.get('title', country))
         
-        return {}
-    
-    def get_wikidata_info(self, country: str) -> Dict:
-        """Get structured data from Wikidata"""
-        url = "https://www.wikidata.org/w/api.php"
+        # Display extract, already cut short by the API
+        extract = wiki_data.get('extract', '')
+        if extract:
+            extract_slot = st.empty()
+            extract_slot.write(extract)
+            if wiki_data.get('truncated') and st.toggle("Show full introduction", key='full_intro'):
+                lang = wiki_data.get('lang', LANGUAGE_CODES.get(selected_language, 'en'))
+                extract_slot.write(reported(cached_full_extract, 'wikipedia', wiki_data['title'], lang, version)
+                                   or extract)
         
-        # First, search for the entity
-        search_params = {
-            'action': 'wbsearchentities',
-            'format': 'json',
-            'search': country,
-            'language': 'en',
-            'type': 'item',
-            'limit': 1
-        }
+        if wiki_data.get('url'):
+            st.markdown(f"[Read full article on Wikipedia]({wiki_data['url']})")
+    else:
+        st.warning(f"No Wikipedia article found for '{country}' in {selected_language}")
+
+def render_facts(wikidata_info: Dict):
+    """Render the Wikidata quick facts panel"""
+    if wikidata_info:
+        if 'capital' in wikidata_info:
+            st.metric("🏛️ Capital", wikidata_info['capital'])
         
-        try:
-            response = self.session.get(url, params=search_params, timeout=10)
-            search_data = response.json()
-            
-            if search_data.get('search'):
-                entity_id = search_data['search'][0]['id']
-                
-                # Get entity data
-                entity_params = {
-                    'action': 'wbgetentities',
-                    'format': 'json',
-                    'ids': entity_id,
-                    'languages': 'en'
-                }
-                
-                entity_response = self.session.get(url, params=entity_params, timeout=10)
-                entity_data = entity_response.json()
-                
-                if 'entities' in entity_data and entity_id in entity_data['entities']:
-                    entity = entity_data['entities'][entity_id]
-                    claims = entity.get('claims', {})
-                    
-                    # Extract useful information
-                    info = {}
-                    
-                    # Population (P1082)
-                    if 'P1082' in claims:
-                        pop_claim = claims['P1082'][0]
-                        if 'mainsnak' in pop_claim and 'datavalue' in pop_claim['mainsnak']:
-                            info['population'] = pop_claim['mainsnak']['datavalue']['value']['amount']
-                    
-                    # Capital (P36)
-                    if 'P36' in claims:
-                        capital_claim = claims['P36'][0]
-                        if 'mainsnak' in capital_claim and 'datavalue' in capital_claim['mainsnak']:
-                            capital_id = capital_claim['mainsnak']['datavalue']['value']['id']
-                            # Get capital name
-                            capital_params = {
-                                'action': 'wbgetentities',
-                                'format': 'json',
-                                'ids': capital_id,
-                                'languages': 'en'
-                            }
-                            capital_response = self.session.get(url, params=capital_params, timeout=10)
-                            capital_data = capital_response.json()
-                            if 'entities' in capital_data and capital_id in capital_data['entities']:
-                                capital_entity = capital_data['entities'][capital_id]
-                                if 'labels' in capital_entity and 'en' in capital_entity['labels']:
-                                    info['capital'] = capital_entity['labels']['en']['value']
-                    
-                    return info
-                    
-        except Exception as e:
-            st.error(f"Error fetching Wikidata: {str(e)}")
+        if 'population' in wikidata_info:
+            pop = str(wikidata_info['population']).replace('+', '')
+            try:
+                pop_num = int(float(pop))
+                st.metric("👥 Population", f"{pop_num:,}")
+            except:
+                st.metric("👥 Population", pop)
         
-        return {}
-    
-    def get_wikivoyage_info(self, country: str, lang: str = "en") -> Dict:
-        """Get travel information from Wikivoyage"""
-        url = f"https://{lang}.wikivoyage.org/w/api.php"
-        params = {
-            'action': 'query',
-            'format': 'json',
-            'titles': country,
-            'prop': 'extracts|info',
-            'exintro': True,
-            'explaintext': True,
-            'inprop': 'url'
-        }
+        if 'area_km2' in wikidata_info:
+            st.metric("📐 Area", f"{wikidata_info['area_km2']:,.0f} km²")
         
-        try:
-            response = self.session.get(url, params=params, timeout=10)
-            data = response.json()
-            
-            pages = data.get('query', {}).get('pages', {})
-            if pages:
-                page_id = list(pages.keys())[0]
-                if page_id != '-1':
-                    page = pages[page_id]
-                    return {
-                        'title': page.get('title', ''),
-                        'extract': page.get('extract', ''),
-                        'url': page.get('fullurl', '')
-                    }
-        except Exception as e:
-            st.error(f"Error fetching Wikivoyage data: {str(e)}")
+        if 'gdp' in wikidata_info:
+            unit = wikidata_info.get('gdp_unit', '')
+            gdp = f"{wikidata_info['gdp'] / 1e9:,.1f} billion"
+            st.metric("💹 GDP", f"{gdp} {'USD' if unit == 'United States dollar' else unit}".strip())
         
-        return {}
-
-class LocationFinder:
-    """Find places of interest using Nominatim"""
-    
-    def __init__(self):
-        self.geolocator = Nominatim(user_agent="country_explorer")
-    
-    def get_country_coordinates(self, country: str) -> Optional[Tuple[float, float]]:
-        """Get country center coordinates"""
-        try:
-            location = self.geolocator.geocode(country, timeout=10)
-            if location:
-                return (location.latitude, location.longitude)
-        except Exception as e:
-            st.error(f"Error getting coordinates: {str(e)}")
-        return None
-    
-    def find_places_of_interest(self, country: str, place_type: str) -> List[Dict]:
-        """Find specific types of places in a country"""
-        places = []
+        if 'currency' in wikidata_info:
+            st.metric("💰 Currency", wikidata_info['currency'])
         
-        # Query mappings for different place types
-        query_map = {
-            'restaurants': f'restaurant in {country}',
-            'temples': f'temple in {country}',
-            'tourist_attractions': f'tourist attraction in {country}',
-            'transportation': f'airport OR "train station" in {country}',
-            'hotels': f'hotel in {country}'
-        }
+        if 'head_of_state' in wikidata_info:
+            st.metric("👤 Head of State", wikidata_info['head_of_state'])
         
-        query = query_map.get(place_type, f'{place_type} in {country}')
+        # Multi-valued facts as short lists
+        for key, label in (('official_languages', "🗣️ Official languages"),
+                           ('time_zones', "🕒 Time zones"),
+                           ('neighbours', "🧭 Neighbouring countries")):
+            if wikidata_info.get(key):
+                st.markdown(f"**{label}:** {', '.join(wikidata_info[key])}")
         
-        try:
-            # Use Nominatim search
-            results = self.geolocator.geocode(query, exactly_one=False, limit=10, timeout=15)
-            
-            if results:
-                for result in results[:5]:  # Limit to 5 results
-                    places.append({
-                        'name': result.address.split(',')[0],
-                        'address': result.address,
-                        'lat': result.latitude,
-                        'lon': result.longitude
-                    })
-        except Exception as e:
-            st.error(f"Error finding places: {str(e)}")
+        if 'calling_code' in wikidata_info:
+            st.markdown(f"**☎️ Calling code:** {wikidata_info['calling_code']}")
+
+def render_travel(wikivoyage_data: Dict, lang_code: str, version: int = 0):
+    """Render the Wikivoyage travel panel"""
+    if wikivoyage_data and wikivoyage_data.get('extract'):
+        travel_slot = st.empty()
+        travel_slot.write(wikivoyage_data['extract'])
+        if wikivoyage_data.get('truncated') and st.toggle("Show more", key='full_travel'):
+            travel_slot.write(reported(cached_full_extract, 'wikivoyage', wikivoyage_data['title'], lang_code,
+                                       version)
+                              or wikivoyage_data['extract'])
         
-        return places
+        if wikivoyage_data.get('url'):
+            st.markdown(f"[More travel info]({wikivoyage_data['url']})")
 
-def create_map(center_coords: Tuple[float, float], places: List[Dict], place_type: str):
-    """Create a folium map with markers"""
-    m = folium.Map(location=center_coords, zoom_start=6)
+@timed('map.create')
+def country_map(coords: Tuple[float, float], country: str):
+    """Base map for a country; it only changes with the country, so it is never reloaded"""
+    import folium
     
-    # Add center marker
+    m = folium.Map(location=coords, zoom_start=6, prefer_canvas=True)
     folium.Marker(
-        center_coords,
-        popup="Country Center",
+        coords,
+        popup=f"{country}",
         icon=folium.Icon(color='red', icon='star')
     ).add_to(m)
-    
-    # Color mapping for different place types
-    color_map = {
-        'restaurants': 'orange',
-        'temples': 'purple',
-        'tourist_attractions': 'green',
-        'transportation': 'blue',
-        'hotels': 'pink'
+    return m
+
+# (country, place type) pairs whose loaded places a session keeps
+LOADED_VIEWS = 4
+
+def loaded_places(country: str, place_type: str, places: List[Dict], refresh: bool = False) -> LoadedPlaces:
+    """Places this session has loaded so far for a country and place type"""
+    loaded = st.session_state.setdefault('loaded_places', {})
+    key = (country, place_type)
+    if refresh:
+        loaded.pop(key, None)
+    # Most recently used last; the oldest are dropped past LOADED_VIEWS
+    loaded[key] = loaded.pop(key, None) or LoadedPlaces(places, place_type)
+    for old in list(loaded)[:-LOADED_VIEWS]:
+        del loaded[old]
+    return loaded[key]
+
+def load_visible_places(loaded: LoadedPlaces, place_type: str, map_key: str, version: int = 0):
+    """Fetch the tiles of the current map view that haven't been loaded yet"""
+    view = view_from_map_state(st.session_state.get(map_key))
+    if view is None:
+        return
+    tasks = {
+        tile: (lambda tile=tile: reported(cached_tile_places, tile, place_type, version))
+        for tile in loaded.missing(tiles_for_view(*view))
     }
+    for tile, places in FetchOrchestrator().run(tasks):
+        if places is not None:  # failed tiles are retried on the next rerun
+            loaded.merge(places, tile)
+
+def render_places(coords: Optional[Tuple[float, float]], places: List[Dict], country: str,
+                  place_type: str, selected_place_type: str, version: int = 0, refresh: bool = False):
+    """Render the map and places table, loading places for whatever the map shows"""
+    if coords:
+        from map_render import places_layer
+        from streamlit_folium import st_folium
+        
+        # Panning or zooming reruns the script with the map's new bounds
+        # under this key
+        map_key = f"places_map_{country}"
+        loaded = loaded_places(country, place_type, places, refresh)
+        load_visible_places(loaded, place_type, map_key, version)
+        places = loaded.all().sort_by_distance(coords)
+        
+        # New markers are swapped into the layer without reloading the map
+        st_folium(
+            country_map(coords, country),
+            key=map_key,
+            feature_group_to_add=places_layer(places, PLACE_COLORS.get(place_type, 'gray')),
+            returned_objects=['bounds', 'zoom'],
+            width=1200,
+            height=500
+        )
+        
+        if places:
+            # Display places in a table
+            st.subheader(f"📍 Found {len(places)} {selected_place_type}")
+            
+            # Nearest to the country centre first
+            st.dataframe(
+                places.to_pandas(['name', 'address']),
+                use_container_width=True,
+                hide_index=True
+            )
+        else:
+            st.warning(f"No {selected_place_type.lower()} found for {country}")
+    else:
+        st.error(f"Could not find location data for {country}")
+
+# Rows of the comparison facts table
+COMPARE_FACTS = [
+    ('capital', "🏛️ Capital"),
+    ('population', "👥 Population"),
+    ('area_km2', "📐 Area"),
+    ('gdp', "💹 GDP"),
+    ('currency', "💰 Currency"),
+    ('head_of_state', "👤 Head of State"),
+    ('official_languages', "🗣️ Official languages"),
+    ('time_zones', "🕒 Time zones"),
+    ('calling_code', "☎️ Calling code"),
+]
+
+def fact_text(facts: Dict, key: str) -> str:
+    """One fact as the text of a comparison table cell"""
+    value = facts.get(key)
+    if not value:
+        return "–"
+    if key == 'population':
+        try:
+            return f"{int(float(str(value).replace('+', ''))):,}"
+        except ValueError:
+            return str(value)
+    if key == 'area_km2':
+        return f"{value:,.0f} km²"
+    if key == 'gdp':
+        unit = facts.get('gdp_unit', '')
+        return f"{value / 1e9:,.1f} billion {'USD' if unit == 'United States dollar' else unit}".strip()
+    if isinstance(value, list):
+        return ', '.join(value)
+    return str(value)
+
+def render_comparison(countries: List[str], lang_code: str, selected_language: str,
+                      place_type: str, selected_place_type: str, refresh: bool = False):
+    """Several countries side by side: a facts table, their extracts in columns and one map"""
+    st.header(f"⚖️ Comparison ({selected_language})")
     
-    color = color_map.get(place_type, 'gray')
+    # Not memoized here: every part of a comparison is kept in the response
+    # cache, which bypass_cache() skips for all of them
+    with st.spinner(f"Fetching {len(countries)} countries..."):
+        with bypass_cache() if refresh else nullcontext():
+            result = get_explorer().compare(countries, lang_code, place_type)
     
-    # Add place markers
-    for place in places:
-        folium.Marker(
-            [place['lat'], place['lon']],
-            popup=f"<b>{place['name']}</b><br>{place['address']}",
-            icon=folium.Icon(color=color)
-        ).add_to(m)
+    if result['unknown']:
+        st.warning(f"Could not find: {', '.join(result['unknown'])}")
+    bundles = result['countries']
+    if not bundles:
+        return
     
-    return m
+    import pandas as pd
+    
+    st.subheader("📊 Quick Facts")
+    st.dataframe(
+        pd.DataFrame(
+            {b['country']: [fact_text(b['facts'], key) for key, _ in COMPARE_FACTS] for b in bundles},
+            index=[label for _, label in COMPARE_FACTS]
+        ),
+        use_container_width=True
+    )
+    
+    # One column per country, so the introductions line up
+    st.subheader("📖 Wikipedia")
+    for column, bundle in zip(st.columns(len(bundles)), bundles):
+        with column:
+            wiki = bundle['wiki']
+            st.markdown(f"**{bundle['country']}**")
+            if wiki:
+                if wiki.get('image'):
+                    st.image(wiki['image'], use_column_width=True)
+                st.write(wiki['extract'])
+                st.markdown(f"[Read more]({wiki['url']})")
+            else:
+                st.caption(f"No {selected_language} article found")
+    
+    # Every country on one map, each on its own layer
+    from map_render import comparison_map
+    from streamlit_folium import st_folium
+    
+    st.subheader(f"🗺️ {selected_place_type}")
+    st_folium(comparison_map(bundles), key='compare_map', returned_objects=[], width=1200, height=500)
 
+def render_batch(countries: List[str], langs: List[str]):
+    """Fetch many summaries at once and stream them into a table"""
+    st.header("📚 Batch Summaries")
+    table = st.empty()
+    rows = []
+    
+    with st.spinner(f"Fetching {len(countries)} countries in {len(langs)} languages..."):
+        for row in fetch_summaries(countries, langs):
+            rows.append(row)
+            table.dataframe(batch_to_dataframe(rows), use_container_width=True, hide_index=True)
+    
+    if rows:
+        df = batch_to_dataframe(rows)
+        st.download_button("⬇️ Download CSV", df.to_csv(index=False), "summaries.csv", "text/csv")
+        try:
+            st.download_button("⬇️ Download Parquet", df.to_parquet(index=False), "summaries.parquet",
+                               "application/octet-stream")
+        except ImportError:
+            pass
+
+@timed('page.run')
 def main():
+    # Hidden admin page: ?admin=metrics
+    if st.experimental_get_query_params().get('admin') == ['metrics']:
+        render_dashboard()
+        return
+
     st.title("🌍 Country Wikipedia Explorer")
     st.markdown("Explore countries through Wikipedia and discover places of interest!")
     
-    # Initialize APIs
-    wiki_api = WikimediaAPI()
-    location_finder = LocationFinder()
-    
     # Sidebar configuration
     st.sidebar.header("🔧 Configuration")
     
@@ -298,123 +449,125 @@ def main():
     )
     
     # Place type selection
-    place_types = {
-        "🍽️ Restaurants": "restaurants",
-        "🏛️ Temples": "temples",
-        "🎭 Tourist Attractions": "tourist_attractions",
-        "🚇 Transportation": "transportation",
-        "🏨 Hotels": "hotels"
-    }
-    
     selected_place_type = st.sidebar.selectbox(
         "Places of Interest",
-        options=list(place_types.keys())
+        options=list(PLACE_TYPE_LABELS.keys())
     )
-    place_type = place_types[selected_place_type]
+    place_type = PLACE_TYPE_LABELS[selected_place_type]
+    
+    # Resolve the typed name against the local index so that every API call
+    # below is made with a known-good title
+    resolver = get_name_resolver()
+    match = resolver.resolve(country, lang_code)
+    if match is None and resolver.available:
+        suggestions = resolver.suggest(country, lang_code)
+        if suggestions:
+            picked = st.sidebar.selectbox("Did you mean...", options=suggestions)
+            match = resolver.resolve(picked, lang_code)
+    elif match and match['distance']:
+        st.sidebar.caption(f"Showing results for **{match['name']}**")
     
+    # Remember the explored country so later reruns (changing the language
+    # or place type) keep the page and only re-fetch what changed
     if st.sidebar.button("🔍 Explore Country", type="primary"):
-        if country:
+        st.session_state['explored_country'] = country
+        st.session_state.pop('compared_countries', None)
+    refresh = st.sidebar.button("🔄 Refresh", help="Fetch fresh data instead of using cached results")
+    
+    # Batch mode for many countries at once
+    with st.sidebar.expander("📚 Batch Explore"):
+        batch_countries = st.text_area("Countries (one per line)", value="France\nGermany\nSpain")
+        batch_langs = st.multiselect(
+            "Languages",
+            options=list(LANGUAGE_CODES.keys()),
+            default=[selected_language]
+        )
+        run_batch = st.button("Fetch Summaries")
+    
+    # Side-by-side comparison in the selected language and place type
+    with st.sidebar.expander("⚖️ Compare Countries"):
+        compare_countries = st.text_area(f"Up to {MAX_COMPARE} countries (one per line)",
+                                         value="France\nGermany\nSpain", key='compare_input')
+        if st.button("Compare"):
+            st.session_state['compared_countries'] = [c.strip() for c in compare_countries.splitlines() if c.strip()]
+            st.session_state.pop('explored_country', None)
+    
+    if run_batch:
+        render_batch(batch_countries.splitlines(), [LANGUAGE_CODES[l] for l in batch_langs])
+    
+    elif st.session_state.get('compared_countries'):
+        render_comparison(st.session_state['compared_countries'], lang_code, selected_language,
+                          place_type, selected_place_type, refresh)
+    
+    elif st.session_state.get('explored_country') == country:
+        if country and match is None and resolver.available:
+            st.warning(f"Could not find a country called '{country}'")
+        elif country:
+            if match:
+                country = match['name']
+            title = resolver.title_for(match, lang_code, country)
+            en_title = resolver.title_for(match, 'en', country)
+            
             # Create columns for layout
             col1, col2 = st.columns([2, 1])
             
+            # Lay out every panel first so each one can be filled in as soon
+            # as its own data arrives
             with col1:
                 st.header(f"📖 {country} - Wikipedia ({selected_language})")
-                
-                # Get Wikipedia summary
-                with st.spinner("Fetching Wikipedia information..."):
-                    wiki_data = wiki_api.get_wikipedia_summary(country, lang_code)
-                
-                if wiki_data:
-                    if wiki_data.get('image'):
-                        st.image(wiki_data['image'], caption=wiki_data['title'], use_column_width=True)
-                    
-                    st.subheader(wiki_data.get('title', country))
-                    
-                    # Display extract
-                    extract = wiki_data.get('extract', '')
-                    if extract:
-                        # Truncate if too long
-                        if len(extract) > 1500:
-                            extract = extract[:1500] + "..."
-                        st.write(extract)
-                    
-                    if wiki_data.get('url'):
-                        st.markdown(f"[Read full article on Wikipedia]({wiki_data['url']})")
-                else:
-                    st.warning(f"No Wikipedia article found for '{country}' in {selected_language}")
+                wiki_panel = st.empty()
+                wiki_panel.info("Fetching Wikipedia information...")
             
             with col2:
                 st.header("📊 Quick Facts")
-                
-                # Get Wikidata information
-                with st.spinner("Fetching country data..."):
-                    wikidata_info = wiki_api.get_wikidata_info(country)
-                
-                if wikidata_info:
-                    if 'capital' in wikidata_info:
-                        st.metric("🏛️ Capital", wikidata_info['capital'])
-                    
-                    if 'population' in wikidata_info:
-                        pop = wikidata_info['population'].replace('+', '')
-                        try:
-                            pop_num = int(float(pop))
-                            st.metric("👥 Population", f"{pop_num:,}")
-                        except:
-                            st.metric("👥 Population", pop)
+                facts_panel = st.empty()
+                facts_panel.info("Fetching country data...")
                 
                 # Wikivoyage travel info
                 st.subheader("✈️ Travel Information")
-                with st.spinner("Fetching travel information..."):
-                    wikivoyage_data = wiki_api.get_wikivoyage_info(country, lang_code)
-                
-                if wikivoyage_data and wikivoyage_data.get('extract'):
-                    travel_info = wikivoyage_data['extract']
-                    if len(travel_info) > 500:
-                        travel_info = travel_info[:500] + "..."
-                    st.write(travel_info)
-                    
-                    if wikivoyage_data.get('url'):
-                        st.markdown(f"[More travel info]({wikivoyage_data['url']})")
+                travel_panel = st.empty()
+                travel_panel.info("Fetching travel information...")
             
             # Map section
             st.header(f"🗺️ {selected_place_type} in {country}")
+            map_panel = st.empty()
+            map_panel.info("Getting location data...")
             
-            # Get country coordinates
-            with st.spinner("Getting location data..."):
-                coords = location_finder.get_country_coordinates(country)
+            # Fallback order for missing articles doubles as the prefetch order
+            fallbacks = likely_languages(lang_code)
             
-            if coords:
-                # Find places of interest
-                with st.spinner(f"Finding {selected_place_type.lower()}..."):
-                    places = location_finder.find_places_of_interest(country, place_type)
-                
-                if places:
-                    # Create and display map
-                    map_obj = create_map(coords, places, place_type)
-                    folium_static(map_obj, width=1200, height=500)
-                    
-                    # Display places in a table
-                    st.subheader(f"📍 Found {len(places)} {selected_place_type}")
-                    
-                    places_df = pd.DataFrame(places)
-                    st.dataframe(
-                        places_df[['name', 'address']],
-                        use_container_width=True,
-                        hide_index=True
-                    )
-                else:
-                    st.warning(f"No {selected_place_type.lower()} found for {country}")
+            # Refresh re-fetches this query only; other countries, languages
+            # and place types, and other sessions' results, stay cached
+            version = query_version((en_title, lang_code, place_type), refresh)
+            
+            # The five lookups are independent, so run them concurrently
+            tasks = {
+                'wiki': lambda: fetch_summary_with_fallback(
+                    title, en_title, lang_code, fallbacks, match['titles'] if match else None, refresh),
+                'facts': lambda: reported(cached_wikidata_info, en_title, lang_code, version, default={}),
+                'travel': lambda: reported(cached_wikivoyage_info, title, lang_code, version, default={}),
+                'coords': lambda: reported(cached_country_coordinates, en_title, version),
+                'places': lambda: reported(cached_places_of_interest, en_title, place_type, version, default=[]),
+            }
+            
+            bundle = {}
+            with bypass_cache() if refresh else nullcontext():
+                for name, result in FetchOrchestrator().run(tasks):
+                    bundle[name] = result
                     
-                    # Still show country map
-                    simple_map = folium.Map(location=coords, zoom_start=6)
-                    folium.Marker(
-                        coords,
-                        popup=f"{country}",
-                        icon=folium.Icon(color='red', icon='star')
-                    ).add_to(simple_map)
-                    folium_static(simple_map, width=1200, height=500)
-            else:
-                st.error(f"Could not find location data for {country}")
+                    if name == 'wiki':
+                        with wiki_panel.container():
+                            render_wikipedia(result, country, selected_language, version)
+                    elif name == 'facts':
+                        with facts_panel.container():
+                            render_facts(result)
+                    elif name == 'travel':
+                        with travel_panel.container():
+                            render_travel(result, lang_code, version)
+                    elif 'coords' in bundle and 'places' in bundle:
+                        with map_panel.container():
+                            render_places(bundle['coords'], bundle['places'], country, place_type,
+                                          selected_place_type, version, refresh)
         else:
             st.warning("Please enter a country name")
     
@@ -429,6 +582,11 @@ def main():
     
     **Supported Languages:** English, Spanish, French, German, Italian, Portuguese, Russian, Chinese, Japanese, Arabic, Hindi, and more!
     """)
+    
+    # Background services start once the page is on screen, so they never
+    # hold up the first paint
+    start_cache_warmer()
+    start_metrics_server()
 
 if __name__ == "__main__":
     main()
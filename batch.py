@@ -0,0 +1,182 @@
+"""Bulk summaries for many countries × languages using multi-title queries
+
+Usage::
+
+    python batch.py --countries France Germany Japan --langs en fr de --output summaries.csv
+"""
+
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from name_resolver import get_name_resolver
+from response_cache import get_cache
+
+# TextExtracts returns at most 20 intro extracts per request, which is the
+# binding limit (titles= itself accepts 50)
+MAX_TITLES = 20
+
+COLUMNS = ['country', 'lang', 'title', 'extract', 'image', 'url']
+
+
+def make_get_json() -> Callable[[str, Dict, str], Dict]:
+    """Return a cached JSON GET helper for Wikipedia hosts"""
+    from http_client import get_wikimedia_client
+
+    client = get_wikimedia_client()
+    cache = get_cache()
+
+    def get_json(url: str, params: Dict, lang: str) -> Dict:
+        return cache.get_or_fetch(
+            'wikipedia', url, params, lang,
+            lambda: client.get_json(url, params)
+        )
+    return get_json
+
+
+def fetch_chunk(titles: Dict[str, str], lang: str, get_json: Callable,
+                thumb_width: Optional[int] = None, max_chars: Optional[int] = None) -> List[Dict]:
+    """Fetch up to MAX_TITLES summaries from one wiki in a single query
+
+    ``titles`` maps the article title to request onto the country name the
+    caller asked for. Returns one row per country, with empty fields for
+    articles that don't exist. With ``thumb_width``, ``image`` is a
+    thumbnail and ``image_original`` the full file; ``max_chars`` cuts the
+    extracts.
+    """
+    url = f"https://{lang}.wikipedia.org/w/api.php"
+    params = {
+        'action': 'query',
+        'format': 'json',
+        'formatversion': 2,
+        'titles': '|'.join(titles),
+        'prop': 'extracts|pageimages|info',
+        'exintro': True,
+        'explaintext': True,
+        'exlimit': 'max',
+        'piprop': 'original',
+        'inprop': 'url',
+        'redirects': True,
+    }
+    if thumb_width:
+        params.update(piprop='thumbnail|original', pithumbsize=thumb_width)
+    if max_chars:
+        params['exchars'] = max_chars
+    pages: Dict[str, Dict] = {}
+    steps: List[Dict] = []
+    while True:
+        data = get_json(url, params, lang)
+        query = data.get('query', {})
+        for page in query.get('pages', []):
+            pages.setdefault(page.get('title', ''), {}).update(page)
+        steps.extend(query.get('normalized', []) + query.get('redirects', []))
+        if 'continue' not in data:
+            break
+        params = dict(params, **data['continue'])
+
+    # Follow normalisation and redirects back to the requested title
+    final = {title: title for title in titles}
+    for step in steps:
+        for requested, current in final.items():
+            if current == step['from']:
+                final[requested] = step['to']
+
+    rows = []
+    for requested, country in titles.items():
+        page = pages.get(final[requested], {})
+        missing = not page or page.get('missing') or page.get('invalid')
+        original = '' if missing else page.get('original', {}).get('source', '')
+        row = {
+            'country': country,
+            'lang': lang,
+            'title': '' if missing else page.get('title', ''),
+            'extract': '' if missing else page.get('extract', ''),
+            'image': original,
+            'url': '' if missing else page.get('fullurl', ''),
+        }
+        if thumb_width:
+            row['image'] = '' if missing else page.get('thumbnail', {}).get('source', original)
+            row['image_original'] = original
+        rows.append(row)
+    return rows
+
+
+def fetch_summaries(countries: Iterable[str], langs: Iterable[str],
+                    get_json: Optional[Callable] = None, max_workers: int = 8) -> Iterator[Dict]:
+    """Yield summary rows for every country × language as they arrive
+
+    Titles are resolved per language through the local name index when it
+    is available and grouped into multi-title requests per wiki host; the
+    requests for all hosts run concurrently.
+    """
+    get_json = get_json or make_get_json()
+    resolver = get_name_resolver()
+    countries = list(dict.fromkeys(c.strip() for c in countries if c.strip()))
+    langs = list(dict.fromkeys(langs))
+    if not countries or not langs:
+        return
+
+    jobs = []
+    for lang in langs:
+        # Names that resolve to the same article share one title in the
+        # request, and each of them gets its own row back
+        titles: Dict[str, List[str]] = {}
+        for country in countries:
+            title = resolver.title_for(resolver.resolve(country, lang), lang, country)
+            titles.setdefault(title, []).append(country)
+        items = list(titles.items())
+        for start in range(0, len(items), MAX_TITLES):
+            jobs.append((dict(items[start:start + MAX_TITLES]), lang))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(fetch_chunk, {title: names[0] for title, names in chunk.items()}, lang, get_json):
+                {names[0]: names for names in chunk.values()}
+            for chunk, lang in jobs
+        }
+        for future in as_completed(futures):
+            for row in future.result():
+                for country in futures[future][row['country']]:
+                    yield dict(row, country=country)
+
+
+def to_dataframe(rows: Iterable[Dict]):
+    import pandas as pd
+
+    return pd.DataFrame(list(rows), columns=COLUMNS)
+
+
+def export(df, path: str):
+    """Write a result DataFrame as CSV or Parquet depending on the extension"""
+    if path.endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Fetch Wikipedia summaries for many countries at once')
+    parser.add_argument('--countries', nargs='*', default=[], help='country names')
+    parser.add_argument('--countries-file', help='file with one country name per line')
+    parser.add_argument('--langs', nargs='+', default=['en'], help='wiki language codes')
+    parser.add_argument('--output', default='summaries.csv', help='.csv or .parquet output path')
+    args = parser.parse_args(argv)
+
+    countries = list(args.countries)
+    if args.countries_file:
+        with open(args.countries_file, encoding='utf-8') as f:
+            countries.extend(line.strip() for line in f)
+
+    rows = []
+    for row in fetch_summaries(countries, args.langs):
+        rows.append(row)
+        status = 'ok' if row['title'] else 'missing'
+        print(f"[{row['lang']}] {row['country']}: {status}", file=sys.stderr)
+    df = to_dataframe(rows)
+    export(df, args.output)
+    print(f"Wrote {len(df)} rows to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+"""Offline benchmarks against recorded Wikimedia and Nominatim traffic
+
+- ``bench/corpus.py``: the fixed countries × languages × place types.
+- ``bench/replay_server.py``: a local stand-in for the upstream APIs. It can
+  record real responses, replay them with injected latency and errors, or
+  synthesize plausible ones when no recording exists.
+- ``bench/run.py``: end-to-end runs of the Explore fetch path, plus
+  microbenchmarks. Reports throughput and latency percentiles.
+- ``bench/startup.py``: import and initialisation times of a cold start.
+"""
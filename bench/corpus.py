@@ -0,0 +1,20 @@
+"""The fixed benchmark corpus"""
+
+COUNTRIES = [
+    'France', 'Germany', 'Japan', 'India', 'Brazil', 'Egypt', 'Canada', 'Australia',
+    'Mexico', 'Thailand', 'Italy', 'Kenya', 'Peru', 'Norway', 'Vietnam', 'Turkey',
+]
+
+LANGUAGES = ['en', 'fr', 'de', 'es', 'ja', 'hi']
+
+# The place_types mapping of the app
+PLACE_TYPES = ['restaurants', 'temples', 'tourist_attractions', 'transportation', 'hotels']
+
+
+def combinations(countries=COUNTRIES, languages=LANGUAGES, place_types=PLACE_TYPES):
+    """Every (country, lang, place_type) triple, cycling place types to keep the corpus small"""
+    triples = []
+    for i, country in enumerate(countries):
+        for j, lang in enumerate(languages):
+            triples.append((country, lang, place_types[(i + j) % len(place_types)]))
+    return triples
@@ -0,0 +1,329 @@
+"""Local stand-in for the Wikimedia and Nominatim APIs
+
+Requests use the path scheme of ``EXPLORER_WIKIMEDIA_BASE`` and
+``EXPLORER_NOMINATIM_BASE``: ``https://en.wikipedia.org/w/api.php?...`` is
+requested as ``http://127.0.0.1:8765/en.wikipedia.org/w/api.php?...``.
+
+Modes:
+
+- replay (default): answer from a recording, a JSON-lines file (optionally
+  gzipped) with one ``{host, path, params, status, body}`` object per line;
+- ``--record``: forward misses to the real host and append them to the
+  recording;
+- ``--synthetic``: make up a well-formed response for anything not
+  recorded, so benchmarks also run without a recording.
+
+Each response can be delayed (``--latency-ms`` plus uniform
+``--jitter-ms``) and a fraction of them replaced by an error
+(``--error-rate``, status ``--error-status`` with ``Retry-After: 0``).
+
+Usage::
+
+    python -m bench.replay_server --record --recording bench/recordings.jsonl.gz
+    python -m bench.replay_server --synthetic --latency-ms 80 --error-rate 0.02
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+# Added by the client on every api.php call, irrelevant to the response
+IGNORED_PARAMS = {'maxlag'}
+
+
+def request_key(host: str, path: str, params: Dict) -> str:
+    params = {k: v for k, v in params.items() if k not in IGNORED_PARAMS}
+    return json.dumps([host, path, sorted(params.items())], ensure_ascii=False)
+
+
+def _open(path: str, mode: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _number(text: str, low: int, high: int) -> int:
+    """A stable pseudo-random number for ``text``"""
+    digest = int(hashlib.sha1(text.encode('utf-8')).hexdigest()[:8], 16)
+    return low + digest % (high - low)
+
+
+def _qid(text: str) -> str:
+    return f"Q{_number(text, 1000, 10 ** 7)}"
+
+
+PARAGRAPH = ('{title} is a country with a long history, a diverse landscape and a rich '
+             'cultural heritage. ') * 30
+
+
+def _sparql_results(query: str) -> Dict:
+    """Facts rows shaped like facts.QUERY's results for the countries in ``query``"""
+    from bench.corpus import COUNTRIES
+    from facts import ENTITY_PREFIX, FACTS
+
+    names = re.search(r'VALUES \?name \{([^}]*)\}', query)
+    titles = re.findall(r'"((?:[^"\\]|\\.)*)"@en', names.group(1)) if names else []
+    entities = re.search(r'VALUES \?country \{([^}]*)\}', query)
+    qids = re.findall(r'wd:(Q\d+)', entities.group(1)) if entities else []
+    if titles:
+        countries = [(_qid(title), title) for title in titles]
+    elif qids:
+        countries = [(qid, None) for qid in qids]
+    else:
+        countries = [(_qid(title), title) for title in COUNTRIES]
+
+    rows = []
+    for qid, title in countries:
+        for name, fact in FACTS.items():
+            for i in range(2 if fact.multi else 1):
+                row = {'country': {'type': 'uri', 'value': ENTITY_PREFIX + qid},
+                       'prop': {'type': 'uri', 'value': ENTITY_PREFIX + fact.pid}}
+                if title:
+                    row['title'] = {'type': 'literal', 'value': title}
+                if fact.kind == 'quantity':
+                    amount = _number(qid + name, 10 ** 4, 10 ** 9)
+                    row['value'] = {'type': 'literal', 'value': str(amount)}
+                    row['normalized'] = {'type': 'literal', 'value': str(amount * 10 ** 6)}
+                    row['unitLabel'] = {'type': 'literal', 'value': 'United States dollar' if name == 'gdp' else '1'}
+                elif fact.kind == 'item':
+                    value = _qid(f"{qid}{name}{i}")
+                    row['value'] = {'type': 'uri', 'value': ENTITY_PREFIX + value}
+                    row['valueLabel'] = {'type': 'literal', 'value': f"{name.replace('_', ' ').title()} {value}"}
+                else:
+                    row['value'] = {'type': 'literal', 'value': f"+{_number(qid, 1, 999)}"}
+                rows.append(row)
+    return {'head': {'vars': ['country', 'title', 'prop', 'value', 'valueLabel', 'unitLabel', 'normalized']},
+            'results': {'bindings': rows}}
+
+
+def synthesize(host: str, path: str, params: Dict) -> Tuple[int, object]:
+    """A plausible response for the requests the explorer makes"""
+    if path == '/sparql':
+        return 200, _sparql_results(params.get('query', ''))
+    if host.startswith('nominatim.'):
+        query = params.get('q', '')
+        limit = int(params.get('limit', 1))
+        if params.get('bounded') and params.get('viewbox'):
+            # Bounded search: spread the results over the box (lon1,lat1,lon2,lat2)
+            lon1, lat1, lon2, lat2 = (float(v) for v in params['viewbox'].split(','))
+            seed = f"{query}{params['viewbox']}"
+            points = [(min(lat1, lat2) + abs(lat2 - lat1) * _number(f"{seed}{i}", 0, 999) / 1000,
+                       min(lon1, lon2) + abs(lon2 - lon1) * _number(f"{i}{seed}", 0, 999) / 1000)
+                      for i in range(limit)]
+        else:
+            lat, lon = _number(query, -60, 60), _number(query[::-1], -170, 170)
+            points = [(lat + i * 0.01, lon + i * 0.01) for i in range(limit)]
+        return 200, [
+            {
+                'place_id': _number(f"{query}{lat}{lon}", 1, 10 ** 9),
+                'lat': str(lat), 'lon': str(lon),
+                'display_name': f"{query.split(' in ')[0].title()} {i + 1}, Main Street, {query}",
+            }
+            for i, (lat, lon) in enumerate(points)
+        ]
+
+    action = params.get('action')
+    if action == 'wbsearchentities':
+        return 200, {'search': [{'id': _qid(params.get('search', ''))}]}
+    if action == 'wbgetentities':
+        if 'titles' in params:
+            ids = [_qid(title) for title in params['titles'].split('|')]
+        else:
+            ids = params.get('ids', '').split('|')
+        entities = {}
+        for qid in ids:
+            if params.get('props') == 'labels':
+                lang = params.get('languages', 'en')
+                entities[qid] = {'id': qid, 'labels': {lang: {'language': lang, 'value': f"Label {qid}"}}}
+                continue
+            claims = {'P1082': [{'rank': 'normal', 'mainsnak': {'datavalue': {
+                'value': {'amount': f"+{_number(qid, 10 ** 5, 10 ** 9)}", 'unit': '1'}}}}]}
+            for prop in ('P36', 'P38', 'P35'):
+                claims[prop] = [{'rank': 'normal', 'mainsnak': {'datavalue': {
+                    'value': {'entity-type': 'item', 'id': _qid(qid + prop)}}}}]
+            entities[qid] = {'id': qid, 'claims': claims}
+        return 200, {'entities': entities}
+
+    if action == 'query':
+        titles = params.get('titles', '').split('|')
+        lang = host.split('.')[0]
+        pages = []
+        for title in titles:
+            page = {'pageid': _number(title, 1, 10 ** 8), 'ns': 0, 'title': title,
+                    'fullurl': f"https://{host}/wiki/{title.replace(' ', '_')}"}
+            props = params.get('prop', '').split('|')
+            if 'extracts' in props:
+                extract = PARAGRAPH.format(title=title)
+                if params.get('exchars') and len(extract) > int(params['exchars']):
+                    extract = extract[:int(params['exchars'])].rstrip() + '…'
+                page['extract'] = extract
+            if 'pageimages' in props:
+                image = f"https://upload.wikimedia.org/{title.replace(' ', '_')}.jpg"
+                page['original'] = {'source': image}
+                page['thumbnail'] = {'source': image}
+            if 'langlinks' in props:
+                page['langlinks'] = [{'lang': code, 'title': title}
+                                     for code in ('en', 'fr', 'de', 'es', 'it', 'ja', 'hi', 'ru')
+                                     if code != lang]
+            pages.append(page)
+        if str(params.get('formatversion')) == '2':
+            return 200, {'batchcomplete': True, 'query': {'pages': pages}}
+        return 200, {'batchcomplete': '', 'query': {'pages': {str(p['pageid']): p for p in pages}}}
+
+    return 400, {'error': {'code': 'badrequest', 'info': 'Not synthesized'}}
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """HTTP server replaying (or recording) upstream responses"""
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), recording: Optional[str] = None,
+                 record: bool = False, synthetic: bool = False, latency_ms: float = 0,
+                 jitter_ms: float = 0, error_rate: float = 0, error_status: int = 503,
+                 seed: Optional[int] = None):
+        super().__init__(address, ReplayHandler)
+        self.recording = recording
+        self.record = record
+        self.synthetic = synthetic
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.stats = {'requests': 0, 'replayed': 0, 'recorded': 0, 'synthesized': 0,
+                      'missing': 0, 'injected_errors': 0}
+        # Requests per upstream host
+        self.hosts: Counter = Counter()
+        self.responses: Dict[str, Tuple[int, object]] = {}
+        self._lock = threading.Lock()
+        if recording and os.path.exists(recording):
+            with _open(recording, 'r') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    key = request_key(entry['host'], entry['path'], entry['params'])
+                    self.responses[key] = (entry['status'], entry['body'])
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _fetch_upstream(self, host: str, path: str, params: Dict) -> Tuple[int, object]:
+        import httpx
+
+        from http_client import USER_AGENT
+
+        response = httpx.get(f"https://{host}{path}", params=params,
+                             headers={'User-Agent': USER_AGENT}, timeout=30)
+        return response.status_code, response.json()
+
+    def respond(self, host: str, path: str, params: Dict) -> Tuple[int, object, Dict]:
+        """Return (status, body, extra headers) for one request"""
+        with self._lock:
+            self.stats['requests'] += 1
+            self.hosts[host] += 1
+            inject = self.error_rate and self.random.random() < self.error_rate
+            delay = (self.latency_ms + self.random.uniform(0, self.jitter_ms)) / 1000
+        if delay:
+            time.sleep(delay)
+        if inject:
+            with self._lock:
+                self.stats['injected_errors'] += 1
+            return self.error_status, {'error': 'injected'}, {'Retry-After': '0'}
+
+        key = request_key(host, path, params)
+        with self._lock:
+            cached = self.responses.get(key)
+        if cached is not None:
+            with self._lock:
+                self.stats['replayed'] += 1
+            return cached[0], cached[1], {}
+
+        if self.record:
+            status, body = self._fetch_upstream(host, path, params)
+            with self._lock:
+                self.responses[key] = (status, body)
+                self.stats['recorded'] += 1
+                if self.recording:
+                    with _open(self.recording, 'a') as f:
+                        f.write(json.dumps({'host': host, 'path': path, 'params': params,
+                                            'status': status, 'body': body}, ensure_ascii=False) + '\n')
+            return status, body, {}
+
+        if self.synthetic:
+            with self._lock:
+                self.stats['synthesized'] += 1
+            status, body = synthesize(host, path, params)
+            return status, body, {}
+
+        with self._lock:
+            self.stats['missing'] += 1
+        return 404, {'error': {'code': 'notrecorded', 'info': f"No recording for {host}{path}"}}, {}
+
+    def start(self) -> 'ReplayServer':
+        """Serve on a daemon thread"""
+        threading.Thread(target=self.serve_forever, name='replay-server', daemon=True).start()
+        return self
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        host, _, path = parts.path.lstrip('/').partition('/')
+        params = dict(parse_qsl(parts.query, keep_blank_values=True))
+        try:
+            status, body, headers = self.server.respond(host, '/' + path, params)
+        except Exception as e:
+            status, body, headers = 502, {'error': {'code': 'upstream', 'info': str(e)}}, {}
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded Wikimedia/Nominatim responses')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--recording', help='JSON-lines recording (.jsonl or .jsonl.gz)')
+    parser.add_argument('--record', action='store_true', help='fetch and record unrecorded requests')
+    parser.add_argument('--synthetic', action='store_true', help='synthesize unrecorded responses')
+    parser.add_argument('--latency-ms', type=float, default=0, help='added to every response')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='uniform extra latency')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of injected errors')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    server = ReplayServer((args.host, args.port), args.recording, args.record, args.synthetic,
+                          args.latency_ms, args.jitter_ms, args.error_rate, args.error_status, args.seed)
+    print(f"Serving on {server.base_url}")
+    print(f"EXPLORER_WIKIMEDIA_BASE={server.base_url} EXPLORER_NOMINATIM_BASE={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""Run the benchmark suite against the replay server and report percentiles
+
+Usage::
+
+    python -m bench.run --synthetic --latency-ms 50 --concurrency 8
+    python -m bench.run --recording bench/recordings.jsonl.gz --output after.json --compare before.json
+
+Scenarios:
+
+- ``explore.cold``: the Explore fetch path (summary, facts, travel info,
+  coordinates, places) for every corpus triple, bypassing the response
+  cache;
+- ``explore.warm``: the same triples again, answered from the cache;
+- ``compare.cold``: side-by-side comparisons of MAX_COMPARE countries per
+  corpus language, bypassing the response cache;
+- ``wikidata_info``, ``places_of_interest``: single data-layer calls, cold;
+- ``create_map.<n>``: building and rendering a map with n places.
+
+After the scenarios, a refresh check compares a few countries with the
+cache in use and again under ``bypass_cache()`` (the apps' Refresh button),
+and fails the run unless the second comparison fetched every panel from
+upstream again.
+
+Each run uses a fresh temporary cache directory and, unless
+``--with-index`` is given, no local country index, so every lookup goes
+through the (replayed) network.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+from bench.corpus import COUNTRIES, LANGUAGES, PLACE_TYPES, combinations
+from bench.replay_server import ReplayServer
+
+
+def measure(name: str, calls: Iterable[Callable[[], object]], concurrency: int = 1) -> Dict:
+    """Run ``calls`` on ``concurrency`` threads and summarise their latencies"""
+    from metrics import percentile
+
+    def run(call):
+        start = time.perf_counter()
+        try:
+            call()
+            ok = True
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    calls = list(calls)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(run, calls))
+    wall = time.perf_counter() - started
+
+    latencies = [seconds for seconds, _ in results]
+    return {
+        'scenario': name,
+        'count': len(results),
+        'errors': sum(1 for _, ok in results if not ok),
+        'wall_seconds': round(wall, 4),
+        'throughput': round(len(results) / wall, 2) if wall else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def fake_places(n: int) -> List[Dict]:
+    return [{'name': f"Place {i}", 'address': f"Place {i}, Street {i}",
+             'lat': 40 + (i % 100) * 0.05, 'lon': 2 + (i // 100) * 0.05} for i in range(n)]
+
+
+def run_suite(args) -> List[Dict]:
+    # Imported only now that the environment points at the replay server
+    from explorer_api import MAX_COMPARE, Explorer, LocationFinder, WikimediaAPI, create_map
+    from map_render import to_html
+    from response_cache import bypass_cache
+
+    triples = combinations()[:args.limit] if args.limit else combinations()
+    countries = COUNTRIES[:args.limit] if args.limit else COUNTRIES
+    results = []
+    for _ in range(args.repeat):
+        explorer = Explorer()
+
+        def cold(call):
+            def wrapped():
+                with bypass_cache():
+                    return call()
+            return wrapped
+
+        results.append(measure('explore.cold', [
+            cold(lambda t=t: explorer.explore(t[0], t[1], t[2], fallbacks=('en',)))
+            for t in triples], args.concurrency))
+        results.append(measure('explore.warm', [
+            lambda t=t: explorer.explore(t[0], t[1], t[2], fallbacks=('en',))
+            for t in triples], args.concurrency))
+        results.append(measure('compare.cold', [
+            cold(lambda i=i, lang=lang: explorer.compare(
+                countries[i:i + MAX_COMPARE], lang, PLACE_TYPES[i % len(PLACE_TYPES)]))
+            for lang in LANGUAGES for i in range(0, len(countries), MAX_COMPARE)], args.concurrency))
+
+        api, finder = WikimediaAPI(), LocationFinder()
+        results.append(measure('wikidata_info', [
+            cold(lambda c=c: api.get_wikidata_info(c)) for c in countries], args.concurrency))
+        results.append(measure('places_of_interest', [
+            cold(lambda c=c, p=p: finder.find_places_of_interest(c, p))
+            for c in countries for p in PLACE_TYPES], args.concurrency))
+
+        for n in args.map_places:
+            places = fake_places(n)
+            results.append(measure(f'create_map.{n}', [
+                lambda: to_html(create_map((46.0, 2.0), places, 'hotels'))
+                for _ in range(args.map_iterations)]))
+    return results
+
+
+# Upstream host of each comparison panel, as the replay server sees it
+REFRESH_PANELS = {
+    'summaries': 'en.wikipedia.org',
+    'facts': 'query.wikidata.org',
+    'places': 'nominatim.openstreetmap.org',
+}
+
+
+def check_refresh(server, countries: List[str], lang: str = 'en') -> Dict[str, int]:
+    """Upstream requests per panel made by a comparison under bypass_cache()
+
+    The countries are compared once first, so everything is cached.
+    """
+    from explorer_api import Explorer
+    from response_cache import bypass_cache
+
+    explorer = Explorer()
+    explorer.compare(countries, lang)
+    before = Counter(server.hosts)
+    with bypass_cache():
+        explorer.compare(countries, lang)
+    fetched = server.hosts - before
+    return {panel: fetched[host] for panel, host in REFRESH_PANELS.items()}
+
+
+def print_report(results: List[Dict], baseline: Optional[Dict[str, Dict]] = None):
+    header = f"{'scenario':<22}{'n':>6}{'err':>5}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header + ('   Δp95' if baseline else ''))
+    for row in results:
+        line = (f"{row['scenario']:<22}{row['count']:>6}{row['errors']:>5}{row['throughput']:>10}"
+                f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+        before = (baseline or {}).get(row['scenario'])
+        if before and before['p95_ms']:
+            line += f"   {(row['p95_ms'] - before['p95_ms']) / before['p95_ms']:+.0%}"
+        print(line)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Benchmark the explorer offline')
+    parser.add_argument('--recording', help='recorded responses to replay (.jsonl or .jsonl.gz)')
+    parser.add_argument('--synthetic', action='store_true', help='synthesize unrecorded responses')
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--limit', type=int, help='only use the first N corpus entries')
+    parser.add_argument('--map-places', type=int, nargs='*', default=[50, 2000])
+    parser.add_argument('--map-iterations', type=int, default=5)
+    parser.add_argument('--with-index', action='store_true', help='use the local country index')
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--compare', help='earlier --output file to compare against')
+    args = parser.parse_args(argv)
+
+    if not args.recording and not args.synthetic:
+        parser.error('give --recording and/or --synthetic')
+
+    server = ReplayServer(recording=args.recording, synthetic=args.synthetic,
+                          latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                          error_rate=args.error_rate, seed=args.seed).start()
+    cache_dir = tempfile.mkdtemp(prefix='explorer-bench-')
+    os.environ.update({
+        'EXPLORER_WIKIMEDIA_BASE': server.base_url,
+        'EXPLORER_NOMINATIM_BASE': server.base_url,
+        'EXPLORER_NOMINATIM_RATE': '10000',
+        'EXPLORER_CACHE_DIR': cache_dir,
+        'EXPLORER_GEOCODER': 'nominatim',
+    })
+    if not args.with_index:
+        os.environ['EXPLORER_COUNTRY_INDEX'] = os.path.join(cache_dir, 'no-index.sqlite')
+
+    results = run_suite(args)
+    refresh = check_refresh(server, COUNTRIES[:3])
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = {row['scenario']: row for row in json.load(f)['results']}
+    print_report(results, baseline)
+    print(f"replay server: {server.stats}", file=sys.stderr)
+    print(f"refresh check: {refresh}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'server': server.stats, 'results': results}, f, indent=2)
+    server.shutdown()
+    stale = [panel for panel, requests in refresh.items() if not requests]
+    if stale:
+        sys.exit(f"Refresh did not re-fetch: {', '.join(stale)}")
+
+
+if __name__ == '__main__':
+    main()
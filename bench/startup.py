@@ -0,0 +1,149 @@
+"""Measure how long a cold start takes, and what it is spent on
+
+Each measurement runs in a fresh interpreter, so nothing is already
+imported or cached:
+
+- ``import.<module>``: importing one of the app modules, with the ten
+  slowest modules it pulls in (from ``python -X importtime``);
+- ``deferred.<module>``: importing a heavy library the apps only load once
+  a map, table or fetch needs it;
+- ``init.<function>``: building one of the process-wide singletons.
+
+Usage::
+
+    python -m bench.startup
+    python -m bench.startup --json > startup.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported by the apps before their first paint
+APP_MODULES = ['explorer_api', 'streamlit_app', 'app (2)']
+# Loaded on first use only; a regression shows up as one of these in import.*
+DEFERRED_MODULES = ['folium', 'streamlit_folium', 'pandas', 'numpy', 'geopy', 'httpx']
+# (module, singleton getter) built lazily by the apps
+SINGLETONS = [
+    ('response_cache', 'get_cache'),
+    ('country_index', 'get_country_index'),
+    ('name_resolver', 'get_name_resolver'),
+    ('http_client', 'get_wikimedia_client'),
+    ('facts', 'get_facts_engine'),
+    ('snapshot', 'get_snapshot_store'),
+    ('geocoding', 'get_geocoding_backend'),
+]
+
+
+def _run(code: str, env: Dict[str, str], importtime: bool = False) -> subprocess.CompletedProcess:
+    args = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    return subprocess.run(args, cwd=ROOT, env=env, capture_output=True, text=True)
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """Per-module depth and (self, cumulative) microseconds from ``-X importtime`` output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        # Nested imports are indented two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append({'module': name.strip(), 'depth': depth, 'self_us': int(self_us),
+                     'cumulative_us': int(cumulative_us)})
+    return rows
+
+
+def time_import(module: str, env: Dict[str, str], top: int = 10) -> Dict:
+    """Import ``module`` in a fresh interpreter"""
+    if not module.isidentifier():
+        # Execute the script's imports without running its page
+        return time_script_imports(module, env, top)
+    result = _run(f'import {module}', env, importtime=True)
+    rows = parse_importtime(result.stderr)
+    own = next((r for r in rows if r['module'] == module), None)
+    return {
+        'name': f'import.{module}',
+        'ms': own['cumulative_us'] / 1000 if own else None,
+        'error': result.returncode != 0 and result.stderr.strip().splitlines()[-1],
+        'slowest': sorted(rows, key=lambda r: r['self_us'], reverse=True)[:top],
+    }
+
+
+def time_script_imports(script: str, env: Dict[str, str], top: int = 10) -> Dict:
+    """Import every module a script imports at its top level, as the script would"""
+    import ast
+
+    with open(os.path.join(ROOT, script + '.py')) as f:
+        source = f.read()
+    lines = [ast.get_source_segment(source, node) for node in ast.parse(source).body
+             if isinstance(node, (ast.Import, ast.ImportFrom))]
+    result = _run('\n'.join(lines), env, importtime=True)
+    rows = parse_importtime(result.stderr)
+    total = sum(r['cumulative_us'] for r in rows if r['depth'] == 0)
+    return {
+        'name': f'import.{script}',
+        'ms': total / 1000,
+        'error': result.returncode != 0 and result.stderr.strip().splitlines()[-1],
+        'slowest': sorted(rows, key=lambda r: r['self_us'], reverse=True)[:top],
+    }
+
+
+def time_deferred(module: str, env: Dict[str, str]) -> Dict:
+    result = _run(f'import time; t = time.perf_counter(); import {module}; '
+                  'print((time.perf_counter() - t) * 1000)', env)
+    if result.returncode != 0:
+        return {'name': f'deferred.{module}', 'ms': None, 'error': 'not installed'}
+    return {'name': f'deferred.{module}', 'ms': float(result.stdout.split()[-1]), 'error': False}
+
+
+def time_singleton(module: str, getter: str, env: Dict[str, str]) -> Dict:
+    code = (f'import {module}, time; t = time.perf_counter(); {module}.{getter}(); '
+            'print((time.perf_counter() - t) * 1000)')
+    result = _run(code, env)
+    if result.returncode != 0:
+        return {'name': f'init.{getter}', 'ms': None,
+                'error': result.stderr.strip().splitlines()[-1]}
+    return {'name': f'init.{getter}', 'ms': float(result.stdout.split()[-1]), 'error': False}
+
+
+def run_suite(args) -> List[Dict]:
+    env = dict(os.environ)
+    # A throwaway cache, so the run neither reads nor writes the real one
+    env.setdefault('EXPLORER_CACHE_DIR', tempfile.mkdtemp(prefix='startup-'))
+    results = [time_import(module, env, args.top) for module in args.modules]
+    results += [time_deferred(module, env) for module in DEFERRED_MODULES]
+    results += [time_singleton(module, getter, env) for module, getter in SINGLETONS]
+    return results
+
+
+def print_report(results: List[Dict]):
+    for result in results:
+        ms = f"{result['ms']:9.1f} ms" if result['ms'] is not None else '        – ms'
+        print(f"{result['name']:<32} {ms}" + (f"  ({result['error']})" if result['error'] else ''))
+        for row in result.get('slowest', []):
+            print(f"    {row['module']:<40} {row['self_us'] / 1000:8.1f} ms self")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Measure the cold start of the explorer')
+    parser.add_argument('--modules', nargs='*', default=APP_MODULES, help='app modules to import')
+    parser.add_argument('--top', type=int, default=10, help='slowest imports listed per module')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args(argv)
+
+    results = run_suite(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == '__main__':
+    main()
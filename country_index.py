@@ -0,0 +1,285 @@
+"""Precomputed local index of countries: aliases, QIDs, centroids and quick facts
+
+Build it once (and refresh occasionally) with::
+
+    python country_index.py
+
+The explorer answers coordinates and core facts from this index and only
+falls back to Nominatim / Wikidata for names it doesn't know.
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from static_data import LANGUAGE_CODES
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'country_index.sqlite')
+
+# Every language offered by either app
+INDEX_LANGUAGES = list(LANGUAGE_CODES.values())
+
+SPARQL_ENDPOINT = 'https://query.wikidata.org/sparql'
+WIKIDATA_API = 'https://www.wikidata.org/w/api.php'
+USER_AGENT = 'CountryExplorer/1.0 (https://huggingface.co/spaces/)'
+
+# Sovereign states that still exist, with the facts shown in the Quick Facts panel
+COUNTRIES_QUERY = """
+SELECT ?country ?iso2 ?coord ?population ?capital ?currency ?head WHERE {
+  ?country wdt:P31 wd:Q3624078 .
+  FILTER NOT EXISTS { ?country wdt:P576 [] }
+  OPTIONAL { ?country wdt:P297 ?iso2 }
+  OPTIONAL { ?country wdt:P625 ?coord }
+  OPTIONAL { ?country wdt:P1082 ?population }
+  OPTIONAL { ?country wdt:P36 ?capital }
+  OPTIONAL { ?country wdt:P38 ?currency }
+  OPTIONAL { ?country wdt:P35 ?head }
+}
+"""
+
+SCHEMA = """
+CREATE TABLE countries (
+    qid TEXT PRIMARY KEY, iso2 TEXT, lat REAL, lon REAL, population TEXT,
+    capital TEXT, currency TEXT, head_of_state TEXT
+);
+CREATE TABLE labels (qid TEXT, lang TEXT, label TEXT, PRIMARY KEY (qid, lang));
+CREATE TABLE titles (qid TEXT, lang TEXT, title TEXT, PRIMARY KEY (qid, lang));
+CREATE TABLE aliases (alias TEXT, qid TEXT, PRIMARY KEY (alias, qid));
+"""
+
+
+def normalize_name(name: str) -> str:
+    """Casefold, strip accents and collapse whitespace for alias matching"""
+    decomposed = unicodedata.normalize('NFKD', name.casefold())
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.split())
+
+
+def _entity_id(uri: str) -> str:
+    return uri.rsplit('/', 1)[-1]
+
+
+def _parse_point(wkt: str) -> Tuple[float, float]:
+    # "Point(lon lat)"
+    lon, lat = wkt[wkt.index('(') + 1:wkt.index(')')].split()
+    return float(lat), float(lon)
+
+
+class CountryIndex:
+    """Read-only lookups against a built index file"""
+
+    FACT_COLUMNS = ('capital', 'currency', 'head_of_state')
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get('EXPLORER_COUNTRY_INDEX', DEFAULT_INDEX_PATH)
+        self._db = None
+        if os.path.exists(self.path):
+            uri = 'file:' + self.path.replace('?', '%3f') + '?mode=ro'
+            self._db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._db.execute('PRAGMA mmap_size = 67108864')
+
+    @property
+    def available(self) -> bool:
+        return self._db is not None
+
+    def find(self, name: str) -> Optional[str]:
+        """Return the QID for any known name, alias or ISO code"""
+        if not self.available or not name:
+            return None
+        row = self._db.execute(
+            'SELECT qid FROM aliases WHERE alias = ? LIMIT 1', (normalize_name(name),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_coords(self, name: str) -> Optional[Tuple[float, float]]:
+        qid = self.find(name)
+        if qid is None:
+            return None
+        row = self._db.execute('SELECT lat, lon FROM countries WHERE qid = ?', (qid,)).fetchone()
+        return (row[0], row[1]) if row and row[0] is not None else None
+
+    def get_iso2(self, name: str) -> Optional[str]:
+        """Return the ISO 3166-1 alpha-2 code for a country name"""
+        qid = self.find(name)
+        if qid is None:
+            return None
+        row = self._db.execute('SELECT iso2 FROM countries WHERE qid = ?', (qid,)).fetchone()
+        return row[0] if row else None
+
+    def label(self, qid: str, lang: str = 'en') -> Optional[str]:
+        row = self._db.execute(
+            'SELECT label FROM labels WHERE qid = ? AND lang IN (?, \'en\') '
+            'ORDER BY lang = ? DESC LIMIT 1', (qid, lang, lang)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_title(self, qid: str, lang: str = 'en') -> Optional[str]:
+        """Return the Wikipedia article title for a country in one language"""
+        if not self.available:
+            return None
+        row = self._db.execute(
+            'SELECT title FROM titles WHERE qid = ? AND lang = ?', (qid, lang)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_facts(self, name: str, lang: str = 'en') -> Dict:
+        """Return quick facts in the same shape as WikidataResolver.get_facts"""
+        qid = self.find(name)
+        if qid is None:
+            return {}
+        row = self._db.execute(
+            'SELECT population, capital, currency, head_of_state FROM countries WHERE qid = ?', (qid,)
+        ).fetchone()
+        if row is None:
+            return {}
+        info = {'qid': qid}
+        if row[0]:
+            info['population'] = row[0]
+        for column, value_qid in zip(self.FACT_COLUMNS, row[1:]):
+            label = self.label(value_qid, lang) if value_qid else None
+            if label:
+                info[column] = label
+        return info
+
+    def aliases(self) -> List[Tuple[str, str]]:
+        """Return every (normalized alias, QID) pair"""
+        if not self.available:
+            return []
+        return self._db.execute('SELECT alias, qid FROM aliases').fetchall()
+
+    def country_rows(self, table: str) -> Dict[str, Dict[str, str]]:
+        """Return ``labels`` or ``titles`` for every country as {qid: {lang: value}}"""
+        if not self.available or table not in ('labels', 'titles'):
+            return {}
+        column = table[:-1]
+        rows = {}
+        for qid, lang, value in self._db.execute(
+                f'SELECT qid, lang, {column} FROM {table} JOIN countries USING (qid)'):
+            rows.setdefault(qid, {})[lang] = value
+        return rows
+
+    def names(self, lang: str = 'en') -> List[str]:
+        """Return every country's label in one language, sorted"""
+        if not self.available:
+            return []
+        rows = self._db.execute(
+            'SELECT label FROM labels JOIN countries USING (qid) WHERE lang = ? ORDER BY label', (lang,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+
+_index: Optional[CountryIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_country_index() -> CountryIndex:
+    """Return the process-wide country index (empty if it hasn't been built)"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = CountryIndex()
+        return _index
+
+
+def _batches(items: List[str], size: int = 50) -> Iterable[List[str]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def build_index(path: str = DEFAULT_INDEX_PATH, languages: Iterable[str] = INDEX_LANGUAGES):
+    """Download country data from Wikidata and write a fresh index file"""
+    import requests
+
+    languages = list(languages)
+    session = requests.Session()
+    session.headers.update({'User-Agent': USER_AGENT})
+
+    response = session.get(SPARQL_ENDPOINT, params={'query': COUNTRIES_QUERY, 'format': 'json'}, timeout=120)
+    response.raise_for_status()
+
+    countries: Dict[str, Dict] = {}
+    for binding in response.json()['results']['bindings']:
+        qid = _entity_id(binding['country']['value'])
+        row = countries.setdefault(qid, {})
+        if 'iso2' in binding:
+            row.setdefault('iso2', binding['iso2']['value'])
+        if 'coord' in binding:
+            row.setdefault('coord', _parse_point(binding['coord']['value']))
+        if 'population' in binding:
+            row.setdefault('population', '+' + binding['population']['value'].split('.')[0])
+        for key, column in (('capital', 'capital'), ('currency', 'currency'), ('head', 'head_of_state')):
+            if key in binding:
+                row.setdefault(column, _entity_id(binding[key]['value']))
+
+    def get_entities(ids: List[str], props: str) -> Dict:
+        entities = {}
+        for batch in _batches(ids):
+            res = session.get(WIKIDATA_API, params={
+                'action': 'wbgetentities',
+                'format': 'json',
+                'ids': '|'.join(batch),
+                'props': props,
+                'languages': '|'.join(languages),
+                'sitefilter': '|'.join(f'{lang}wiki' for lang in languages),
+            }, timeout=60)
+            res.raise_for_status()
+            entities.update(res.json().get('entities', {}))
+        return entities
+
+    country_entities = get_entities(sorted(countries), 'labels|aliases|sitelinks')
+    referenced = sorted({row[c] for row in countries.values()
+                         for c in CountryIndex.FACT_COLUMNS if row.get(c)})
+    referenced_entities = get_entities(referenced, 'labels')
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    db.executescript(SCHEMA)
+
+    for qid, row in countries.items():
+        lat, lon = row.get('coord', (None, None))
+        db.execute('INSERT INTO countries VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (
+            qid, row.get('iso2'), lat, lon, row.get('population'),
+            row.get('capital'), row.get('currency'), row.get('head_of_state'),
+        ))
+
+    for qid, entity in list(country_entities.items()) + list(referenced_entities.items()):
+        for lang, label in entity.get('labels', {}).items():
+            db.execute('INSERT OR REPLACE INTO labels VALUES (?, ?, ?)', (qid, lang, label['value']))
+
+    for qid, entity in country_entities.items():
+        names = {qid, countries[qid].get('iso2') or ''}
+        names.update(label['value'] for label in entity.get('labels', {}).values())
+        for lang_aliases in entity.get('aliases', {}).values():
+            names.update(alias['value'] for alias in lang_aliases)
+        for site, sitelink in entity.get('sitelinks', {}).items():
+            lang = site[:-len('wiki')]
+            db.execute('INSERT OR REPLACE INTO titles VALUES (?, ?, ?)', (qid, lang, sitelink['title']))
+            names.add(sitelink['title'])
+        for name in names:
+            if name:
+                db.execute('INSERT OR IGNORE INTO aliases VALUES (?, ?)', (normalize_name(name), qid))
+
+    db.commit()
+    db.execute('VACUUM')
+    db.close()
+    os.replace(tmp_path, path)
+    return len(countries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the local country index')
+    parser.add_argument('--output', default=DEFAULT_INDEX_PATH, help='index file to write')
+    parser.add_argument('--languages', nargs='+', default=INDEX_LANGUAGES, help='wiki language codes to include')
+    args = parser.parse_args()
+    count = build_index(args.output, args.languages)
+    print(f"Indexed {count} countries into {args.output}")
+
+
+if __name__ == '__main__':
+    main()
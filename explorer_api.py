@@ -0,0 +1,478 @@
+"""Data layer of the explorer, importable without Streamlit
+
+WikimediaAPI and LocationFinder fetch everything shown for a country and
+create_map draws it. Failures go to an ``on_error`` handler: the
+Streamlit app's memoized fetches pass :func:`raise_error` and report the
+error on the page, so a failure is never memoized; other callers (the REST
+service, benchmarks) get them logged instead. :class:`Explorer` runs the same concurrent fetch
+path as the app's Explore button and returns the combined bundle, or
+several countries' bundles side by side.
+"""
+
+import logging
+import os
+from functools import cached_property
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from batch import MAX_TITLES, fetch_chunk
+from country_index import get_country_index
+from facts import get_facts_engine
+from geocoding import GeocodingBackend, get_geocoding_backend
+from metrics import json_size, timed
+from multilingual import SummaryPipeline
+from name_resolver import NameResolver, get_name_resolver
+from orchestrator import FetchOrchestrator
+from response_cache import bypass_cache, get_cache
+from snapshot import get_snapshot_store, serve as serve_snapshot
+from static_data import PLACE_COLORS
+from viewport import PLACES_PER_TILE, Tile, tile_bounds
+from wikidata import WIKIDATA_API, WikidataResolver
+
+logger = logging.getLogger(__name__)
+
+# Receives a user-facing message when a lookup fails
+ErrorHandler = Callable[[str], None]
+
+# Extract lengths asked of the API (TextExtracts caps exchars at 1200); the
+# full text is only fetched when a user expands it
+SUMMARY_CHARS = 1200
+TRAVEL_CHARS = 500
+
+# Thumbnail width requested for the article image, about the width of the
+# main column in the wide layout
+THUMB_WIDTH = int(os.environ.get('EXPLORER_THUMB_WIDTH', 640))
+
+# Countries compared side by side at most
+MAX_COMPARE = int(os.environ.get('EXPLORER_MAX_COMPARE', 6))
+
+
+def is_truncated(extract: str) -> bool:
+    """Whether TextExtracts cut the extract short at ``exchars``"""
+    return extract.endswith(('…', '...'))
+
+
+def log_error(message: str):
+    logger.warning(message)
+
+
+class FetchError(Exception):
+    """A lookup failed, raised by :func:`raise_error`"""
+
+
+def raise_error(message: str):
+    """Error handler for memoized callers: a failure raises instead of becoming an empty result"""
+    raise FetchError(message)
+
+
+class WikimediaAPI:
+    """Handler for various Wikimedia API endpoints"""
+    
+    def __init__(self, on_error: Optional[ErrorHandler] = None):
+        self.on_error = on_error or log_error
+    
+    # Clients are built on first use, so creating the API costs nothing on
+    # a cold start and a page that never fetches never imports httpx
+    @cached_property
+    def session(self):
+        # Process-wide async client: pooled (HTTP/2 when available)
+        # connections per host, separate connect/read timeouts and retries
+        # with backoff on 429/5xx and maxlag
+        from http_client import get_wikimedia_client
+        return get_wikimedia_client()
+    
+    @cached_property
+    def cache(self):
+        return get_cache()
+    
+    @cached_property
+    def wikidata(self) -> WikidataResolver:
+        return WikidataResolver(
+            lambda params: self._get_json(WIKIDATA_API, params, 'wikidata')
+        )
+    
+    @cached_property
+    def index(self):
+        return get_country_index()
+    
+    @cached_property
+    def facts(self):
+        return get_facts_engine()
+    
+    @cached_property
+    def snapshot(self):
+        """Intros ingested from dumps (snapshot.py), used before the network"""
+        return get_snapshot_store()
+    
+    def _get_json(self, url: str, params: Dict, source: str, lang: str = "") -> Dict:
+        """GET a JSON response, answering from the response cache when possible"""
+        return self.cache.get_or_fetch(
+            source, url, params, lang,
+            lambda: self.session.get_json(url, params)
+        )
+    
+    def _from_snapshot(self, source: str, title: str, lang: str, max_chars: Optional[int],
+                       fetch_live: Callable[[], Dict]) -> Optional[Dict]:
+        """Answer from the offline snapshot, revalidating stale entries in the background"""
+        entry = self.snapshot.get(source, lang, title)
+        if entry is None:
+            return None
+        if self.snapshot.stale(entry):
+            def refresh():
+                with bypass_cache():
+                    return fetch_live()
+            self.snapshot.refresh(source, lang, title, refresh)
+        return serve_snapshot(entry, max_chars, THUMB_WIDTH if source == 'wikipedia' else None)
+        
+    @timed('wikipedia.summary', size=json_size)
+    def get_wikipedia_summary(self, country: str, lang: str = "en",
+                              max_chars: Optional[int] = SUMMARY_CHARS) -> Dict:
+        """Get Wikipedia summary for a country
+
+        The extract is cut to ``max_chars`` by the API (``None`` for the
+        whole introduction). ``image`` is a THUMB_WIDTH thumbnail and
+        ``image_original`` the full-resolution file.
+        """
+        try:
+            snapshot = self._from_snapshot(
+                'wikipedia', country, lang, max_chars,
+                lambda: self._fetch_wikipedia_summary(country, lang, None))
+            return snapshot or self._fetch_wikipedia_summary(country, lang, max_chars)
+        except Exception as e:
+            self.on_error(f"Error fetching Wikipedia data: {str(e)}")
+        
+        return {}
+    
+    def _fetch_wikipedia_summary(self, country: str, lang: str, max_chars: Optional[int]) -> Dict:
+        url = f"https://{lang}.wikipedia.org/w/api.php"
+        params = {
+            'action': 'query',
+            'format': 'json',
+            'titles': country,
+            'prop': 'extracts|pageimages|info',
+            'exintro': True,
+            'explaintext': True,
+            'exsectionformat': 'plain',
+            'piprop': 'thumbnail|original',
+            'pithumbsize': THUMB_WIDTH,
+            'inprop': 'url'
+        }
+        if max_chars:
+            params['exchars'] = max_chars
+        
+        data = self._get_json(url, params, 'wikipedia', lang)
+        
+        pages = data.get('query', {}).get('pages', {})
+        if pages:
+            page_id = list(pages.keys())[0]
+            if page_id != '-1':
+                page = pages[page_id]
+                original = page.get('original', {}).get('source', '')
+                extract = page.get('extract', '')
+                return {
+                    'title': page.get('title', ''),
+                    'extract': extract,
+                    'truncated': bool(max_chars) and is_truncated(extract),
+                    'image': page.get('thumbnail', {}).get('source', original),
+                    'image_original': original,
+                    'url': page.get('fullurl', '')
+                }
+        
+        return {}
+    
+    @timed('wikipedia.summaries', size=json_size)
+    def get_wikipedia_summaries(self, titles: Iterable[str], lang: str = "en",
+                                max_chars: Optional[int] = SUMMARY_CHARS) -> Dict[str, Dict]:
+        """Summaries of several articles from one wiki, MAX_TITLES per request
+
+        Returns a dict per requested title, in the shape of
+        :meth:`get_wikipedia_summary` (empty for missing articles).
+        """
+        titles = list(dict.fromkeys(titles))
+        summaries = {}
+        try:
+            for start in range(0, len(titles), MAX_TITLES):
+                chunk = {title: title for title in titles[start:start + MAX_TITLES]}
+                rows = fetch_chunk(chunk, lang,
+                                   lambda url, params, lang: self._get_json(url, params, 'wikipedia', lang),
+                                   thumb_width=THUMB_WIDTH, max_chars=max_chars)
+                for row in rows:
+                    if not row['title']:
+                        summaries[row['country']] = {}
+                        continue
+                    summaries[row['country']] = {
+                        'title': row['title'],
+                        'extract': row['extract'],
+                        'truncated': bool(max_chars) and is_truncated(row['extract']),
+                        'image': row['image'],
+                        'image_original': row['image_original'],
+                        'url': row['url'],
+                    }
+        except Exception as e:
+            self.on_error(f"Error fetching Wikipedia data: {str(e)}")
+        
+        return summaries
+    
+    @timed('wikipedia.langlinks')
+    def get_langlinks(self, title: str, lang: str = "en") -> Dict[str, str]:
+        """Get the titles of an article in every other language"""
+        url = f"https://{lang}.wikipedia.org/w/api.php"
+        params = {
+            'action': 'query',
+            'format': 'json',
+            'formatversion': 2,
+            'titles': title,
+            'prop': 'langlinks',
+            'lllimit': 'max',
+            'redirects': True
+        }
+        
+        try:
+            data = self._get_json(url, params, 'wikipedia', lang)
+            pages = data.get('query', {}).get('pages', [])
+            if pages and not pages[0].get('missing'):
+                links = {link['lang']: link['title'] for link in pages[0].get('langlinks', [])}
+                links[lang] = pages[0]['title']
+                return links
+        except Exception as e:
+            self.on_error(f"Error fetching Wikipedia language links: {str(e)}")
+        
+        return {}
+    
+    @timed('wikidata.facts', size=json_size)
+    def get_wikidata_info(self, country: str, lang: str = "en") -> Dict:
+        """Get structured data from Wikidata, labelled in ``lang``"""
+        # Every fact in facts.FACTS from one (cached) SPARQL query
+        try:
+            return self.facts.get(country, lang)
+        except Exception:
+            pass
+        
+        # The query service is unavailable: core facts from the local index
+        # or the action API
+        try:
+            return self.index.get_facts(country, lang) or self.wikidata.get_facts(country, lang)
+        except Exception as e:
+            self.on_error(f"Error fetching Wikidata: {str(e)}")
+        
+        return {}
+    
+    @timed('wikidata.facts_many', size=json_size)
+    def get_wikidata_infos(self, countries: Iterable[str], lang: str = "en") -> Dict[str, Dict]:
+        """Structured data for several countries, from one SPARQL query when possible"""
+        countries = list(countries)
+        try:
+            return self.facts.get_many(countries, lang)
+        except Exception:
+            # The query service is unavailable: fall back country by country
+            return {country: self.get_wikidata_info(country, lang) for country in countries}
+    
+    @timed('wikivoyage.info', size=json_size)
+    def get_wikivoyage_info(self, country: str, lang: str = "en",
+                            max_chars: Optional[int] = TRAVEL_CHARS) -> Dict:
+        """Get travel information from Wikivoyage, cut to ``max_chars`` by the API"""
+        try:
+            snapshot = self._from_snapshot(
+                'wikivoyage', country, lang, max_chars,
+                lambda: self._fetch_wikivoyage_info(country, lang, None))
+            if snapshot:
+                snapshot.pop('image', None)
+                snapshot.pop('image_original', None)
+                return snapshot
+            return self._fetch_wikivoyage_info(country, lang, max_chars)
+        except Exception as e:
+            self.on_error(f"Error fetching Wikivoyage data: {str(e)}")
+        
+        return {}
+    
+    def _fetch_wikivoyage_info(self, country: str, lang: str, max_chars: Optional[int]) -> Dict:
+        url = f"https://{lang}.wikivoyage.org/w/api.php"
+        params = {
+            'action': 'query',
+            'format': 'json',
+            'titles': country,
+            'prop': 'extracts|info',
+            'exintro': True,
+            'explaintext': True,
+            'inprop': 'url'
+        }
+        if max_chars:
+            params['exchars'] = max_chars
+        
+        data = self._get_json(url, params, 'wikivoyage', lang)
+        
+        pages = data.get('query', {}).get('pages', {})
+        if pages:
+            page_id = list(pages.keys())[0]
+            if page_id != '-1':
+                page = pages[page_id]
+                extract = page.get('extract', '')
+                return {
+                    'title': page.get('title', ''),
+                    'extract': extract,
+                    'truncated': bool(max_chars) and is_truncated(extract),
+                    'url': page.get('fullurl', '')
+                }
+        
+        return {}
+
+class LocationFinder:
+    """Find places of interest through a pluggable geocoding backend"""
+    
+    def __init__(self, backend: Optional[GeocodingBackend] = None,
+                 on_error: Optional[ErrorHandler] = None):
+        self.on_error = on_error or log_error
+        if backend is not None:
+            self.backend = backend
+    
+    @cached_property
+    def backend(self) -> GeocodingBackend:
+        """Nominatim unless EXPLORER_GEOCODER selects the offline gazetteer"""
+        return get_geocoding_backend()
+    
+    @cached_property
+    def index(self):
+        return get_country_index()
+    
+    @timed('geocode.center')
+    def get_country_coordinates(self, country: str) -> Optional[Tuple[float, float]]:
+        """Get country center coordinates"""
+        coords = self.index.get_coords(country)
+        if coords:
+            return coords
+        
+        try:
+            return self.backend.find_country(country)
+        except Exception as e:
+            self.on_error(f"Error getting coordinates: {str(e)}")
+        return None
+    
+    @timed('geocode.places', size=json_size)
+    def find_places_of_interest(self, country: str, place_type: str, limit: Optional[int] = None) -> List[Dict]:
+        """Find specific types of places in a country"""
+        try:
+            return self.backend.find_places(country, place_type, limit)
+        except Exception as e:
+            self.on_error(f"Error finding places: {str(e)}")
+        
+        return []
+    
+    @timed('geocode.tile', size=json_size)
+    def find_places_in_tile(self, tile: Tile, place_type: str, limit: int = PLACES_PER_TILE) -> List[Dict]:
+        """Find places of a type inside one map tile (see viewport.py)"""
+        try:
+            return self.backend.find_in_bbox(*tile_bounds(tile), place_type=place_type, limit=limit)
+        except Exception as e:
+            self.on_error(f"Error finding places: {str(e)}")
+        
+        return []
+
+@timed('map.create')
+def create_map(center_coords: Tuple[float, float], places: List[Dict], place_type: str):
+    """Create a folium map with markers"""
+    # folium takes longer to import than everything else here together
+    import folium
+    from map_render import add_places, new_map
+    
+    m = new_map(center_coords, places)
+    
+    # Add center marker
+    folium.Marker(
+        center_coords,
+        popup="Country Center",
+        icon=folium.Icon(color='red', icon='star')
+    ).add_to(m)
+    
+    color = PLACE_COLORS.get(place_type, 'gray')
+    
+    # Add place markers (clustered canvas markers for large place sets)
+    add_places(m, places, color)
+    
+    return m
+
+
+class Explorer:
+    """The Explore button's fetch path as a single call"""
+
+    def __init__(self, api: Optional[WikimediaAPI] = None, finder: Optional[LocationFinder] = None,
+                 resolver: Optional[NameResolver] = None, pipeline: Optional[SummaryPipeline] = None):
+        self.api = api or WikimediaAPI()
+        self.finder = finder or LocationFinder()
+        self.resolver = resolver or get_name_resolver()
+        self.pipeline = pipeline or SummaryPipeline(self.api.get_wikipedia_summary, self.api.get_langlinks)
+        self.orchestrator = FetchOrchestrator()
+
+    @timed('explore')
+    def explore(self, country: str, lang: str = 'en', place_type: str = 'tourist_attractions',
+                fallbacks: Iterable[str] = ('en',)) -> Optional[Dict]:
+        """Fetch summary, facts, travel info, coordinates and places concurrently
+
+        Returns ``None`` when the local index is loaded and doesn't know the
+        country; without an index the name is used as typed.
+        """
+        match = self.resolver.resolve(country, lang)
+        if match is None and self.resolver.available:
+            return None
+        name = match['name'] if match else country
+        title = self.resolver.title_for(match, lang, country)
+        en_title = self.resolver.title_for(match, 'en', country)
+
+        def summary():
+            # Titles from the local index save the langlinks round trip
+            links = dict(match['titles']) if match else self.pipeline.titles(en_title)
+            links.setdefault(lang, title)
+            return self.pipeline.get(en_title, lang, fallbacks, links=links)
+
+        bundle = self.orchestrator.gather({
+            'wiki': summary,
+            'facts': lambda: self.api.get_wikidata_info(en_title, lang),
+            'travel': lambda: self.api.get_wikivoyage_info(title, lang),
+            'coords': lambda: self.finder.get_country_coordinates(en_title),
+            'places': lambda: self.finder.find_places_of_interest(en_title, place_type),
+        })
+        bundle.update(country=name, lang=lang, place_type=place_type)
+        return bundle
+
+    @timed('compare')
+    def compare(self, countries: Iterable[str], lang: str = 'en',
+                place_type: str = 'tourist_attractions') -> Dict:
+        """Fetch the first MAX_COMPARE countries at once, for a side-by-side view
+
+        All summaries come from one multi-title query and all facts from one
+        SPARQL query. They run concurrently with every country's coordinate
+        and places lookups, which share the geocoding scheduler. Returns
+        ``{'countries': [bundle, ...], 'unknown': [name, ...]}``, with one
+        ``country``, ``wiki``, ``facts``, ``coords``, ``places`` bundle per
+        known country in the order given.
+        """
+        resolved: Dict[str, Tuple[str, str]] = {}
+        unknown = []
+        for country in list(dict.fromkeys(c.strip() for c in countries if c.strip()))[:MAX_COMPARE]:
+            match = self.resolver.resolve(country, lang)
+            if match is None and self.resolver.available:
+                unknown.append(country)
+                continue
+            name = match['name'] if match else country
+            resolved[name] = (self.resolver.title_for(match, lang, country),
+                              self.resolver.title_for(match, 'en', country))
+
+        tasks = {
+            'wiki': lambda: self.api.get_wikipedia_summaries([title for title, _ in resolved.values()], lang),
+            'facts': lambda: self.api.get_wikidata_infos([en_title for _, en_title in resolved.values()], lang),
+        }
+        for name, (_, en_title) in resolved.items():
+            tasks[f'coords:{name}'] = lambda en_title=en_title: self.finder.get_country_coordinates(en_title)
+            tasks[f'places:{name}'] = lambda en_title=en_title: self.finder.find_places_of_interest(
+                en_title, place_type)
+        # A worker per task, so no country waits for another's lookups
+        results = FetchOrchestrator(max_workers=len(tasks)).gather(tasks)
+
+        bundles = []
+        for name, (title, en_title) in resolved.items():
+            bundles.append({
+                'country': name,
+                'wiki': (results['wiki'] or {}).get(title, {}),
+                'facts': (results['facts'] or {}).get(en_title, {}),
+                'coords': results[f'coords:{name}'],
+                'places': results[f'places:{name}'] or [],
+            })
+        return {'countries': bundles, 'unknown': unknown, 'lang': lang, 'place_type': place_type}
@@ -0,0 +1,270 @@
+"""Quick facts for countries from one Wikidata SPARQL query
+
+Every property in FACTS is fetched by a single query per country, with
+labels in the requested language (falling back to English). Several
+countries can share one query (:meth:`FactsEngine.get_many`), and one bulk
+query covers every country at once. Each country's SPARQL response is kept
+in the response cache like any other request, so the cache warmer keeps it
+fresh, and parsed into a compact, typed dict on read. Adding a fact costs
+no extra request::
+
+    {'qid': 'Q142', 'population': 68373433, 'area_km2': 643801.0,
+     'gdp': 2.78e12, 'gdp_unit': 'United States dollar', 'capital': 'Paris',
+     'currency': 'euro', 'official_languages': ['French'], ...}
+
+Precompute the facts for all countries with::
+
+    python facts.py --langs en fr de
+"""
+
+import argparse
+import threading
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from country_index import CountryIndex, get_country_index
+from response_cache import ResponseCache, get_cache, make_key
+
+SPARQL_ENDPOINT = 'https://query.wikidata.org/sparql'
+
+
+class Fact(NamedTuple):
+    pid: str
+    kind: str  # 'quantity', 'item' or 'string'
+    multi: bool = False
+
+
+# Facts shown in the Quick Facts panel, in display order
+FACTS = {
+    'population': Fact('P1082', 'quantity'),
+    'area_km2': Fact('P2046', 'quantity'),
+    'gdp': Fact('P2131', 'quantity'),
+    'capital': Fact('P36', 'item'),
+    'currency': Fact('P38', 'item'),
+    'official_languages': Fact('P37', 'item', multi=True),
+    'head_of_state': Fact('P35', 'item'),
+    'time_zones': Fact('P421', 'item', multi=True),
+    'calling_code': Fact('P474', 'string'),
+    'neighbours': Fact('P47', 'item', multi=True),
+}
+
+# Sovereign states that still exist, as in country_index.COUNTRIES_QUERY
+ALL_COUNTRIES = """
+  ?country wdt:P31 wd:Q3624078 .
+  FILTER NOT EXISTS { ?country wdt:P576 [] }"""
+
+QUERY = """
+SELECT ?country ?title ?prop ?value ?valueLabel ?unitLabel ?normalized WHERE {
+  %(selector)s
+  OPTIONAL { ?article schema:about ?country ; schema:isPartOf <https://en.wikipedia.org/> ; schema:name ?title . }
+  VALUES ?prop { %(props)s }
+  ?prop wikibase:claim ?claim ; wikibase:statementProperty ?ps ; wikibase:statementValue ?psv .
+  ?country ?claim ?statement .
+  ?statement a wikibase:BestRank ; ?ps ?value .
+  OPTIONAL { ?statement ?psv ?node . ?node wikibase:quantityUnit ?unit . }
+  OPTIONAL {
+    ?prop wikibase:statementValueNormalized ?psn .
+    ?statement ?psn ?normalizedNode . ?normalizedNode wikibase:quantityAmount ?normalized .
+  }
+  SERVICE wikibase:label { bd:serviceParam wikibase:language "%(langs)s" . }
+}
+"""
+
+ENTITY_PREFIX = 'http://www.wikidata.org/entity/'
+
+QUERY_VARS = ['country', 'title', 'prop', 'value', 'valueLabel', 'unitLabel', 'normalized']
+
+
+def _literal(text: str) -> str:
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def build_query(lang: str = 'en', qid: Optional[str] = None, title: Optional[str] = None,
+                qids: Iterable[str] = (), titles: Iterable[str] = ()) -> str:
+    """SPARQL for the given countries (by QID or English article title) or, with none, all of them"""
+    qids = [qid] if qid else list(qids)
+    titles = [title] if title else list(titles)
+    if qids:
+        selector = "VALUES ?country { %s }" % ' '.join(f"wd:{q}" for q in qids)
+    elif titles:
+        names = ' '.join(f"{_literal(t)}@en" for t in titles)
+        selector = (f"VALUES ?name {{ {names} }}\n"
+                    "  ?countryArticle schema:about ?country ; schema:isPartOf <https://en.wikipedia.org/> ;"
+                    " schema:name ?name .")
+    else:
+        selector = ALL_COUNTRIES
+    props = ' '.join(f"wd:{fact.pid}" for fact in FACTS.values())
+    langs = lang if lang == 'en' else f"{lang},en"
+    return QUERY % {'selector': selector, 'props': props, 'langs': langs}
+
+
+def _number(text: str):
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+
+def _has_rows(response: Dict) -> bool:
+    return bool(response.get('results', {}).get('bindings'))
+
+
+def parse_bindings(bindings: List[Dict]) -> Dict[str, Dict]:
+    """Group SPARQL rows into a typed facts dict per QID
+
+    The English article title, when known, is kept under ``'title'``.
+    """
+    by_pid = {fact.pid: (name, fact) for name, fact in FACTS.items()}
+    countries: Dict[str, Dict] = {}
+    for row in bindings:
+        qid = row['country']['value'][len(ENTITY_PREFIX):]
+        facts = countries.setdefault(qid, {'qid': qid})
+        if 'title' in row:
+            facts.setdefault('title', row['title']['value'])
+        name, fact = by_pid[row['prop']['value'][len(ENTITY_PREFIX):]]
+
+        if fact.kind == 'quantity':
+            if name == 'area_km2' and 'normalized' in row:
+                value = round(float(row['normalized']['value']) / 1e6, 1)  # m² -> km²
+            else:
+                value = _number(row['value']['value'])
+                unit = row.get('unitLabel', {}).get('value')
+                if unit and unit != '1' and name != 'population':
+                    facts.setdefault(f"{name}_unit", unit)
+        elif fact.kind == 'item':
+            value = row.get('valueLabel', row['value'])['value']
+        else:
+            value = row['value']['value']
+
+        if fact.multi:
+            values = facts.setdefault(name, [])
+            if value not in values:
+                values.append(value)
+        else:
+            facts.setdefault(name, value)
+    return countries
+
+
+class FactsEngine:
+    """Typed country facts, one SPARQL round trip per country at most
+
+    ``query(sparql)`` runs a query and returns the parsed SPARQL JSON.
+    """
+
+    def __init__(self, query: Callable[[str], Dict], cache: Optional[ResponseCache] = None,
+                 index: Optional[CountryIndex] = None):
+        self.query = query
+        self.cache = cache or get_cache()
+        self.index = index or get_country_index()
+
+    def _request(self, lang: str, qid: Optional[str] = None, title: Optional[str] = None) -> Dict:
+        return {'query': build_query(lang, qid=qid, title=title), 'format': 'json'}
+
+    def _request_for(self, country: str, lang: str) -> Dict:
+        # A known QID makes the query cheaper than matching the article title
+        qid = self.index.find(country)
+        return self._request(lang, qid=qid) if qid else self._request(lang, title=country)
+
+    def _store(self, params: Dict, lang: str, rows: List[Dict]):
+        """Cache rows as the response to one country's own query, which the warmer can replay"""
+        response = {'head': {'vars': QUERY_VARS}, 'results': {'bindings': rows}}
+        key = make_key(SPARQL_ENDPOINT, params, lang)
+        self.cache.set(key, response, 'wikidata', SPARQL_ENDPOINT, params, lang)
+
+    def get(self, country: str, lang: str = 'en') -> Dict:
+        """Return the facts for a country name (empty if Wikidata doesn't know it)"""
+        params = self._request_for(country, lang)
+        # The raw SPARQL response is cached as an ordinary request, so the
+        # warmer refreshes it; empty answers aren't cached at all
+        data = self.cache.get_or_fetch('wikidata', SPARQL_ENDPOINT, params, lang,
+                                       lambda: self.query(params['query']), cache_if=_has_rows)
+        return next(iter(parse_bindings(data['results']['bindings']).values()), {})
+
+    def get_many(self, countries: Iterable[str], lang: str = 'en') -> Dict[str, Dict]:
+        """Facts for several country names, with one query for all that aren't cached
+
+        Countries the local index knows are queried by QID and the rest by
+        English article title. The answer is split per country and cached
+        as the response to that country's own query, as :meth:`get` would.
+        """
+        results: Dict[str, Dict] = {}
+        by_qid: Dict[str, str] = {}
+        by_title: Dict[str, str] = {}
+        for country in dict.fromkeys(countries):
+            params = self._request_for(country, lang)
+            cached = self.cache.peek(SPARQL_ENDPOINT, params, lang)
+            if cached is not None:
+                results[country] = next(iter(parse_bindings(cached['results']['bindings']).values()), {})
+                continue
+            qid = self.index.find(country)
+            if qid:
+                by_qid[qid] = country
+            else:
+                by_title[country] = country
+
+        rows: Dict[str, List[Dict]] = {}
+        if by_qid:
+            for row in self.query(build_query(lang, qids=by_qid))['results']['bindings']:
+                rows.setdefault(by_qid.get(row['country']['value'][len(ENTITY_PREFIX):]), []).append(row)
+        if by_title:
+            for row in self.query(build_query(lang, titles=by_title))['results']['bindings']:
+                rows.setdefault(by_title.get(row.get('title', {}).get('value')), []).append(row)
+
+        for country in list(by_qid.values()) + list(by_title.values()):
+            country_rows = rows.get(country, [])
+            if country_rows:
+                self._store(self._request_for(country, lang), lang, country_rows)
+            results[country] = next(iter(parse_bindings(country_rows).values()), {})
+        return results
+
+    def precompute(self, lang: str = 'en') -> int:
+        """Fetch every country's facts in one bulk query and cache them by QID and English title"""
+        rows: Dict[str, List[Dict]] = {}
+        titles: Dict[str, str] = {}
+        for row in self.query(build_query(lang))['results']['bindings']:
+            qid = row['country']['value'][len(ENTITY_PREFIX):]
+            rows.setdefault(qid, []).append(row)
+            if 'title' in row:
+                titles.setdefault(qid, row['title']['value'])
+        for qid, country_rows in rows.items():
+            self._store(self._request(lang, qid=qid), lang, country_rows)
+            if qid in titles:
+                self._store(self._request(lang, title=titles[qid]), lang, country_rows)
+        return len(rows)
+
+
+def sparql_query(get_json: Optional[Callable[[str, Dict], Dict]] = None) -> Callable[[str], Dict]:
+    """Return a function running a query against the Wikidata Query Service"""
+    if get_json is None:
+        from http_client import get_wikimedia_client
+        get_json = get_wikimedia_client().get_json
+
+    def query(sparql: str) -> Dict:
+        return get_json(SPARQL_ENDPOINT, {'query': sparql, 'format': 'json'})
+    return query
+
+
+_engine: Optional[FactsEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_facts_engine() -> FactsEngine:
+    """Return the process-wide facts engine"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = FactsEngine(sparql_query())
+        return _engine
+
+
+def main(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description='Precompute quick facts for every country')
+    parser.add_argument('--langs', nargs='+', default=['en'], help='label languages')
+    args = parser.parse_args(argv)
+    from http_client import WikimediaClient
+
+    # The bulk query takes far longer than the app's read timeout allows
+    engine = FactsEngine(sparql_query(WikimediaClient(read_timeout=120).get_json))
+    for lang in args.langs:
+        print(f"[{lang}] cached facts for {engine.precompute(lang)} countries")
+
+
+if __name__ == '__main__':
+    main()
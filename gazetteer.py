@@ -0,0 +1,157 @@
+"""Offline geocoding backend built from a GeoNames or OSM extract
+
+Select it with ``EXPLORER_GEOCODER=local`` and point ``EXPLORER_GAZETTEER``
+at either
+
+- a GeoNames dump (``allCountries.txt``, ``FR.txt``, ...; tab separated), or
+- a CSV with ``name,lat,lon,category,country_code[,address]`` columns, e.g.
+  exported from an OSM extract, where ``category`` is one of the place type
+  keys below.
+
+Only rows for the supported place types are kept, so even the full GeoNames
+dump loads into a modest amount of memory.
+"""
+
+import csv
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from country_index import get_country_index
+from geocoding import GeocodingBackend, normalize_place_type
+
+# GeoNames feature codes for each place type
+FEATURE_CODES = {
+    'restaurants': {'REST'},
+    'temples': {'TMPL', 'PGDA', 'SHRN'},
+    'tourist_attractions': {'MNMT', 'MUS', 'CSTL', 'PAL', 'RUIN', 'HSTS', 'ZOO', 'AMUS', 'GDN'},
+    'hotels': {'HTL'},
+    'transportation': {'AIRP', 'RSTN', 'RSTP', 'MTRO'},
+}
+PLACE_TYPE_BY_CODE = {code: place_type for place_type, codes in FEATURE_CODES.items() for code in codes}
+
+GEOHASH_PRECISION = 4
+# Cell size in degrees at that precision
+CELL_HEIGHT = 180 / 2 ** 10
+CELL_WIDTH = 360 / 2 ** 10
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def _read_geonames(path: str) -> Iterator[Tuple[str, float, float, str, str, str]]:
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            cols = line.rstrip('\n').split('\t')
+            if len(cols) < 9:
+                continue
+            place_type = PLACE_TYPE_BY_CODE.get(cols[7])
+            if place_type:
+                yield cols[1], float(cols[4]), float(cols[5]), place_type, cols[8], ''
+
+
+def _read_csv(path: str) -> Iterator[Tuple[str, float, float, str, str, str]]:
+    with open(path, encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            place_type = normalize_place_type(row.get('category', ''))
+            if place_type in FEATURE_CODES:
+                yield (row['name'], float(row['lat']), float(row['lon']), place_type,
+                       row.get('country_code', '').upper(), row.get('address', ''))
+
+
+class GazetteerBackend(GeocodingBackend):
+    """In-memory places index with tag and geohash lookups
+
+    Places are stored column-wise; the tag index maps (place type, country
+    code) to row numbers and the spatial index maps geohash cells to row
+    numbers, so queries never scan the whole table.
+    """
+
+    default_limit = 500
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.addresses: List[str] = []
+        self.lats: List[float] = []
+        self.lons: List[float] = []
+        self.place_types: List[str] = []
+        self.by_tag: Dict[Tuple[str, str], List[int]] = {}
+        self.by_cell: Dict[str, List[int]] = {}
+        self.country_index = get_country_index()
+
+    @classmethod
+    def load(cls, path: str) -> 'GazetteerBackend':
+        backend = cls()
+        rows = _read_csv(path) if path.endswith('.csv') else _read_geonames(path)
+        for name, lat, lon, place_type, country_code, address in rows:
+            backend.add(name, lat, lon, place_type, country_code, address)
+        return backend
+
+    def add(self, name: str, lat: float, lon: float, place_type: str,
+            country_code: str, address: str = ''):
+        row = len(self.names)
+        self.names.append(name)
+        self.addresses.append(address or f"{name}, {country_code}")
+        self.lats.append(lat)
+        self.lons.append(lon)
+        self.place_types.append(place_type)
+        self.by_tag.setdefault((place_type, country_code), []).append(row)
+        self.by_cell.setdefault(geohash(lat, lon), []).append(row)
+
+    def _place(self, row: int) -> Dict:
+        return {
+            'name': self.names[row],
+            'address': self.addresses[row],
+            'lat': self.lats[row],
+            'lon': self.lons[row],
+        }
+
+    def find_country(self, country: str) -> Optional[Tuple[float, float]]:
+        # Centroids live in the country index; the gazetteer only holds places
+        return self.country_index.get_coords(country)
+
+    def find_places(self, country: str, place_type: str, limit: Optional[int] = None) -> List[Dict]:
+        country_code = self.country_index.get_iso2(country) or country.upper()
+        rows = self.by_tag.get((normalize_place_type(place_type), country_code), [])
+        return [self._place(row) for row in rows[:limit or self.default_limit]]
+
+    def find_in_bbox(self, south: float, west: float, north: float, east: float,
+                     place_type: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        """Return places inside a bounding box, optionally of one place type"""
+        place_type = normalize_place_type(place_type) if place_type else None
+        limit = limit or self.default_limit
+        cells = set()
+        lat = south
+        while lat < north + CELL_HEIGHT:
+            lon = west
+            while lon < east + CELL_WIDTH:
+                cells.add(geohash(min(lat, north), min(lon, east)))
+                lon += CELL_WIDTH
+            lat += CELL_HEIGHT
+
+        places = []
+        for cell in cells:
+            for row in self.by_cell.get(cell, ()):
+                if place_type is not None and self.place_types[row] != place_type:
+                    continue
+                if south <= self.lats[row] <= north and west <= self.lons[row] <= east:
+                    places.append(self._place(row))
+                    if len(places) >= limit:
+                        return places
+        return places
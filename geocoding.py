@@ -0,0 +1,329 @@
+"""Geocoding backends for LocationFinder and the Nominatim request scheduler
+
+LocationFinder talks to a GeocodingBackend: NominatimBackend (the default)
+or the offline GazetteerBackend in gazetteer.py.
+
+Nominatim's usage policy allows one request per second per application.
+Every LocationFinder in the process submits through one scheduler that
+
+- spaces requests with a token bucket (shared by every replica when
+  ``EXPLORER_SHARED_STORE`` is set),
+- coalesces identical in-flight queries into a single request,
+- serves country-centre lookups ahead of places searches, and
+- rejects new work once its queue is full instead of piling up.
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from metrics import get_metrics
+from response_cache import get_cache
+from shared_store import SharedTokenBucket, get_shared_store
+
+logger = logging.getLogger(__name__)
+
+# Lower numbers are served first
+PRIORITY_CENTER = 0
+PRIORITY_PLACES = 1
+PRIORITY_WARM = 2  # background refreshes from warmer.py
+
+NOMINATIM_USER_AGENT = "country_explorer"
+
+# Free-text Nominatim queries for each place type
+NOMINATIM_QUERIES = {
+    'restaurants': 'restaurant in {country}',
+    'temples': 'temple in {country}',
+    'tourist_attractions': 'tourist attraction in {country}',
+    'transportation': 'airport OR "train station" in {country}',
+    'hotels': 'hotel in {country}',
+}
+
+
+class QueueFullError(Exception):
+    """Raised when the geocoding queue is at capacity"""
+
+
+class TokenBucket:
+    """Blocking token bucket: ``rate`` tokens per second, up to ``capacity``"""
+
+    def __init__(self, rate: float = 1.0, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until it's available; returns the time waited"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class GeocodeScheduler:
+    """Serialise geocoding requests through one polite worker thread"""
+
+    def __init__(self, geocode: Callable[..., List[Dict]], rate: float = 1.0,
+                 burst: float = 1.0, max_queue: int = 100, bucket=None):
+        self._geocode = geocode
+        # A shared bucket falls back to the local one while its store fails
+        self._local_bucket = TokenBucket(rate, burst)
+        self.bucket = bucket or self._local_bucket
+        self.max_queue = max_queue
+
+        self._queue: List[tuple] = []
+        self._inflight: Dict[tuple, Future] = {}
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._latencies = deque(maxlen=1000)
+        self.counters = {'submitted': 0, 'coalesced': 0, 'rejected': 0, 'completed': 0, 'failed': 0,
+                         'bucket_errors': 0}
+
+        self._worker = threading.Thread(target=self._run, name="geocode-scheduler", daemon=True)
+        self._worker.start()
+
+    def submit(self, query: str, priority: int = PRIORITY_PLACES, **kwargs) -> Future:
+        """Queue a geocode and return a Future for its results"""
+        key = (query, tuple(sorted(kwargs.items())))
+        with self._cond:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.counters['coalesced'] += 1
+                return future
+            if len(self._queue) >= self.max_queue:
+                self.counters['rejected'] += 1
+                raise QueueFullError(f"Geocoding queue is full ({self.max_queue} pending)")
+            future = Future()
+            self._inflight[key] = future
+            heapq.heappush(self._queue, (priority, next(self._order), key, time.monotonic()))
+            self.counters['submitted'] += 1
+            self._cond.notify()
+            return future
+
+    def geocode(self, query: str, priority: int = PRIORITY_PLACES,
+                wait: Optional[float] = 60, **kwargs) -> List[Dict]:
+        """Geocode ``query`` through the queue, blocking for at most ``wait`` seconds"""
+        return self.submit(query, priority, **kwargs).result(timeout=wait)
+
+    def _acquire(self):
+        try:
+            self.bucket.acquire()
+        except Exception:
+            if self.bucket is self._local_bucket:
+                raise
+            logger.exception("Shared rate limit unavailable, limiting this process only")
+            with self._cond:
+                self.counters['bucket_errors'] += 1
+            self._local_bucket.acquire()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                _, _, key, queued_at = heapq.heappop(self._queue)
+                future = self._inflight[key]
+
+            query, kwargs = key
+            try:
+                # Inside the try: if even waiting for a token fails, the
+                # request fails rather than the only worker thread
+                self._acquire()
+                result = self._geocode(query, **dict(kwargs))
+            except Exception as e:
+                with self._cond:
+                    self.counters['failed'] += 1
+                    del self._inflight[key]
+                future.set_exception(e)
+            else:
+                with self._cond:
+                    self.counters['completed'] += 1
+                    del self._inflight[key]
+                future.set_result(result)
+            self._latencies.append(time.monotonic() - queued_at)
+
+    def metrics(self) -> Dict:
+        """Return queue depth, counters and end-to-end latency percentiles"""
+        with self._cond:
+            latencies = list(self._latencies)
+            return dict(
+                self.counters,
+                queue_depth=len(self._queue),
+                in_flight=len(self._inflight),
+                latency_p50=_percentile(latencies, 50),
+                latency_p99=_percentile(latencies, 99),
+            )
+
+
+def nominatim_search(user_agent: str = NOMINATIM_USER_AGENT) -> Callable[..., List[Dict]]:
+    """Return a function running a Nominatim search as plain dicts
+
+    ``EXPLORER_NOMINATIM_BASE=http://127.0.0.1:8765`` sends searches to a
+    local stub server as ``/nominatim.openstreetmap.org/search``.
+    """
+    from geopy.geocoders import Nominatim
+
+    base = os.environ.get('EXPLORER_NOMINATIM_BASE', '').rstrip('/')
+    if base:
+        scheme, _, host = base.partition('://')
+        geolocator = Nominatim(user_agent=user_agent, scheme=scheme,
+                               domain=f"{host}/nominatim.openstreetmap.org")
+    else:
+        geolocator = Nominatim(user_agent=user_agent)
+
+    def search(query: str, limit: int = 1, timeout: int = 10,
+               viewbox: Optional[Sequence[float]] = None) -> List[Dict]:
+        """``viewbox`` is ``[south, west, north, east]``; results are kept inside it"""
+        bounds = {}
+        if viewbox:
+            south, west, north, east = viewbox
+            bounds = {'viewbox': [(south, west), (north, east)], 'bounded': True}
+        with get_metrics().timer('http.nominatim'):
+            results = geolocator.geocode(query, exactly_one=False, limit=limit, timeout=timeout, **bounds)
+        return [
+            {'address': r.address, 'lat': r.latitude, 'lon': r.longitude}
+            for r in results
+        ] if results else []
+    return search
+
+
+def normalize_place_type(place_type: str) -> str:
+    """Map UI labels such as 'tourist attractions' onto place type keys"""
+    return place_type.strip().lower().replace(' ', '_')
+
+
+class GeocodingBackend(ABC):
+    """Where LocationFinder gets country centres and places of interest from"""
+
+    # Places returned when the caller doesn't ask for a specific number
+    default_limit = 5
+
+    @abstractmethod
+    def find_country(self, country: str) -> Optional[Tuple[float, float]]:
+        """Return a country's centre as (lat, lon)"""
+
+    @abstractmethod
+    def find_places(self, country: str, place_type: str, limit: Optional[int] = None) -> List[Dict]:
+        """Return places as dicts with ``name``, ``address``, ``lat`` and ``lon``"""
+
+    @abstractmethod
+    def find_in_bbox(self, south: float, west: float, north: float, east: float,
+                     place_type: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        """Return places inside a bounding box, as find_places does for a country"""
+
+
+class NominatimBackend(GeocodingBackend):
+    """The public Nominatim service, behind the response cache and scheduler"""
+
+    def __init__(self, scheduler: Optional[GeocodeScheduler] = None):
+        self.scheduler = scheduler or get_geocode_scheduler()
+        self.cache = get_cache()
+
+    def _geocode(self, query: str, limit: int = 1, timeout: int = 10,
+                 priority: int = PRIORITY_PLACES, viewbox: Optional[Sequence[float]] = None) -> List[Dict]:
+        params = {'q': query, 'limit': limit}
+        kwargs = {'limit': limit, 'timeout': timeout}
+        if viewbox:
+            # Rounded so the key (and Nominatim's own cache) is stable per tile
+            kwargs['viewbox'] = tuple(round(v, 6) for v in viewbox)
+            params['viewbox'] = list(kwargs['viewbox'])
+        return self.cache.get_or_fetch(
+            'nominatim', 'search', params, '',
+            lambda: self.scheduler.geocode(query, priority, **kwargs)
+        )
+
+    @staticmethod
+    def _places(results: List[Dict]) -> List[Dict]:
+        return [
+            {
+                'name': r['address'].split(',')[0],
+                'address': r['address'],
+                'lat': r['lat'],
+                'lon': r['lon'],
+            } for r in results
+        ]
+
+    def find_country(self, country: str) -> Optional[Tuple[float, float]]:
+        results = self._geocode(country, priority=PRIORITY_CENTER)
+        return (results[0]['lat'], results[0]['lon']) if results else None
+
+    def find_places(self, country: str, place_type: str, limit: Optional[int] = None) -> List[Dict]:
+        place_type = normalize_place_type(place_type)
+        query = NOMINATIM_QUERIES.get(place_type, '{place_type} in {country}').format(
+            country=country, place_type=place_type.replace('_', ' '))
+        results = self._geocode(query, limit=limit or self.default_limit, timeout=15)
+        return self._places(results)
+
+    def find_in_bbox(self, south: float, west: float, north: float, east: float,
+                     place_type: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        # The country-wide query without its "in {country}" part, bounded to the box
+        place_type = normalize_place_type(place_type or 'tourist_attractions')
+        query = NOMINATIM_QUERIES.get(place_type, '{place_type} in {country}')
+        query = query.replace(' in {country}', '').format(place_type=place_type.replace('_', ' '))
+        results = self._geocode(query, limit=limit or self.default_limit, timeout=15,
+                                viewbox=[south, west, north, east])
+        return self._places(results)
+
+
+_backend: Optional[GeocodingBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_geocoding_backend() -> GeocodingBackend:
+    """Return the process-wide backend chosen by ``EXPLORER_GEOCODER``
+
+    ``nominatim`` (the default) uses the public service; ``local`` loads the
+    offline gazetteer from ``EXPLORER_GAZETTEER``.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if os.environ.get('EXPLORER_GEOCODER', 'nominatim') == 'local':
+                from gazetteer import GazetteerBackend
+                _backend = GazetteerBackend.load(os.environ['EXPLORER_GAZETTEER'])
+            else:
+                _backend = NominatimBackend()
+        return _backend
+
+
+_scheduler: Optional[GeocodeScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_geocode_scheduler() -> GeocodeScheduler:
+    """Return the process-wide Nominatim scheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            # Requests per second; only raise it against a local stub server
+            rate = float(os.environ.get('EXPLORER_NOMINATIM_RATE', 1.0))
+            burst = max(1.0, rate)
+            store = get_shared_store()
+            bucket = SharedTokenBucket(store, 'nominatim', rate, burst) if store else None
+            _scheduler = GeocodeScheduler(nominatim_search(), rate=rate, burst=burst, bucket=bucket)
+            get_metrics().register('nominatim', _scheduler.metrics)
+        return _scheduler
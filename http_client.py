@@ -0,0 +1,198 @@
+"""Async HTTP client for the Wikimedia APIs
+
+One ``httpx.AsyncClient`` per host keeps a keep-alive pool (and an HTTP/2
+connection when the ``h2`` package is installed) for each of the
+``*.wikipedia.org``, ``*.wikivoyage.org`` and ``www.wikidata.org`` hosts.
+Requests get separate connect/read timeouts, are retried with jittered
+exponential backoff on 429/5xx and ``maxlag`` errors, and honour
+``Retry-After``.
+
+Async callers use :meth:`WikimediaClient.get_json_async`. Synchronous code
+(the Streamlit apps) calls :meth:`WikimediaClient.get_json`, which runs the
+request on a single background event loop, so many sessions share a few
+pooled connections instead of a thread and socket each.
+
+Set ``EXPLORER_WIKIMEDIA_BASE=http://127.0.0.1:8765`` to send every request
+to a local stub server instead; ``https://en.wikipedia.org/w/api.php`` is
+then requested as ``http://127.0.0.1:8765/en.wikipedia.org/w/api.php``.
+"""
+
+import asyncio
+import importlib.util
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from metrics import get_metrics
+
+USER_AGENT = 'CountryExplorer/1.0 (https://huggingface.co/spaces/)'
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a ``Retry-After`` header: delay-seconds or an HTTP date"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def stage_name(host: str) -> str:
+    """Metrics stage for a host: ``en.wikipedia.org`` -> ``http.wikipedia``"""
+    parts = host.split('.')
+    return f"http.{parts[-2] if len(parts) >= 2 else host}"
+
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+
+class WikimediaClient:
+    """Pooled async client with retries and a synchronous facade"""
+
+    def __init__(self, user_agent: str = USER_AGENT, connect_timeout: float = 3.05,
+                 read_timeout: float = 10.0, max_retries: int = 3, backoff: float = 0.5,
+                 max_backoff: float = 10.0, maxlag: Optional[int] = 5,
+                 max_connections_per_host: int = 10, base_url: Optional[str] = None):
+        self.user_agent = user_agent
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.maxlag = maxlag
+        self.limits = httpx.Limits(
+            max_connections=max_connections_per_host,
+            max_keepalive_connections=max_connections_per_host,
+        )
+        self.base_url = (base_url or os.environ.get('EXPLORER_WIKIMEDIA_BASE', '')).rstrip('/')
+        self.retries = 0
+
+        # Keyed by (event loop, host): an AsyncClient can only be used from
+        # the loop that created it
+        self._clients: Dict[tuple, httpx.AsyncClient] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    def _client(self, host: str) -> httpx.AsyncClient:
+        key = (asyncio.get_running_loop(), host)
+        client = self._clients.get(key)
+        if client is None:
+            client = httpx.AsyncClient(
+                headers={'User-Agent': self.user_agent},
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=HTTP2_AVAILABLE and not self.base_url,
+            )
+            self._clients[key] = client
+        return client
+
+    def _target(self, url: str) -> str:
+        if not self.base_url:
+            return url
+        parts = urlsplit(url)
+        return f"{self.base_url}/{parts.netloc}{parts.path}"
+
+    def _delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None:
+            retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return min(retry_after, self.max_backoff)
+        # Exponential backoff with +/-50% jitter
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    async def get_json_async(self, url: str, params: Dict) -> Dict:
+        """GET ``url`` and return its JSON body, retrying transient failures"""
+        return await self._fetch(url, params, as_json=True)
+
+    async def get_bytes_async(self, url: str, params: Optional[Dict] = None) -> bytes:
+        """GET ``url`` and return the raw body, e.g. an image"""
+        return await self._fetch(url, params or {}, as_json=False)
+
+    async def _fetch(self, url: str, params: Dict, as_json: bool):
+        params = dict(params)
+        if self.maxlag is not None and url.endswith('api.php'):
+            params.setdefault('maxlag', self.maxlag)
+        host = urlsplit(url).netloc
+        client = self._client(host)
+        target = self._target(url)
+        stage = stage_name(host)
+        metrics = get_metrics()
+
+        attempt = 0
+        while True:
+            response = None
+            start = time.perf_counter()
+            try:
+                response = await client.get(target, params=params)
+            except (httpx.TransportError, httpx.TimeoutException):
+                metrics.observe(stage, time.perf_counter() - start, error=True)
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                metrics.observe(stage, time.perf_counter() - start, len(response.content),
+                                error=response.status_code >= 400)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    if not as_json:
+                        return response.content
+                    data = response.json()
+                    if not (isinstance(data, dict) and data.get('error', {}).get('code') == 'maxlag'):
+                        return data
+                if attempt >= self.max_retries:
+                    response.raise_for_status()
+                    raise httpx.HTTPError(f"Server lagged too long: {url}")
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(self._delay(attempt, response))
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._loop.run_forever, name='wikimedia-http', daemon=True)
+                thread.start()
+            return self._loop
+
+    def get_json(self, url: str, params: Dict) -> Dict:
+        """Blocking wrapper around :meth:`get_json_async` for synchronous code"""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self.get_json_async(url, params), loop).result()
+
+    def get_bytes(self, url: str, params: Optional[Dict] = None) -> bytes:
+        """Blocking wrapper around :meth:`get_bytes_async`"""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self.get_bytes_async(url, params), loop).result()
+
+    async def aclose(self):
+        """Close the pools belonging to the running event loop"""
+        loop = asyncio.get_running_loop()
+        for key in [key for key in self._clients if key[0] is loop]:
+            await self._clients.pop(key).aclose()
+
+
+_client: Optional[WikimediaClient] = None
+_client_lock = threading.Lock()
+
+
+def get_wikimedia_client() -> WikimediaClient:
+    """Return the process-wide Wikimedia client"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = WikimediaClient()
+            get_metrics().register('http', lambda: {'retries': _client.retries})
+        return _client
@@ -0,0 +1,85 @@
+"""On-disk cache for article image bytes
+
+Full-resolution images are only downloaded when a user asks for them. They
+are then kept as files under ``<cache dir>/images``, so the next viewer is
+served locally. The least recently used files are deleted once the
+directory exceeds ``max_bytes``.
+"""
+
+import os
+import tempfile
+import threading
+from hashlib import sha1
+from typing import Callable, Optional
+
+from response_cache import DEFAULT_CACHE_DIR
+
+
+class ImageCache:
+    """Image bytes by URL, fetched once and then read from disk"""
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = 256 * 1024 * 1024,
+                 fetch: Optional[Callable[[str], bytes]] = None):
+        if directory is None:
+            directory = os.path.join(os.environ.get('EXPLORER_CACHE_DIR', DEFAULT_CACHE_DIR), 'images')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if fetch is None:
+            from http_client import get_wikimedia_client
+            fetch = get_wikimedia_client().get_bytes
+        self.fetch = fetch
+        self._lock = threading.Lock()
+
+    def _path(self, url: str) -> str:
+        ext = os.path.splitext(url.split('?')[0])[1][:5].lower()
+        return os.path.join(self.directory, sha1(url.encode('utf-8')).hexdigest() + ext)
+
+    def get(self, url: str) -> bytes:
+        """Return the image at ``url``, downloading it on first use"""
+        path = self._path(url)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # mark as recently used
+            return data
+        except FileNotFoundError:
+            pass
+
+        data = self.fetch(url)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._evict()
+        return data
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and not entry.name.endswith('.part'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+_cache: Optional[ImageCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageCache:
+    """Return the process-wide image cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImageCache()
+        return _cache
@@ -0,0 +1,128 @@
+"""Place markers for folium maps that stay light with thousands of places
+
+Up to FAST_MAP_THRESHOLD places get one ``folium.Marker`` with its own HTML
+popup, as before. Above it the places go into a single FastMarkerCluster:
+the coordinates, names and addresses are serialised once as a JS array,
+markers are canvas circle markers created on the client, and each popup is
+only built when it is opened. Layers for st_folium (:func:`places_layer`)
+use a single GeoJSON array instead, because a layer swapped into a map
+already on the page can't bring plugin scripts with it.
+
+Places may be a list of dicts or a places.PlaceSet; either way the markers
+are built from its coordinate and string arrays.
+"""
+
+import html
+import json
+import os
+from typing import Dict, Iterable, List, Union
+
+import folium
+from folium.plugins import FastMarkerCluster
+
+from places import PlaceSet
+
+Places = Union[PlaceSet, Iterable[Dict]]
+
+FAST_MAP_THRESHOLD = int(os.environ.get('EXPLORER_FAST_MAP_THRESHOLD', 100))
+
+# Runs in the browser once per row of the data array
+_MARKER_CALLBACK = """
+function (row) {
+    function esc(text) {
+        return String(text).replace(/[&<>"']/g, function (c) {
+            return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+        });
+    }
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+        radius: 6, color: %s, fillOpacity: 0.8, weight: 1
+    });
+    marker.bindPopup(function () {
+        return '<b>' + esc(row[2]) + '</b><br>' + esc(row[3]);
+    });
+    return marker;
+}
+"""
+
+
+def use_fast_path(places: PlaceSet) -> bool:
+    return len(places) > FAST_MAP_THRESHOLD
+
+
+def new_map(center, places: Places, zoom_start: int = 6) -> folium.Map:
+    """Create the base map, rendering vectors to canvas for large place sets"""
+    places = PlaceSet.coerce(places)
+    return folium.Map(location=center, zoom_start=zoom_start, prefer_canvas=use_fast_path(places))
+
+
+def add_places(m: folium.Map, places: Places, color: str):
+    """Add markers for ``places`` using whichever path suits their number"""
+    places = PlaceSet.coerce(places)
+    if not use_fast_path(places):
+        for lat, lon, name, address in places.rows():
+            folium.Marker(
+                [lat, lon],
+                popup=f"<b>{name}</b><br>{address}",
+                icon=folium.Icon(color=color)
+            ).add_to(m)
+        return m
+
+    data = [list(row) for row in places.rows()]
+    FastMarkerCluster(data, callback=_MARKER_CALLBACK % json.dumps(color)).add_to(m)
+    return m
+
+
+def places_layer(places: Places, color: str, name: str = 'Places') -> folium.FeatureGroup:
+    """Markers for ``places`` as a feature group that st_folium can swap in without reloading the map
+
+    Large sets become one GeoJSON layer: the places are serialised once as
+    a single array, drawn as canvas circle markers by the browser and share
+    one popup function, and the layer needs no plugin on the page.
+    """
+    places = PlaceSet.coerce(places)
+    layer = folium.FeatureGroup(name=name)
+    if not use_fast_path(places):
+        return add_places(layer, places, color)
+    features = [
+        {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+         'properties': {'name': html.escape(place), 'address': html.escape(address)}}
+        for lat, lon, place, address in places.rows()
+    ]
+    folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': features},
+        marker=folium.CircleMarker(radius=5, color=color, weight=1, fill=True, fill_opacity=0.8),
+        popup=folium.GeoJsonPopup(fields=['name', 'address'], labels=False)
+    ).add_to(layer)
+    return layer
+
+
+# Layer colour of each compared country, in order
+COMPARE_COLORS = ['blue', 'red', 'green', 'purple', 'orange', 'darkred', 'cadetblue', 'darkgreen']
+
+
+def comparison_map(bundles: List[Dict]) -> folium.Map:
+    """One map for several countries, each with its centre and places on its own toggleable layer
+
+    ``bundles`` are the per-country bundles of ``Explorer.compare``.
+    """
+    located = [b for b in bundles if b.get('coords')]
+    m = folium.Map(location=located[0]['coords'] if located else (20, 0), zoom_start=3,
+                   prefer_canvas=any(use_fast_path(PlaceSet.coerce(b['places'])) for b in located))
+    for i, bundle in enumerate(located):
+        color = COMPARE_COLORS[i % len(COMPARE_COLORS)]
+        layer = places_layer(bundle['places'], color, name=bundle['country'])
+        folium.Marker(
+            bundle['coords'],
+            popup=html.escape(bundle['country']),
+            icon=folium.Icon(color=color, icon='star')
+        ).add_to(layer)
+        layer.add_to(m)
+    if len(located) > 1:
+        m.fit_bounds([b['coords'] for b in located], padding=(30, 30))
+    folium.LayerControl(collapsed=False).add_to(m)
+    return m
+
+
+def to_html(m: folium.Map) -> str:
+    """Render a map to the standalone HTML that folium_static would embed"""
+    return folium.Figure().add_child(m).render()
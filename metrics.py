@@ -0,0 +1,245 @@
+"""Per-stage latency, payload size and error metrics
+
+Code under measurement wraps a stage in :meth:`Metrics.timer` (or decorates
+it with :func:`timed`). Each stage keeps a rolling window of its most recent
+observations, from which :meth:`Metrics.snapshot` reports p50/p95/p99.
+Counters owned elsewhere (response cache hits, HTTP retries, the Nominatim
+queue) are pulled in through registered collectors.
+
+Exports:
+
+- :meth:`Metrics.to_prometheus` renders the Prometheus text format, served
+  on ``EXPLORER_METRICS_PORT`` when :func:`start_http_server` is called;
+- every observation is appended to ``EXPLORER_METRICS_LOG`` as a JSON line
+  when that variable is set.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+# Observations kept per stage
+WINDOW = int(os.environ.get('EXPLORER_METRICS_WINDOW', 2048))
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Metrics:
+    """Rolling per-stage observations plus pluggable counter collectors"""
+
+    def __init__(self, window: int = WINDOW, log_path: Optional[str] = None):
+        self.window = window
+        self.log_path = log_path or os.environ.get('EXPLORER_METRICS_LOG')
+        self._stages: Dict[str, deque] = {}
+        self._totals: Dict[str, Dict[str, float]] = {}
+        self._collectors: Dict[str, Callable[[], Dict]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float, size: Optional[int] = None, error: bool = False):
+        """Record one call of ``stage``"""
+        now = time.time()
+        with self._lock:
+            samples = self._stages.get(stage)
+            if samples is None:
+                samples = self._stages[stage] = deque(maxlen=self.window)
+                self._totals[stage] = {'count': 0, 'errors': 0, 'seconds': 0.0, 'bytes': 0}
+            samples.append((seconds, size))
+            totals = self._totals[stage]
+            totals['count'] += 1
+            totals['errors'] += int(error)
+            totals['seconds'] += seconds
+            totals['bytes'] += size or 0
+            if self.log_path:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'ts': now, 'stage': stage, 'seconds': seconds,
+                                        'bytes': size, 'error': error}) + '\n')
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Time the block as one call of ``stage``
+
+        Yields a dict; set ``'size'`` on it to record the payload size.
+        Exceptions are counted as errors and re-raised.
+        """
+        info = {'size': None}
+        start = time.perf_counter()
+        try:
+            yield info
+        except BaseException:
+            self.observe(stage, time.perf_counter() - start, info['size'], error=True)
+            raise
+        self.observe(stage, time.perf_counter() - start, info['size'])
+
+    def register(self, name: str, collector: Callable[[], Dict]):
+        """Include ``collector()``'s numeric values as counters named ``name.<key>``"""
+        with self._lock:
+            self._collectors[name] = collector
+
+    def counters(self) -> Dict[str, float]:
+        with self._lock:
+            collectors = dict(self._collectors)
+        values = {}
+        for name, collector in collectors.items():
+            try:
+                collected = collector()
+            except Exception:
+                continue
+            for key, value in collected.items():
+                if isinstance(value, (int, float)):
+                    values[f"{name}.{key}"] = value
+        return values
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Per-stage totals and percentiles over the rolling window"""
+        with self._lock:
+            stages = {stage: (list(samples), dict(self._totals[stage]))
+                      for stage, samples in self._stages.items()}
+        result = {}
+        for stage, (samples, totals) in sorted(stages.items()):
+            seconds = [s for s, _ in samples]
+            sizes = [b for _, b in samples if b is not None]
+            row = dict(totals)
+            for pct in PERCENTILES:
+                row[f'p{pct}'] = percentile(seconds, pct)
+            row['mean_bytes'] = sum(sizes) / len(sizes) if sizes else 0
+            result[stage] = row
+        return result
+
+    def to_prometheus(self, prefix: str = 'explorer') -> str:
+        """Render stages and counters in the Prometheus text exposition format"""
+        lines = [
+            f'# TYPE {prefix}_stage_seconds summary',
+            f'# TYPE {prefix}_stage_errors_total counter',
+            f'# TYPE {prefix}_stage_bytes_total counter',
+        ]
+        for stage, row in self.snapshot().items():
+            label = f'stage="{stage}"'
+            for pct in PERCENTILES:
+                lines.append(f'{prefix}_stage_seconds{{{label},quantile="{pct / 100}"}} {row[f"p{pct}"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{{label}}} {row["seconds"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{{label}}} {row["count"]}')
+            lines.append(f'{prefix}_stage_errors_total{{{label}}} {row["errors"]}')
+            lines.append(f'{prefix}_stage_bytes_total{{{label}}} {row["bytes"]}')
+        for name, value in sorted(self.counters().items()):
+            metric = name.replace('.', '_').replace('-', '_')
+            lines.append(f'{prefix}_{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._totals.clear()
+
+
+_metrics: Optional[Metrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    """Return the process-wide metrics registry"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
+
+
+def timed(stage: str, size: Optional[Callable] = None):
+    """Decorator recording each call as ``stage``; ``size(result)`` gives its payload size"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with get_metrics().timer(stage) as info:
+                result = fn(*args, **kwargs)
+                if size is not None:
+                    info['size'] = size(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def json_size(value) -> int:
+    """Approximate payload size of a JSON-serialisable result in bytes"""
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+
+
+def render_dashboard(metrics: Optional[Metrics] = None):
+    """Draw the admin performance page in the running Streamlit script"""
+    import pandas as pd
+    import streamlit as st
+
+    metrics = metrics or get_metrics()
+    st.title("📈 Performance")
+    snapshot = metrics.snapshot()
+    if snapshot:
+        df = pd.DataFrame.from_dict(snapshot, orient='index')
+        for column in ('p50', 'p95', 'p99'):
+            df[column] = (df[column] * 1000).round(1)
+        df = df.rename(columns={'p50': 'p50 ms', 'p95': 'p95 ms', 'p99': 'p99 ms'})
+        st.dataframe(df[['count', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'mean_bytes']],
+                     use_container_width=True)
+    else:
+        st.info("No requests recorded yet.")
+
+    counters = metrics.counters()
+    if counters:
+        st.subheader("Counters")
+        st.dataframe(pd.Series(counters, name='value'), use_container_width=True)
+
+    st.download_button("Download Prometheus metrics", metrics.to_prometheus(),
+                       file_name='metrics.prom', mime='text/plain')
+    if st.button("Reset histograms"):
+        metrics.reset()
+        st.rerun()
+
+
+_server: Optional['ThreadingHTTPServer'] = None
+
+
+def start_http_server(port: Optional[int] = None, host: str = '0.0.0.0') -> Optional['ThreadingHTTPServer']:
+    """Serve ``/metrics`` in Prometheus format on a daemon thread
+
+    Uses ``EXPLORER_METRICS_PORT`` when no port is given and does nothing
+    if neither is set. Safe to call more than once.
+    """
+    global _server
+    port = port or int(os.environ.get('EXPLORER_METRICS_PORT', 0))
+    with _metrics_lock:
+        if _server is not None or not port:
+            return _server
+        # Only needed when the exporter is enabled
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = get_metrics().to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        _server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=_server.serve_forever, name='metrics-http', daemon=True).start()
+        return _server
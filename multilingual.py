@@ -0,0 +1,134 @@
+"""Cross-language Wikipedia summaries: langlinks, fallback and prefetch
+
+The article's langlinks are resolved once from an anchor wiki (English by
+default). A summary request then goes straight to the right title in the
+target language, falls back to the best available language when the
+article doesn't exist there, and queues the user's likely next languages in
+the background so switching languages is answered from memory.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# Seconds a found summary is served from memory before it is asked for again
+SUMMARY_TTL = int(os.environ.get('EXPLORER_RESULT_TTL', 3600))
+
+
+class SummaryPipeline:
+    """Summary lookups across languages for one set of API callables
+
+    ``get_summary(title, lang)`` returns a summary dict (empty when the
+    article is missing or the fetch failed) and ``get_langlinks(title, lang)``
+    returns ``{lang: title}`` for every language the article exists in.
+    Background prefetches use ``prefetch_summary`` when given, e.g. one
+    whose errors are logged rather than shown to a user.
+
+    Only summaries that were found are remembered, for ``ttl`` seconds; an
+    empty result is asked for again next time (from the response cache, for
+    a missing article).
+    """
+
+    def __init__(self, get_summary: Callable[[str, str], Dict],
+                 get_langlinks: Callable[[str, str], Dict[str, str]],
+                 max_workers: int = 4, max_items: int = 512,
+                 prefetch_summary: Optional[Callable[[str, str], Dict]] = None,
+                 ttl: float = SUMMARY_TTL):
+        self.get_summary = get_summary
+        self.get_langlinks = get_langlinks
+        self.prefetch_summary = prefetch_summary or get_summary
+        self.max_items = max_items
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='summary-prefetch')
+        # (title, lang) -> (expiry time, summary)
+        self._summaries: 'OrderedDict[Tuple[str, str], Tuple[float, Dict]]' = OrderedDict()
+        self._pending: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+
+    def titles(self, title: str, anchor_lang: str = 'en') -> Dict[str, str]:
+        """Return the article's title in every language, including the anchor"""
+        links = dict(self.get_langlinks(title, anchor_lang) or {})
+        links.setdefault(anchor_lang, title)
+        return links
+
+    def _load(self, key: Tuple[str, str], get_summary: Optional[Callable[[str, str], Dict]] = None) -> Dict:
+        try:
+            summary = (get_summary or self.get_summary)(*key) or {}
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+        if summary:
+            with self._lock:
+                self._summaries[key] = (time.monotonic() + self.ttl, summary)
+                self._summaries.move_to_end(key)
+                while len(self._summaries) > self.max_items:
+                    self._summaries.popitem(last=False)
+        return summary
+
+    def _cached(self, key: Tuple[str, str]) -> Optional[Dict]:
+        """The remembered summary for key, dropping it once expired; call with the lock held"""
+        entry = self._summaries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._summaries[key]
+            return None
+        self._summaries.move_to_end(key)
+        return entry[1]
+
+    def _fetch(self, title: str, lang: str) -> Dict:
+        key = (title, lang)
+        with self._lock:
+            summary = self._cached(key)
+            if summary is not None:
+                return summary
+            future = self._pending.get(key)
+        if future is not None:
+            summary = future.result()
+            if summary:
+                return summary
+            # An empty prefetch may have been a failure; fetch again so the
+            # user's own handler sees it
+        return self._load(key)
+
+    def get(self, title: str, lang: str, fallbacks: Iterable[str] = (),
+            anchor_lang: str = 'en', links: Optional[Dict[str, str]] = None) -> Dict:
+        """Return the summary in ``lang`` or the first fallback language that has one
+
+        The result carries the language it was served in under ``'lang'``;
+        it is empty if no candidate language has the article.
+        """
+        links = links or self.titles(title, anchor_lang)
+        for candidate in dict.fromkeys([lang, *fallbacks]):
+            if candidate not in links:
+                continue
+            summary = self._fetch(links[candidate], candidate)
+            if summary:
+                return dict(summary, lang=candidate)
+        return {}
+
+    def prefetch(self, title: str, langs: Iterable[str], anchor_lang: str = 'en',
+                 links: Optional[Dict[str, str]] = None):
+        """Start loading summaries for ``langs`` in the background"""
+        links = links or self.titles(title, anchor_lang)
+        for lang in langs:
+            if lang not in links:
+                continue
+            key = (links[lang], lang)
+            with self._lock:
+                if self._cached(key) is not None or key in self._pending:
+                    continue
+                self._pending[key] = self._executor.submit(self._load, key, self.prefetch_summary)
+
+    def forget(self, links: Dict[str, str]):
+        """Drop the remembered summaries of one article, ``{lang: title}``"""
+        with self._lock:
+            for lang, title in links.items():
+                self._summaries.pop((title, lang), None)
+
+    def clear(self):
+        with self._lock:
+            self._summaries.clear()
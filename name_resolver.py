@@ -0,0 +1,146 @@
+"""Typo-tolerant, multilingual country name resolution over the local index"""
+
+import bisect
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+from country_index import CountryIndex, get_country_index, normalize_name
+
+
+def trigrams(text: str) -> List[str]:
+    padded = f"  {text} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Damerau-Levenshtein (OSA) distance, giving up with ``limit + 1`` past ``limit``"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before = None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if before is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+class NameResolver:
+    """Map whatever the user typed to a country QID and its per-language titles
+
+    Exact aliases are a dict lookup. Anything else goes through a trigram
+    inverted index to collect candidates, which are then re-ranked by edit
+    distance. Everything lives in memory, so a lookup never touches the
+    network or the disk.
+    """
+
+    def __init__(self, index: Optional[CountryIndex] = None, max_candidates: int = 20):
+        index = index or get_country_index()
+        self.max_candidates = max_candidates
+        self.labels = index.country_rows('labels')
+        self.titles = index.country_rows('titles')
+
+        self._alias_qid: Dict[str, str] = {}
+        for alias, qid in index.aliases():
+            self._alias_qid.setdefault(alias, qid)
+        self._aliases = sorted(self._alias_qid)
+        self._postings: Dict[str, List[int]] = {}
+        for alias_id, alias in enumerate(self._aliases):
+            for gram in set(trigrams(alias)):
+                self._postings.setdefault(gram, []).append(alias_id)
+
+    @property
+    def available(self) -> bool:
+        return bool(self._aliases)
+
+    def _match(self, qid: str, lang: str, distance: int) -> Dict:
+        labels = self.labels.get(qid, {})
+        return {
+            'qid': qid,
+            'name': labels.get(lang) or labels.get('en') or qid,
+            'titles': self.titles.get(qid, {}),
+            'distance': distance,
+        }
+
+    def _fuzzy(self, query: str) -> List[tuple]:
+        """Return (distance, alias) candidates ranked by similarity"""
+        grams = trigrams(query)
+        shared = Counter()
+        for gram in set(grams):
+            for alias_id in self._postings.get(gram, ()):
+                shared[alias_id] += 1
+        limit = max(1, len(query) // 4)
+        # An edit destroys at most three trigrams (four for a transposition),
+        # so candidates sharing fewer can't be within ``limit``
+        min_shared = len(grams) - 4 * limit
+        ranked = []
+        for alias_id, count in shared.most_common(self.max_candidates):
+            if count < min_shared:
+                break
+            alias = self._aliases[alias_id]
+            distance = edit_distance(query, alias, limit)
+            if distance <= limit:
+                ranked.append((distance, alias))
+        ranked.sort()
+        return ranked
+
+    def resolve(self, name: str, lang: str = 'en') -> Optional[Dict]:
+        """Return the best match for ``name`` or None if nothing is close enough
+
+        The result holds the ``qid``, the display ``name`` in ``lang``, the
+        article ``titles`` per wiki language and the edit ``distance``.
+        """
+        query = normalize_name(name or '')
+        if not query or not self.available:
+            return None
+        qid = self._alias_qid.get(query)
+        if qid is not None:
+            return self._match(qid, lang, 0)
+        ranked = self._fuzzy(query)
+        if not ranked:
+            return None
+        distance, alias = ranked[0]
+        return self._match(self._alias_qid[alias], lang, distance)
+
+    def suggest(self, prefix: str, lang: str = 'en', limit: int = 8) -> List[str]:
+        """Return country names in ``lang`` for autocomplete"""
+        query = normalize_name(prefix or '')
+        if not query or not self.available:
+            return []
+        qids = []
+        start = bisect.bisect_left(self._aliases, query)
+        for alias in self._aliases[start:]:
+            if not alias.startswith(query) or len(qids) >= limit:
+                break
+            qids.append(self._alias_qid[alias])
+        for _, alias in self._fuzzy(query):
+            qids.append(self._alias_qid[alias])
+        names = (self._match(qid, lang, 0)['name'] for qid in dict.fromkeys(qids))
+        return list(names)[:limit]
+
+    def title_for(self, match: Optional[Dict], lang: str, fallback: str) -> str:
+        """Return the article title for a match in one wiki language"""
+        if match is None:
+            return fallback
+        titles = match['titles']
+        return titles.get(lang) or titles.get('en') or match['name'] or fallback
+
+
+_resolver: Optional[NameResolver] = None
+_resolver_lock = threading.Lock()
+
+
+def get_name_resolver() -> NameResolver:
+    """Return the process-wide name resolver"""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = NameResolver()
+        return _resolver
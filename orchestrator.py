@@ -0,0 +1,53 @@
+"""Concurrent fan-out for the independent lookups behind an Explore click"""
+
+import contextvars
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, Tuple
+
+
+class FetchOrchestrator:
+    """Run independent fetches on a thread pool and collect them into one bundle"""
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+
+    def _initializer(self) -> Callable[[], None]:
+        # Worker threads need the script context so st.error() etc. still
+        # reach the page when a fetch fails inside the pool. Outside a
+        # Streamlit app there is no context, and no reason to import it.
+        if 'streamlit' not in sys.modules:
+            return lambda: None
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+        ctx = get_script_run_ctx()
+        if ctx is None:
+            return lambda: None
+        return lambda: add_script_run_ctx(ctx=ctx)
+
+    def run(self, tasks: Dict[str, Callable[[], Any]]) -> Iterator[Tuple[str, Any]]:
+        """Yield (name, result) pairs in completion order
+
+        A task that raises yields ``None`` so one failing source never holds
+        back the panels that depend on the others.
+        """
+        if not tasks:
+            return
+        workers = min(self.max_workers, len(tasks))
+        with ThreadPoolExecutor(max_workers=workers, initializer=self._initializer()) as pool:
+            # Each task runs in a copy of the caller's context so settings
+            # such as response_cache.bypass_cache() carry over
+            futures = {
+                pool.submit(contextvars.copy_context().run, fn): name
+                for name, fn in tasks.items()
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception:
+                    result = None
+                yield futures[future], result
+
+    def gather(self, tasks: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+        """Run all tasks and return the complete result bundle"""
+        return dict(self.run(tasks))
@@ -0,0 +1,146 @@
+"""Places as typed columns instead of lists of dicts
+
+Backends and the response cache exchange places as JSON-friendly dicts
+(``name``, ``address``, ``lat``, ``lon``). Once they reach the page they are
+kept in a :class:`PlaceSet`, which holds
+
+- ``lat``/``lon`` as float64 arrays,
+- ``name``/``address`` as object arrays of interned strings, so a name or
+  address seen in several tiles is stored once, and
+- ``category`` as a uint8 code into CATEGORIES.
+
+Dedup, distance sorting and bounding-box filters are vectorised. The table
+view and the map markers are fed from the same arrays.
+"""
+
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from geocoding import NOMINATIM_QUERIES, normalize_place_type
+
+# Category codes index into this tuple; UNKNOWN marks anything else
+CATEGORIES = tuple(NOMINATIM_QUERIES)
+UNKNOWN = 255
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def category_code(place_type: Optional[str]) -> int:
+    if not place_type:
+        return UNKNOWN
+    place_type = normalize_place_type(place_type)
+    return CATEGORIES.index(place_type) if place_type in CATEGORIES else UNKNOWN
+
+
+def _strings(values: Iterable[str]) -> np.ndarray:
+    interned = [sys.intern(str(value)) for value in values]
+    array = np.empty(len(interned), dtype=object)
+    array[:] = interned
+    return array
+
+
+class PlaceSet:
+    """Immutable columns of places; every operation returns a new set"""
+
+    __slots__ = ('name', 'address', 'lat', 'lon', 'category')
+
+    def __init__(self, name: np.ndarray, address: np.ndarray, lat: np.ndarray,
+                 lon: np.ndarray, category: np.ndarray):
+        self.name = name
+        self.address = address
+        self.lat = lat
+        self.lon = lon
+        self.category = category
+
+    @classmethod
+    def empty(cls) -> 'PlaceSet':
+        return cls(_strings([]), _strings([]), np.empty(0), np.empty(0), np.empty(0, dtype=np.uint8))
+
+    @classmethod
+    def from_dicts(cls, places: Iterable[Dict], place_type: Optional[str] = None) -> 'PlaceSet':
+        """Build a set from backend results, all of one ``place_type``"""
+        places = list(places)
+        return cls(
+            _strings(place['name'] for place in places),
+            _strings(place['address'] for place in places),
+            np.fromiter((place['lat'] for place in places), dtype=np.float64, count=len(places)),
+            np.fromiter((place['lon'] for place in places), dtype=np.float64, count=len(places)),
+            np.full(len(places), category_code(place_type), dtype=np.uint8),
+        )
+
+    @classmethod
+    def coerce(cls, places: Union['PlaceSet', Iterable[Dict]]) -> 'PlaceSet':
+        return places if isinstance(places, cls) else cls.from_dicts(places)
+
+    @classmethod
+    def concat(cls, sets: Sequence['PlaceSet']) -> 'PlaceSet':
+        if not sets:
+            return cls.empty()
+        return cls(*(np.concatenate([getattr(s, column) for s in sets]) for column in cls.__slots__))
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def take(self, index) -> 'PlaceSet':
+        """Rows selected by an index array or boolean mask"""
+        return PlaceSet(*(getattr(self, column)[index] for column in self.__slots__))
+
+    def dedup(self) -> 'PlaceSet':
+        """Drop repeats of the same name at the same spot (to ~1 m), keeping the first"""
+        if len(self) < 2:
+            return self
+        _, name_codes = np.unique(self.name, return_inverse=True)
+        keys = np.empty(len(self), dtype=[('name', np.int64), ('lat', np.int64), ('lon', np.int64)])
+        keys['name'] = name_codes
+        keys['lat'] = np.round(self.lat * 1e5)
+        keys['lon'] = np.round(self.lon * 1e5)
+        _, first = np.unique(keys, return_index=True)
+        if len(first) == len(self):
+            return self
+        return self.take(np.sort(first))
+
+    def distances_km(self, center: Tuple[float, float]) -> np.ndarray:
+        """Great-circle distance of every place from ``center``"""
+        lat1, lon1 = np.radians(center[0]), np.radians(center[1])
+        lat2, lon2 = np.radians(self.lat), np.radians(self.lon)
+        a = (np.sin((lat2 - lat1) / 2) ** 2
+             + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+    def sort_by_distance(self, center: Tuple[float, float]) -> 'PlaceSet':
+        return self.take(np.argsort(self.distances_km(center), kind='stable'))
+
+    def within(self, south: float, west: float, north: float, east: float) -> 'PlaceSet':
+        return self.take((self.lat >= south) & (self.lat <= north)
+                         & (self.lon >= west) & (self.lon <= east))
+
+    def of_type(self, place_type: str) -> 'PlaceSet':
+        return self.take(self.category == category_code(place_type))
+
+    def rows(self) -> Iterator[Tuple[float, float, str, str]]:
+        """(lat, lon, name, address) per place, as plain Python values for map markers"""
+        return zip(self.lat.tolist(), self.lon.tolist(), self.name.tolist(), self.address.tolist())
+
+    def to_dicts(self) -> List[Dict]:
+        return [{'name': name, 'address': address, 'lat': lat, 'lon': lon}
+                for lat, lon, name, address in self.rows()]
+
+    def to_pandas(self, columns: Sequence[str] = ('name', 'address', 'lat', 'lon')):
+        """DataFrame over the same arrays (the columns aren't copied)"""
+        import pandas as pd
+
+        return pd.DataFrame({column: self._column(column) for column in columns}, copy=False)
+
+    def to_arrow(self, columns: Sequence[str] = ('name', 'address', 'lat', 'lon')):
+        """Arrow table; numeric columns wrap the arrays without copying"""
+        import pyarrow as pa
+
+        return pa.table({column: self._column(column) for column in columns})
+
+    def _column(self, column: str) -> np.ndarray:
+        if column == 'category':
+            return np.array(CATEGORIES + ('',) * (UNKNOWN + 1 - len(CATEGORIES)),
+                            dtype=object)[self.category]
+        return getattr(self, column)
@@ -0,0 +1,381 @@
+"""Two-tier (memory + SQLite) cache for Wikimedia and Nominatim responses
+
+Each stored entry also records the request that produced it and how often
+it has been asked for, so warmer.py can refresh the hottest entries before
+they expire.
+
+With a shared store configured (see shared_store.py) the cache gains a
+third tier that every replica reads and writes, and a miss takes a
+distributed lock so only one replica fetches a given request while the
+others wait for its result.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from hashlib import sha1
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics import get_metrics
+from shared_store import SharedStore, get_shared_store
+
+logger = logging.getLogger(__name__)
+
+# Seconds each source stays fresh. Geocodes and Wikidata facts barely move,
+# article intros are edited more often.
+DEFAULT_TTLS = {
+    'wikipedia': 6 * 3600,
+    'wikivoyage': 24 * 3600,
+    'wikidata': 24 * 3600,
+    'nominatim': 7 * 24 * 3600,
+}
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'country_explorer')
+
+_MISSING = object()
+
+# Seconds a replica may hold a fetch lock, and wait for another's fetch
+FETCH_LOCK_TTL = 30
+FETCH_WAIT = 15
+
+# Set while a caller wants fresh data; lookups skip both tiers but the
+# fetched responses are still stored
+_bypass = contextvars.ContextVar('response_cache_bypass', default=False)
+
+
+@contextmanager
+def bypass_cache():
+    """Fetch fresh responses for everything requested inside the block"""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def normalize_params(params: Dict) -> Dict:
+    """Normalize request params so equivalent lookups share one key"""
+    normalized = {}
+    for name, value in params.items():
+        if isinstance(value, bool):
+            value = int(value)
+        elif isinstance(value, str):
+            value = ' '.join(value.split())
+        normalized[str(name)] = value
+    return normalized
+
+
+def make_key(endpoint: str, params: Dict, lang: str = '') -> str:
+    """Build a stable cache key from (endpoint, normalized params, lang)"""
+    raw = json.dumps([endpoint, normalize_params(params), lang], sort_keys=True, ensure_ascii=False)
+    return sha1(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """In-process LRU in front of an on-disk SQLite store, and optionally a shared store
+
+    Values must be JSON serialisable. Entries on disk are zlib-compressed
+    and evicted least-recently-used once ``max_disk_bytes`` is exceeded.
+    Errors talking to the shared store are logged and treated as misses.
+    """
+
+    def __init__(self, path: Optional[str] = None, memory_items: int = 512,
+                 max_disk_bytes: int = 64 * 1024 * 1024, ttls: Optional[Dict[str, int]] = None,
+                 shared: Optional[SharedStore] = None):
+        if path is None:
+            cache_dir = os.environ.get('EXPLORER_CACHE_DIR', DEFAULT_CACHE_DIR)
+            os.makedirs(cache_dir, exist_ok=True)
+            path = os.path.join(cache_dir, 'responses.sqlite')
+        self.path = path
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.shared = shared
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'shared_hits': 0, 'misses': 0,
+                      'evictions': 0, 'shared_waits': 0, 'shared_errors': 0}
+        # Accesses not yet written to the hits column
+        self._pending_hits: Counter = Counter()
+
+        self._lock = threading.RLock()
+        self._memory: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' key TEXT PRIMARY KEY, source TEXT, expires REAL,'
+            ' accessed REAL, size INTEGER, value BLOB)'
+        )
+        columns = {row[1] for row in self._db.execute('PRAGMA table_info(responses)')}
+        for column, decl in (('endpoint', 'TEXT'), ('params', 'TEXT'), ('lang', 'TEXT'),
+                             ('hits', 'INTEGER NOT NULL DEFAULT 0')):
+            if column not in columns:  # caches created before access stats
+                self._db.execute(f'ALTER TABLE responses ADD COLUMN {column} {decl}')
+        self._db.commit()
+
+    def ttl_for(self, source: str) -> int:
+        return self.ttls.get(source, 3600)
+
+    def _remember(self, key: str, expires: float, value: Any):
+        self._memory[key] = (expires, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return a fresh cached value, checking memory before disk"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    return entry[1]
+                del self._memory[key]
+
+            row = self._db.execute(
+                'SELECT expires, value FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None and row[0] > now:
+                value = json.loads(zlib.decompress(row[1]).decode('utf-8'))
+                self._db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+                self._db.commit()
+                self._remember(key, row[0], value)
+                self.stats['disk_hits'] += 1
+                return value
+
+        entry = self._shared_get(key)
+        with self._lock:
+            if entry is not None and entry[0] > now:
+                self._remember(key, entry[0], entry[1])
+                self.stats['shared_hits'] += 1
+                return entry[1]
+            self.stats['misses'] += 1
+            return default
+
+    def _shared_get(self, key: str) -> Optional[tuple]:
+        if self.shared is None:
+            return None
+        try:
+            blob = self.shared.get('response:' + key)
+        except Exception:
+            logger.exception("Shared cache read failed")
+            self.stats['shared_errors'] += 1
+            return None
+        if blob is None:
+            return None
+        expires, value = json.loads(zlib.decompress(blob).decode('utf-8'))
+        return expires, value
+
+    def _shared_set(self, key: str, expires: float, value: Any):
+        if self.shared is None:
+            return
+        blob = zlib.compress(json.dumps([expires, value], ensure_ascii=False).encode('utf-8'))
+        try:
+            self.shared.set('response:' + key, blob, max(1.0, expires - time.time()))
+        except Exception:
+            logger.exception("Shared cache write failed")
+            self.stats['shared_errors'] += 1
+
+    def set(self, key: str, value: Any, source: str = '', endpoint: Optional[str] = None,
+            params: Optional[Dict] = None, lang: str = ''):
+        """Store a value in every tier using the source's TTL
+
+        Passing the request (``endpoint``, ``params``, ``lang``) lets the
+        warmer replay it later. Replacing an entry keeps its hit count and
+        last access time, so refreshing doesn't make an entry look popular.
+        """
+        now = time.time()
+        expires = now + self.ttl_for(source)
+        blob = zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+        request = json.dumps(normalize_params(params), ensure_ascii=False) if params is not None else None
+        with self._lock:
+            self._remember(key, expires, value)
+            self._db.execute(
+                'INSERT INTO responses (key, source, expires, accessed, size, value, endpoint, params, lang)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+                ' ON CONFLICT(key) DO UPDATE SET source = excluded.source, expires = excluded.expires,'
+                ' size = excluded.size, value = excluded.value,'
+                ' endpoint = COALESCE(excluded.endpoint, endpoint),'
+                ' params = COALESCE(excluded.params, params), lang = excluded.lang',
+                (key, source, expires, now, len(blob), sqlite3.Binary(blob), endpoint, request, lang)
+            )
+            self._flush_hits()
+            self._evict(now)
+            self._db.commit()
+        self._shared_set(key, expires, value)
+
+    def _count(self, key: str):
+        with self._lock:
+            self._pending_hits[key] += 1
+            if len(self._pending_hits) >= 256:
+                self._flush_hits()
+                self._db.commit()
+
+    def _flush_hits(self):
+        if self._pending_hits:
+            now = time.time()
+            self._db.executemany(
+                'UPDATE responses SET hits = hits + ?, accessed = ? WHERE key = ?',
+                [(count, now, key) for key, count in self._pending_hits.items()]
+            )
+            self._pending_hits.clear()
+
+    def _evict(self, now: float):
+        self._db.execute('DELETE FROM responses WHERE expires <= ?', (now,))
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        for key, size in self._db.execute(
+                'SELECT key, size FROM responses ORDER BY accessed').fetchall():
+            self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._memory.pop(key, None)
+            self.stats['evictions'] += 1
+            total -= size
+            if total <= self.max_disk_bytes:
+                break
+
+    def get_or_fetch(self, source: str, endpoint: str, params: Dict, lang: str,
+                     fetch: Callable[[], Any], replayable: bool = True,
+                     cache_if: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Return the cached response for a request, fetching it on a miss
+
+        Exceptions from ``fetch`` propagate and nothing is stored; neither
+        is a fetched value ``cache_if`` rejects (e.g. an empty result). Pass
+        ``replayable=False`` when the value isn't the response to GETting
+        ``endpoint`` with ``params``, so the warmer leaves it alone.
+
+        With a shared store, a miss is fetched by one replica at a time;
+        the others wait up to ``FETCH_WAIT`` seconds for its response and
+        fetch it themselves only if it doesn't arrive.
+        """
+        key = make_key(endpoint, params, lang)
+        bypass = _bypass.get()
+        value = _MISSING if bypass else self.get(key, _MISSING)
+        if value is _MISSING:
+            token = None
+            if not bypass:
+                value, token = self._single_flight(key)
+            try:
+                if value is _MISSING:
+                    value = fetch()
+                    if cache_if is not None and not cache_if(value):
+                        return value
+                    if replayable:
+                        self.set(key, value, source, endpoint, params, lang)
+                    else:
+                        self.set(key, value, source)
+            finally:
+                if token:
+                    self._release_fetch(key, token)
+        self._count(key)
+        return value
+
+    def peek(self, endpoint: str, params: Dict, lang: str) -> Any:
+        """The cached response for a request, or None on a miss or inside :func:`bypass_cache`
+
+        For callers that fetch several requests at once; a hit counts
+        towards the entry's popularity as in :meth:`get_or_fetch`.
+        """
+        if _bypass.get():
+            return None
+        key = make_key(endpoint, params, lang)
+        value = self.get(key)
+        if value is not None:
+            self._count(key)
+        return value
+
+    def _acquire_fetch(self, key: str) -> Optional[str]:
+        """Take the shared fetch lock for ``key``; '' means there's nobody to coordinate with"""
+        if self.shared is None:
+            return ''
+        try:
+            return self.shared.acquire('fetch:' + key, FETCH_LOCK_TTL)
+        except Exception:
+            logger.exception("Shared fetch lock failed")
+            self.stats['shared_errors'] += 1
+            return ''
+
+    def _single_flight(self, key: str) -> tuple:
+        """Wait for another replica's fetch of ``key`` or take over fetching it
+
+        Returns ``(value, token)``: the value another replica stored, or
+        ``_MISSING`` and the lock token (possibly None after a timeout)
+        when this replica should fetch.
+        """
+        token = self._acquire_fetch(key)
+        if token is not None:
+            return _MISSING, token
+        self.stats['shared_waits'] += 1
+        deadline = time.time() + FETCH_WAIT
+        delay = 0.05
+        while time.time() < deadline:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+            entry = self._shared_get(key)
+            if entry is not None:
+                with self._lock:
+                    self._remember(key, entry[0], entry[1])
+                return entry[1], None
+            # The holder gave up (or died and its lock expired)
+            token = self._acquire_fetch(key)
+            if token is not None:
+                return _MISSING, token
+        return _MISSING, None
+
+    def _release_fetch(self, key: str, token: str):
+        try:
+            self.shared.release('fetch:' + key, token)
+        except Exception:
+            logger.exception("Shared fetch unlock failed")
+            self.stats['shared_errors'] += 1
+
+    def hot_entries(self, limit: int = 100, max_idle: float = 7 * 24 * 3600) -> List[Dict]:
+        """Return the most requested replayable entries, hottest first
+
+        Entries nobody has asked for in ``max_idle`` seconds are left to
+        expire. Each dict has ``key``, ``source``, ``endpoint``, ``params``,
+        ``lang``, ``expires`` and ``hits``.
+        """
+        with self._lock:
+            self._flush_hits()
+            self._db.commit()
+            rows = self._db.execute(
+                'SELECT key, source, endpoint, params, lang, expires, hits FROM responses'
+                ' WHERE endpoint IS NOT NULL AND accessed > ?'
+                ' ORDER BY hits DESC, accessed DESC LIMIT ?',
+                (time.time() - max_idle, limit)
+            ).fetchall()
+        return [
+            {'key': key, 'source': source, 'endpoint': endpoint, 'params': json.loads(params),
+             'lang': lang, 'expires': expires, 'hits': hits}
+            for key, source, endpoint, params, lang, expires, hits in rows
+        ]
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._pending_hits.clear()
+            self._db.execute('DELETE FROM responses')
+            self._db.commit()
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+    """Return the process-wide response cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(shared=get_shared_store())
+            get_metrics().register('cache', lambda: dict(_cache.stats))
+        return _cache
@@ -0,0 +1,232 @@
+"""Store shared by every replica: cache entries, single-flight locks, rate limits
+
+By default each process caches and rate-limits on its own. With
+``EXPLORER_SHARED_STORE`` set, the response cache, the Nominatim token bucket
+and the cache warmer coordinate through one store, so N replicas behave like
+one polite client with one cache:
+
+- ``redis://host:6379/0`` uses Redis or any Redis-compatible server (needs
+  the ``redis`` package);
+- ``sqlite:////path/to/shared.sqlite`` uses a SQLite file, a stand-in for
+  replicas on one host and for tests.
+
+Both backends provide:
+
+- ``get``/``set`` of bytes with a TTL;
+- ``acquire``/``release`` of a lock that expires on its own if its holder dies;
+- ``reserve``, which takes a slot from a global token bucket and returns how
+  long the caller must wait for it.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+
+
+class SharedStore:
+    """Interface of a shared backend"""
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    def acquire(self, name: str, ttl: float) -> Optional[str]:
+        """Take the lock ``name`` for at most ``ttl`` seconds; returns a token or None if held"""
+        raise NotImplementedError
+
+    def release(self, name: str, token: str):
+        """Release a lock, only if ``token`` still holds it"""
+        raise NotImplementedError
+
+    def reserve(self, bucket: str, rate: float, burst: float) -> float:
+        """Reserve one token from a global bucket; returns the seconds to wait before using it"""
+        raise NotImplementedError
+
+
+class SharedTokenBucket:
+    """Drop-in for geocoding.TokenBucket that is shared across processes"""
+
+    def __init__(self, store: SharedStore, name: str, rate: float = 1.0, capacity: float = 1.0):
+        self.store = store
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until it's available; returns the time waited"""
+        delay = self.store.reserve(self.name, self.rate, self.capacity)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Reservation-style bucket: tokens may go negative, and the caller waits
+# until its reserved token would have accrued
+_RESERVE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate) - 1
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst / rate + 60) * 1000))
+if tokens >= 0 then
+    return '0'
+end
+return tostring(-tokens / rate)
+"""
+
+
+class RedisStore(SharedStore):
+    """Redis (or any server speaking its protocol and Lua scripting)"""
+
+    def __init__(self, url: str, prefix: str = 'explorer:'):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("EXPLORER_SHARED_STORE=redis://... needs the 'redis' package") from e
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._release = self.client.register_script(_RELEASE_SCRIPT)
+        self._reserve = self.client.register_script(_RESERVE_SCRIPT)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self.client.set(self.prefix + key, value, px=max(1, int(ttl * 1000)))
+
+    def acquire(self, name: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if self.client.set(self.prefix + 'lock:' + name, token, nx=True, px=max(1, int(ttl * 1000))):
+            return token
+        return None
+
+    def release(self, name: str, token: str):
+        self._release(keys=[self.prefix + 'lock:' + name], args=[token])
+
+    def reserve(self, bucket: str, rate: float, burst: float) -> float:
+        return float(self._reserve(keys=[self.prefix + 'bucket:' + bucket], args=[rate, burst]))
+
+
+class SQLiteStore(SharedStore):
+    """A SQLite file shared by the processes on one host
+
+    Expired entries and locks are deleted on open and then at most every
+    PURGE_INTERVAL seconds by a writer, so the file doesn't keep growing.
+    """
+
+    PURGE_INTERVAL = 60.0
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        db = self._db()
+        db.executescript(
+            'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, expires REAL);'
+            'CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, token TEXT, expires REAL);'
+            'CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, ts REAL);'
+            'CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires);'
+        )
+        self._purged = 0.0
+        self.purge()
+
+    def purge(self):
+        """Delete expired entries and locks"""
+        now = time.time()
+        self._purged = now
+        db = self._db()
+        db.execute('DELETE FROM entries WHERE expires <= ?', (now,))
+        db.execute('DELETE FROM locks WHERE expires <= ?', (now,))
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread; isolation_level=None so BEGIN IMMEDIATE
+        # below is the only transaction control
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            self._local.db = db
+        return db
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self._db().execute(
+            'SELECT value FROM entries WHERE key = ? AND expires > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self._db().execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?)',
+                           (key, sqlite3.Binary(value), time.time() + ttl))
+        if time.time() - self._purged > self.PURGE_INTERVAL:
+            self.purge()
+
+    def acquire(self, name: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        db = self._db()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute('SELECT expires FROM locks WHERE name = ?', (name,)).fetchone()
+            if row and row[0] > now:
+                return None
+            db.execute('INSERT OR REPLACE INTO locks VALUES (?, ?, ?)', (name, token, now + ttl))
+            return token
+        finally:
+            db.execute('COMMIT')
+
+    def release(self, name: str, token: str):
+        self._db().execute('DELETE FROM locks WHERE name = ? AND token = ?', (name, token))
+
+    def reserve(self, bucket: str, rate: float, burst: float) -> float:
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = db.execute('SELECT tokens, ts FROM buckets WHERE name = ?', (bucket,)).fetchone()
+            tokens, ts = row if row else (burst, now)
+            tokens = min(burst, tokens + (now - ts) * rate) - 1
+            db.execute('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)', (bucket, tokens, now))
+        finally:
+            db.execute('COMMIT')
+        return 0.0 if tokens >= 0 else -tokens / rate
+
+
+def open_store(url: str) -> SharedStore:
+    """Open a store from a ``redis://`` or ``sqlite:///`` URL"""
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStore(url)
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported shared store URL: {url}")
+
+
+_store: Optional[SharedStore] = None
+_store_loaded = False
+_store_lock = threading.Lock()
+
+
+def get_shared_store() -> Optional[SharedStore]:
+    """Return the store named by ``EXPLORER_SHARED_STORE``, or None when unset"""
+    global _store, _store_loaded
+    with _store_lock:
+        if not _store_loaded:
+            url = os.environ.get('EXPLORER_SHARED_STORE')
+            _store = open_store(url) if url else None
+            _store_loaded = True
+        return _store
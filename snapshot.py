@@ -0,0 +1,431 @@
+"""Offline snapshot of country intros from Wikipedia and Wikivoyage dumps
+
+Ingest local dump files once::
+
+    python snapshot.py enwiki-latest-pages-articles.xml.bz2 frwikivoyage-latest-pages-articles.xml.bz2
+    python snapshot.py enwiki_namespace_0.tar.gz   # Wikimedia Enterprise NDJSON snapshot
+
+Dumps are read as a stream (XML with iterparse, NDJSON line by line, from
+plain, .gz, .bz2 or .tar.gz files), so memory stays flat whatever their
+size. Only country articles are kept: titles come from the country index,
+or from ``--titles``. For each one the store holds the introduction as plain
+text, the page image and the article URL, keyed by (source, lang, title).
+
+WikimediaAPI answers summaries and travel extracts from the store before
+going to the network. With ``EXPLORER_SNAPSHOT_REVALIDATE`` set to a number
+of seconds, entries older than that are still served, but are refreshed
+from the live API in the background.
+"""
+
+import argparse
+import bz2
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import sqlite3
+import tarfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, IO, Iterable, Iterator, Optional, Set, Tuple
+from urllib.parse import quote
+
+from country_index import CountryIndex, get_country_index, normalize_name
+from response_cache import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+SOURCES = {'wiki': 'wikipedia', 'wikivoyage': 'wikivoyage'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    source TEXT, lang TEXT, key TEXT, title TEXT, extract TEXT,
+    image TEXT, url TEXT, updated REAL,
+    PRIMARY KEY (source, lang, key)
+) WITHOUT ROWID;
+"""
+
+
+# --- Wikitext ---------------------------------------------------------------
+
+_COMMENT = re.compile(r'<!--.*?-->', re.S)
+_REF = re.compile(r'<ref[^>/]*/>|<ref[^>]*>.*?</ref>', re.S | re.I)
+_TAG = re.compile(r'<[^>]+>')
+_HEADING = re.compile(r'^=+[^=\n].*?=+\s*$', re.M)
+_FILE_LINK = re.compile(r'\[\[[^:\]|]+:[^\]|]+\.(?:svg|png|jpe?g|gif|tiff?|webp)\b', re.I)
+_LINK = re.compile(r'\[\[(?:[^\]|]*\|)?([^\]]*)\]\]')
+_EXTERNAL = re.compile(r'\[(?:https?:)?//[^\s\]]+\s*([^\]]*)\]')
+_IMAGE_PARAM = re.compile(
+    r'\|\s*(\w*(?:image|flag|bandera|drapeau|flagge|bandiera)\w*)\s*=\s*'
+    r'(?:\[\[[^:\]]+:)?([^|\n}\]]+\.(?:svg|png|jpe?g|gif|tiff?|webp))', re.I)
+
+
+def _strip_nested(text: str, opening: str, closing: str) -> str:
+    """Remove every (possibly nested) ``opening ... closing`` span"""
+    out = []
+    depth = 0
+    i = 0
+    start = 0
+    while i < len(text):
+        if text.startswith(opening, i):
+            if depth == 0:
+                out.append(text[start:i])
+            depth += 1
+            i += len(opening)
+        elif depth and text.startswith(closing, i):
+            depth -= 1
+            i += len(closing)
+            if depth == 0:
+                start = i
+        else:
+            i += 1
+    if depth == 0:
+        out.append(text[start:])
+    return ''.join(out)
+
+
+def _strip_files(text: str) -> str:
+    # File links can hold nested links in their captions
+    while True:
+        match = _FILE_LINK.search(text)
+        if match is None:
+            return text
+        depth, i = 0, match.start()
+        while i < len(text):
+            if text.startswith('[[', i):
+                depth += 1
+                i += 2
+            elif text.startswith(']]', i):
+                depth -= 1
+                i += 2
+                if depth == 0:
+                    break
+            else:
+                i += 1
+        text = text[:match.start()] + text[i:]
+
+
+def lead_section(wikitext: str) -> str:
+    """Wikitext before the first heading"""
+    match = _HEADING.search(wikitext)
+    return wikitext[:match.start()] if match else wikitext
+
+
+def plain_text(wikitext: str) -> str:
+    """Readable text of a wikitext fragment, roughly as TextExtracts' plain text"""
+    text = _COMMENT.sub('', wikitext)
+    text = _REF.sub('', text)
+    text = _strip_nested(text, '{{', '}}')
+    text = _strip_nested(text, '{|', '|}')
+    text = _strip_files(text)
+    text = re.sub(r'\[\[(?:Category|Kategorie|Catégorie|Categoría):[^\]]*\]\]', '', text, flags=re.I)
+    text = _LINK.sub(r'\1', text)
+    text = _EXTERNAL.sub(r'\1', text)
+    text = _TAG.sub('', text)
+    text = text.replace("'''", '').replace("''", '')
+    text = re.sub(r'&nbsp;', ' ', text)
+    paragraphs = (' '.join(line.split()) for line in text.split('\n'))
+    return '\n'.join(p for p in paragraphs if p and not p.startswith(('__', '|', '!')))
+
+
+def page_image(lead: str) -> Optional[str]:
+    """File name of the lead's main image: the infobox flag or image, else the first file"""
+    params = _IMAGE_PARAM.findall(lead)
+    for name, value in params:
+        if 'flag' in name.lower() or name.lower() in ('bandera', 'drapeau', 'flagge', 'bandiera'):
+            return value.strip()
+    if params:
+        return params[0][1].strip()
+    match = _FILE_LINK.search(lead)
+    return match.group(0).split(':', 1)[1].strip() if match else None
+
+
+def commons_url(name: str) -> str:
+    """upload.wikimedia.org URL of a Commons file (the client doesn't follow redirects)"""
+    name = name.strip().replace(' ', '_')
+    name = name[:1].upper() + name[1:]
+    digest = hashlib.md5(name.encode('utf-8')).hexdigest()
+    return f"https://upload.wikimedia.org/wikipedia/commons/{digest[0]}/{digest[:2]}/{quote(name)}"
+
+
+def truncate(extract: str, max_chars: Optional[int]) -> Tuple[str, bool]:
+    """Cut an extract at a word boundary near ``max_chars``, as the API's exchars does"""
+    if not max_chars or len(extract) <= max_chars:
+        return extract, False
+    cut = extract[:max_chars]
+    space = cut.rfind(' ')
+    if space > max_chars // 2:
+        cut = cut[:space]
+    return cut.rstrip(' ,;:') + '…', True
+
+
+# --- Dump readers -------------------------------------------------------------
+
+def _open(path: str) -> IO[bytes]:
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def parse_dbname(dbname: str) -> Tuple[str, str]:
+    """('wikipedia', 'en') for 'enwiki', ('wikivoyage', 'fr') for 'frwikivoyage'"""
+    for suffix, source in sorted(SOURCES.items(), key=lambda item: -len(item[0])):
+        if dbname.endswith(suffix):
+            return source, dbname[:-len(suffix)].replace('_', '-')
+    raise ValueError(f"Not a Wikipedia or Wikivoyage dump: {dbname}")
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def iter_xml_pages(stream: IO[bytes]) -> Iterator[Dict]:
+    """Yield the main-namespace, non-redirect pages of a pages-articles XML dump
+
+    Each page is cleared once read, so memory doesn't grow with the dump.
+    """
+    dbname = ''
+    root = None
+    for event, element in ET.iterparse(stream, events=('start', 'end')):
+        if root is None:
+            root = element
+        if event != 'end':
+            continue
+        tag = _local(element.tag)
+        if tag == 'dbname':
+            dbname = element.text or ''
+        elif tag == 'page':
+            fields = {_local(child.tag): child for child in element}
+            text = element.find('.//{*}revision/{*}text')
+            if (fields.get('ns') is not None and fields['ns'].text == '0'
+                    and 'redirect' not in fields and text is not None):
+                yield {'dbname': dbname, 'title': fields['title'].text, 'text': text.text or ''}
+            root.clear()
+
+
+def iter_enterprise(stream: IO[bytes], archive: bool = False) -> Iterator[Dict]:
+    """Yield the articles of a Wikimedia Enterprise NDJSON snapshot, or of a tar of them"""
+    def lines(f: IO[bytes]) -> Iterator[Dict]:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+    if not archive:
+        yield from lines(stream)
+        return
+    with tarfile.open(fileobj=stream, mode='r|') as archive:
+        for member in archive:
+            f = archive.extractfile(member) if member.isfile() else None
+            if f is not None:
+                yield from lines(f)
+
+
+# --- Store --------------------------------------------------------------------
+
+class SnapshotStore:
+    """Country intros by (source, lang, title) in a SQLite file"""
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            path = os.environ.get('EXPLORER_SNAPSHOT') or os.path.join(
+                os.environ.get('EXPLORER_CACHE_DIR', DEFAULT_CACHE_DIR), 'snapshot.sqlite')
+        self.path = path
+        self.max_age = float(os.environ.get('EXPLORER_SNAPSHOT_REVALIDATE', 0))
+        self._db = None
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._refreshing: Set[Tuple[str, str, str]] = set()
+        if os.path.exists(path):
+            self._connect()
+
+    def _connect(self):
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    @property
+    def available(self) -> bool:
+        return self._db is not None
+
+    def get(self, source: str, lang: str, title: str) -> Optional[Dict]:
+        """The stored entry with its full ``extract``, or None"""
+        if not self.available or not title:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                'SELECT title, extract, image, url, updated FROM articles'
+                ' WHERE source = ? AND lang = ? AND key = ?', (source, lang, normalize_name(title))
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('title', 'extract', 'image', 'url', 'updated'), row))
+
+    def put(self, source: str, lang: str, title: str, extract: str, image: str = '',
+            url: str = '', commit: bool = True):
+        with self._lock:
+            self._connect().execute(
+                'INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (source, lang, normalize_name(title), title, extract, image or '', url, time.time())
+            )
+            if commit:
+                self._db.commit()
+
+    def commit(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.commit()
+
+    def stale(self, entry: Dict) -> bool:
+        return bool(self.max_age) and time.time() - entry['updated'] > self.max_age
+
+    def refresh(self, source: str, lang: str, title: str, fetch: Callable[[], Dict]):
+        """Re-fetch an entry in the background; ``fetch`` returns a summary dict"""
+        key = (source, lang, normalize_name(title))
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='snapshot-refresh')
+
+        def run():
+            try:
+                data = fetch()
+                if data.get('extract'):
+                    self.put(source, lang, data.get('title') or title, data['extract'],
+                             data.get('image_original') or data.get('image', ''), data.get('url', ''))
+            except Exception:
+                logger.exception("Revalidating %s:%s:%s failed", source, lang, title)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+        self._executor.submit(run)
+
+
+def serve(entry: Dict, max_chars: Optional[int], thumb_width: Optional[int] = None) -> Dict:
+    """A stored entry in the shape of WikimediaAPI's summaries, cut to ``max_chars``"""
+    extract, truncated = truncate(entry['extract'], max_chars)
+    image = entry.get('image') or ''
+    return {
+        'title': entry['title'],
+        'extract': extract,
+        'truncated': truncated,
+        'image': thumb_url(image, thumb_width) if thumb_width else image,
+        'image_original': image,
+        'url': entry['url'],
+    }
+
+
+def thumb_url(url: str, width: int) -> str:
+    """Thumbnail URL for an upload.wikimedia.org original; other URLs are kept"""
+    match = re.match(r'(https://upload\.wikimedia\.org/[^/]+/[^/]+)/(\w/\w\w/([^/]+))$', url or '')
+    if not match:
+        return url
+    base, path, name = match.groups()
+    suffix = '.png' if name.lower().endswith('.svg') else ''
+    return f"{base}/thumb/{path}/{width}px-{name}{suffix}"
+
+
+_store: Optional[SnapshotStore] = None
+_store_lock = threading.Lock()
+
+
+def get_snapshot_store() -> SnapshotStore:
+    """Return the process-wide snapshot store (unavailable until something is ingested)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SnapshotStore()
+        return _store
+
+
+# --- Ingestion ----------------------------------------------------------------
+
+def country_titles(index: CountryIndex, source: str, lang: str) -> Callable[[str], bool]:
+    """Whether a title is a country article, judged by the country index"""
+    if source == 'wikipedia':
+        titles = {titles[lang] for titles in index.country_rows('titles').values() if lang in titles}
+        return lambda title: title in titles
+    # Wikivoyage titles aren't in the index, but match its names and aliases
+    return lambda title: index.find(title) is not None
+
+
+def ingest(path: str, store: SnapshotStore, titles: Optional[Set[str]] = None,
+           index: Optional[CountryIndex] = None, batch: int = 500) -> int:
+    """Stream one dump into the store; returns how many articles were stored"""
+    index = index or get_country_index()
+    if titles is None and not index.available:
+        raise RuntimeError("Build the country index (python country_index.py) or pass --titles")
+    enterprise = '.ndjson' in path or '.json' in path or '.tar' in path
+    filters: Dict[str, Callable[[str], bool]] = {}
+    stored = 0
+
+    with _open(path) as stream:
+        pages = iter_enterprise(stream, '.tar' in path) if enterprise else iter_xml_pages(stream)
+        for page in pages:
+            if enterprise:
+                if page.get('namespace', {}).get('identifier', 0) != 0:
+                    continue
+                dbname, title = page.get('is_part_of', {}).get('identifier', ''), page.get('name', '')
+            else:
+                dbname, title = page['dbname'], page['title']
+            source, lang = parse_dbname(dbname)
+
+            if dbname not in filters:
+                filters[dbname] = (lambda t: t in titles) if titles is not None \
+                    else country_titles(index, source, lang)
+            if not filters[dbname](title):
+                continue
+
+            if enterprise:
+                extract = page.get('abstract') or ''
+                image = (page.get('image') or {}).get('content_url', '')
+                url = page.get('url', '')
+            else:
+                lead = lead_section(page['text'])
+                extract = plain_text(lead)
+                name = page_image(lead)
+                image = commons_url(name) if name else ''
+                url = f"https://{lang}.{source}.org/wiki/{quote(title.replace(' ', '_'))}"
+            if not extract:
+                continue
+            store.put(source, lang, title, extract, image, url, commit=False)
+            stored += 1
+            if stored % batch == 0:
+                store.commit()
+    store.commit()
+    return stored
+
+
+def main(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description='Ingest Wikipedia/Wikivoyage dumps into the offline snapshot')
+    parser.add_argument('dumps', nargs='+', help='pages-articles XML or Enterprise NDJSON dumps')
+    parser.add_argument('--store', help='snapshot file (default: EXPLORER_SNAPSHOT or the cache dir)')
+    parser.add_argument('--titles', help='file with one article title per line, instead of the country index')
+    args = parser.parse_args(argv)
+
+    titles = None
+    if args.titles:
+        with io.open(args.titles, encoding='utf-8') as f:
+            titles = {line.strip() for line in f if line.strip()}
+    store = SnapshotStore(args.store)
+    for path in args.dumps:
+        started = time.perf_counter()
+        count = ingest(path, store, titles)
+        print(f"{path}: stored {count} articles in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
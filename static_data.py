@@ -0,0 +1,48 @@
+"""Tables the apps need before their first paint
+
+Kept free of imports so loading them costs nothing on a cold start.
+Country names are not listed here: the country index built by
+country_index.py is their precomputed table, in every indexed language.
+"""
+
+# Every language offered by the explorer, in menu order
+LANGUAGE_CODES = {
+    "English": "en",
+    "Spanish": "es",
+    "French": "fr",
+    "German": "de",
+    "Italian": "it",
+    "Portuguese": "pt",
+    "Russian": "ru",
+    "Chinese": "zh",
+    "Japanese": "ja",
+    "Arabic": "ar",
+    "Hindi": "hi",
+    "Dutch": "nl",
+    "Swedish": "sv",
+    "Norwegian": "no",
+    "Danish": "da",
+    "Finnish": "fi",
+    "Korean": "ko",
+    "Thai": "th",
+    "Vietnamese": "vi",
+    "Turkish": "tr",
+}
+
+# Sidebar labels of the place types, and the keys geocoding.py knows them by
+PLACE_TYPE_LABELS = {
+    "🍽️ Restaurants": "restaurants",
+    "🏛️ Temples": "temples",
+    "🎭 Tourist Attractions": "tourist_attractions",
+    "🚇 Transportation": "transportation",
+    "🏨 Hotels": "hotels",
+}
+
+# Marker colour for each place type
+PLACE_COLORS = {
+    'restaurants': 'orange',
+    'temples': 'purple',
+    'tourist_attractions': 'green',
+    'transportation': 'blue',
+    'hotels': 'pink',
+}
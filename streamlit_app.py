@@ -1,37 +1,68 @@
-
-
 import streamlit as st
-import requests
-import folium
-from streamlit_folium import folium_static
-import pandas as pd
-from geopy.geocoders import Nominatim
+import streamlit.components.v1 as components
+import itertools
+import os
 import re
-from typing import Tuple, Dict, List, Optional
+from contextlib import nullcontext
+from typing import Any, Callable, Tuple, Dict, Iterator, List, Optional
+
+from country_index import get_country_index
+from explorer_api import THUMB_WIDTH, FetchError
+from facts import get_facts_engine
+from geocoding import GeocodingBackend, get_geocoding_backend
+from name_resolver import get_name_resolver
+from metrics import json_size, render_dashboard, start_http_server as start_metrics_server, timed
+from orchestrator import FetchOrchestrator
+from response_cache import bypass_cache, get_cache
+from snapshot import get_snapshot_store, serve as serve_snapshot
+from static_data import LANGUAGE_CODES as ALL_LANGUAGES
+from warmer import CacheWarmer
+from wikidata import WIKIDATA_API, WikidataResolver
 
 # Page setup
 st.set_page_config(page_title="🌍 Country Wikipedia Explorer", page_icon="🌍", layout="wide")
 
 # Language options
 LANGUAGE_CODES = {
-    "English": "en",
-    "French": "fr",
-    "German": "de",
-    "Spanish": "es",
-    "Hindi": "hi",
-    "Arabic": "ar",
-    "Chinese": "zh",
-    "Russian": "ru",
-    "Japanese": "ja",
+    name: ALL_LANGUAGES[name]
+    for name in ("English", "French", "German", "Spanish", "Hindi", "Arabic", "Chinese", "Russian", "Japanese")
 }
 
 # API wrapper class
 class WikiAPI:
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({"User-Agent": "WikiExplorerApp"})
+        # Shared pooled client: keep-alive per host, timeouts and retries.
+        # Imported here so httpx loads when the first fetch needs it
+        from http_client import get_wikimedia_client
+        self.session = get_wikimedia_client()
+        self.cache = get_cache()
+        self.facts = get_facts_engine()
+        self.index = get_country_index()
+        self.wikidata = WikidataResolver(lambda params: self._get_json(WIKIDATA_API, params, "wikidata"))
+        self.snapshot = get_snapshot_store()
+
+    def _get_json(self, url: str, params: Dict, source: str, lang: str = "") -> Dict:
+        return self.cache.get_or_fetch(
+            source, url, params, lang,
+            lambda: self.session.get_json(url, params),
+        )
 
+    @timed("wikipedia.summary", size=json_size)
     def get_summary(self, country: str, lang: str = "en") -> Dict:
+        # Intros ingested from a dump (snapshot.py) need no request at all
+        entry = self.snapshot.get("wikipedia", lang, country)
+        if entry:
+            if self.snapshot.stale(entry):
+                # Served as is; revalidated in the background like explorer_api does
+                def refresh():
+                    with bypass_cache():
+                        return self._fetch_summary(country, lang, original=True)
+                self.snapshot.refresh("wikipedia", lang, country, refresh)
+            summary = serve_snapshot(entry, None, THUMB_WIDTH)
+            return {key: summary[key] for key in ("title", "extract", "image", "url")}
+        return self._fetch_summary(country, lang)
+
+    def _fetch_summary(self, country: str, lang: str, original: bool = False) -> Dict:
         url = f"https://{lang}.wikipedia.org/w/api.php"
         params = {
             "action": "query",
@@ -41,133 +72,237 @@ class WikiAPI:
             "exintro": True,
             "explaintext": True,
             "inprop": "url",
-            "piprop": "original",
+            # A column-sized thumbnail instead of the full-resolution original
+            "piprop": "thumbnail|original" if original else "thumbnail",
+            "pithumbsize": THUMB_WIDTH,
         }
         try:
-            res = self.session.get(url, params=params, timeout=10).json()
+            res = self._get_json(url, params, "wikipedia", lang)
             pages = res.get("query", {}).get("pages", {})
             page = next(iter(pages.values()))
-            return {
+            summary = {
                 "title": page.get("title", ""),
                 "extract": page.get("extract", ""),
-                "image": page.get("original", {}).get("source", ""),
+                "image": page.get("thumbnail", {}).get("source", ""),
                 "url": page.get("fullurl", ""),
             }
+            if original:
+                # What the snapshot stores, so it can cut thumbnails of any width
+                summary["image_original"] = page.get("original", {}).get("source", "")
+            return summary
         except Exception as e:
-            st.error(f"Wikipedia error: {e}")
-            return {}
+            raise FetchError(f"Wikipedia error: {e}") from e
 
+    @timed("wikidata.facts", size=json_size)
     def get_wikidata(self, country: str) -> Dict:
-        base_url = "https://www.wikidata.org/w/api.php"
         try:
-            # Search item
-            res = self.session.get(base_url, params={
-                "action": "wbsearchentities", "format": "json",
-                "search": country, "language": "en", "limit": 1
-            }).json()
-            if not res["search"]:
-                return {}
-            qid = res["search"][0]["id"]
-
-            # Get claims
-            res = self.session.get(base_url, params={
-                "action": "wbgetentities", "format": "json", "ids": qid
-            }).json()
-            claims = res["entities"][qid]["claims"]
-
-            info = {}
-            if "P1082" in claims:  # Population
-                amount = claims["P1082"][0]["mainsnak"]["datavalue"]["value"]["amount"]
-                info["population"] = f"{int(float(amount)):,}"
-            if "P36" in claims:  # Capital
-                capital_qid = claims["P36"][0]["mainsnak"]["datavalue"]["value"]["id"]
-                cap_res = self.session.get(base_url, params={
-                    "action": "wbgetentities", "format": "json", "ids": capital_qid
-                }).json()
-                info["capital"] = cap_res["entities"][capital_qid]["labels"]["en"]["value"]
-            return info
-        except Exception as e:
-            st.error(f"Wikidata error: {e}")
-            return {}
+            info = self.facts.get(country)
+        except Exception:
+            # The query service is unavailable: core facts from the local
+            # index or the action API, as explorer_api does
+            try:
+                info = self.index.get_facts(country) or self.wikidata.get_facts(country)
+            except Exception as e:
+                raise FetchError(f"Wikidata error: {e}") from e
+        if "population" in info:
+            info["population"] = f"{int(float(info['population'])):,}"
+        return info
 
 # Location handling
 class LocationFinder:
-    def __init__(self):
-        self.geolocator = Nominatim(user_agent="WikiExplorer")
+    def __init__(self, backend: Optional[GeocodingBackend] = None):
+        self.backend = backend or get_geocoding_backend()
+        self.index = get_country_index()
 
+    @timed("geocode.center")
     def get_coords(self, country: str) -> Optional[Tuple[float, float]]:
+        coords = self.index.get_coords(country)
+        if coords:
+            return coords
         try:
-            loc = self.geolocator.geocode(country, timeout=10)
-            return (loc.latitude, loc.longitude) if loc else None
+            return self.backend.find_country(country)
         except Exception as e:
-            st.error(f"Geolocation error: {e}")
-            return None
+            raise FetchError(f"Geolocation error: {e}") from e
 
+    @timed("geocode.places", size=json_size)
     def get_places(self, country: str, place_type: str) -> List[Dict]:
         try:
-            results = self.geolocator.geocode(f"{place_type} in {country}", exactly_one=False, limit=5, timeout=10)
-            return [
-                {
-                    "name": r.address.split(",")[0],
-                    "address": r.address,
-                    "lat": r.latitude,
-                    "lon": r.longitude,
-                } for r in results
-            ] if results else []
+            return self.backend.find_places(country, place_type)
         except Exception as e:
-            st.error(f"Nominatim search error: {e}")
-            return []
+            raise FetchError(f"Places search error: {e}") from e
 
 # Mapping function
+@timed("map.create")
 def create_map(center: Tuple[float, float], places: List[Dict], color: str = "blue"):
-    m = folium.Map(location=center, zoom_start=6)
+    # folium is the slowest import of the app, so only maps pay for it
+    import folium
+    from map_render import add_places, new_map
+    m = new_map(center, places)
     folium.Marker(center, tooltip="Country Center", icon=folium.Icon(color="red")).add_to(m)
-    for p in places:
-        folium.Marker(
-            [p["lat"], p["lon"]],
-            popup=f"<b>{p['name']}</b><br>{p['address']}",
-            icon=folium.Icon(color=color),
-        ).add_to(m)
-    return m
+    return add_places(m, places, color)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+@timed("map.render", size=len)
+def cached_map_html(center: Tuple[float, float], places: List[Dict], color: str) -> str:
+    from map_render import to_html as map_to_html
+    return map_to_html(create_map(center, places, color))
+
+# Panel renderers
+def render_summary(summary: Dict):
+    if summary:
+        st.header(f"📖 {summary['title']}")
+        if summary.get("image"):
+            st.image(summary["image"], use_column_width=True)
+        st.write(summary["extract"])
+        if summary.get("url"):
+            st.markdown(f"[Read more on Wikipedia]({summary['url']})")
+
+def render_facts(facts: Dict):
+    if facts:
+        st.subheader("📊 Quick Facts")
+        if "capital" in facts:
+            st.markdown(f"**Capital**: {facts['capital']}")
+        if "population" in facts:
+            st.markdown(f"**Population**: {facts['population']}")
+        if "currency" in facts:
+            st.markdown(f"**Currency**: {facts['currency']}")
+        if "head_of_state" in facts:
+            st.markdown(f"**Head of State**: {facts['head_of_state']}")
+
+def render_map(coords: Optional[Tuple[float, float]], places: List[Dict]):
+    if coords:
+        st.subheader("🗺️ Places of Interest")
+        components.html(cached_map_html(coords, places or [], "green"), width=700, height=510)
+
+# Shared clients and memoized results
+RESULT_TTL = int(os.environ.get("EXPLORER_RESULT_TTL", 3600))
+
+@st.cache_resource
+def get_wiki_api() -> WikiAPI:
+    return WikiAPI()
+
+@st.cache_resource
+def get_location_finder() -> LocationFinder:
+    return LocationFinder()
+
+# Seconds between background refreshes of popular responses; 0 disables the
+# in-process warmer (e.g. when warmer.py runs as its own process)
+WARM_INTERVAL = int(os.environ.get("EXPLORER_WARM_INTERVAL", 300))
+
+@st.cache_resource
+def start_cache_warmer() -> Optional[CacheWarmer]:
+    if WARM_INTERVAL > 0:
+        return CacheWarmer().start(WARM_INTERVAL)
+    return None
+
+@st.cache_resource
+def refresh_versions() -> Tuple[Iterator[int], Dict[Tuple, int]]:
+    return itertools.count(1), {}
+
+# Refresh moves one query to a new version, which the memoized fetches below
+# take as their last argument; every other query keeps its cached results
+def query_version(query: Tuple, refresh: bool = False) -> int:
+    counter, versions = refresh_versions()
+    if refresh:
+        versions[query] = next(counter)
+    return versions.get(query, 0)
+
+@st.cache_data(ttl=RESULT_TTL, show_spinner=False)
+def cached_summary(title: str, lang: str, version: int = 0) -> Dict:
+    return get_wiki_api().get_summary(title, lang)
+
+@st.cache_data(ttl=RESULT_TTL, show_spinner=False)
+def cached_wikidata(country: str, version: int = 0) -> Dict:
+    return get_wiki_api().get_wikidata(country)
+
+@st.cache_data(ttl=RESULT_TTL, show_spinner=False)
+def cached_coords(country: str, version: int = 0) -> Optional[Tuple[float, float]]:
+    return get_location_finder().get_coords(country)
+
+@st.cache_data(ttl=RESULT_TTL, show_spinner=False)
+def cached_places(country: str, place_type: str, version: int = 0) -> List[Dict]:
+    return get_location_finder().get_places(country, place_type)
+
+# The fetches above raise on failure, so an error is never memoized as "no
+# data"; it is shown here instead and the next run tries again
+def reported(fetch: Callable[..., Any], *args, default: Any = None) -> Any:
+    try:
+        return fetch(*args)
+    except Exception as e:
+        st.error(str(e))
+        return default
 
 # Main UI
+@timed("page.run")
 def main():
+    # Hidden admin page: ?admin=metrics
+    if st.experimental_get_query_params().get("admin") == ["metrics"]:
+        render_dashboard()
+        return
+
+    render_page()
+    # Background services start once the page is on screen, so they never
+    # hold up the first paint
+    start_cache_warmer()
+    start_metrics_server()
+
+def render_page():
     st.title("🌍 Country Wikipedia Explorer")
     st.sidebar.header("Search Configuration")
     
     lang = st.sidebar.selectbox("Language", list(LANGUAGE_CODES.keys()), index=0)
     country = st.sidebar.text_input("Enter Country Name", "France")
     place_type = st.sidebar.selectbox("Places of Interest", ["restaurants", "temples", "tourist attractions", "hotels", "transportation"])
+
+    # Resolve the typed name locally so every API call uses a known-good title
+    resolver = get_name_resolver()
+    match = resolver.resolve(country, LANGUAGE_CODES[lang])
+    if match is None and resolver.available:
+        suggestions = resolver.suggest(country, LANGUAGE_CODES[lang])
+        if suggestions:
+            match = resolver.resolve(st.sidebar.selectbox("Did you mean", suggestions), LANGUAGE_CODES[lang])
+    elif match and match["distance"]:
+        st.sidebar.caption(f"Showing results for **{match['name']}**")
     
+    # Keep showing the explored country across reruns; results are memoized,
+    # so changing the language or place type only re-fetches what depends on it
     if st.sidebar.button("Explore"):
-        wiki = WikiAPI()
-        loc = LocationFinder()
-
-        with st.spinner("Fetching data..."):
-            summary = wiki.get_summary(country, LANGUAGE_CODES[lang])
-            facts = wiki.get_wikidata(country)
-            coords = loc.get_coords(country)
-            places = loc.get_places(country, place_type)
-
-        if summary:
-            st.header(f"📖 {summary['title']}")
-            if summary.get("image"):
-                st.image(summary["image"], use_column_width=True)
-            st.write(summary["extract"])
-            if summary.get("url"):
-                st.markdown(f"[Read more on Wikipedia]({summary['url']})")
-
-        if facts:
-            st.subheader("📊 Quick Facts")
-            if "capital" in facts:
-                st.markdown(f"**Capital**: {facts['capital']}")
-            if "population" in facts:
-                st.markdown(f"**Population**: {facts['population']}")
+        st.session_state["explored"] = country
+    refresh = st.sidebar.button("Refresh", help="Fetch fresh data instead of cached results")
 
-        if coords:
-            st.subheader("🗺️ Places of Interest")
-            m = create_map(coords, places, color="green")
-            folium_static(m)
+    if st.session_state.get("explored") == country:
+        if match is None and resolver.available:
+            st.warning(f"Unknown country: {country}")
+            return
+
+        title = resolver.title_for(match, LANGUAGE_CODES[lang], country)
+        country = resolver.title_for(match, "en", country)
+
+        # Panels are laid out up front and filled as each fetch completes
+        summary_panel = st.empty()
+        facts_panel = st.empty()
+        map_panel = st.empty()
+
+        version = query_version((country, LANGUAGE_CODES[lang], place_type), refresh)
+        tasks = {
+            "summary": lambda: reported(cached_summary, title, LANGUAGE_CODES[lang], version, default={}),
+            "facts": lambda: reported(cached_wikidata, country, version, default={}),
+            "coords": lambda: reported(cached_coords, country, version),
+            "places": lambda: reported(cached_places, country, place_type, version, default=[]),
+        }
+        bundle = {}
+        with st.spinner("Fetching data..."), (bypass_cache() if refresh else nullcontext()):
+            for name, result in FetchOrchestrator().run(tasks):
+                bundle[name] = result
+                if name == "summary":
+                    with summary_panel.container():
+                        render_summary(result)
+                elif name == "facts":
+                    with facts_panel.container():
+                        render_facts(result)
+                elif "coords" in bundle and "places" in bundle:
+                    with map_panel.container():
+                        render_map(bundle["coords"], bundle["places"])
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,20 @@
+from viewport import tiles_for_view
+
+
+def test_view_across_antimeridian_covers_both_sides():
+    # Fiji: west of 180° to east of -180°
+    tiles = tiles_for_view((-20.0, 170.0, -10.0, -170.0), zoom=6)
+    columns = {x for _, x, _ in tiles}
+    last_column = 2 ** tiles[0][0] - 1
+    assert columns == {last_column, 0}
+
+
+def test_unwrapped_longitudes_match_wrapped_view():
+    # The map reports 190° instead of -170° once panned across 180°
+    assert tiles_for_view((-20.0, 170.0, -10.0, 190.0), zoom=6) == \
+        tiles_for_view((-20.0, 170.0, -10.0, -170.0), zoom=6)
+
+
+def test_view_within_one_side_is_unchanged():
+    tiles = tiles_for_view((40.0, 0.0, 50.0, 20.0), zoom=6)
+    assert tiles and all(16 <= x <= 17 for _, x, _ in tiles)
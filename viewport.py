@@ -0,0 +1,163 @@
+"""Load places for the part of the map the user is looking at
+
+The map reports its bounds and zoom after every pan or zoom. The visible
+area is covered by standard web-map tiles (z/x/y), one zoom level coarser
+than the map so a viewport needs only a handful of them. Each tile is
+searched once with a bounded query and cached under its tile, so panning
+back costs nothing and the number of requests per view stays bounded. New
+tiles' places are merged into what the session has already loaded, kept as
+a places.PlaceSet of at most MAX_LOADED_PLACES places.
+"""
+
+import math
+import os
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from places import PlaceSet
+
+# (zoom, x, y) of a web-map tile
+Tile = Tuple[int, int, int]
+# (south, west, north, east) in degrees
+Bounds = Tuple[float, float, float, float]
+
+# Tiles loaded per view at most; past it, a coarser tile zoom is used
+MAX_TILES = int(os.environ.get('EXPLORER_MAX_TILES', 9))
+# Places asked for per tile (Nominatim returns at most 50)
+PLACES_PER_TILE = 50
+# Places kept per country and place type; past it the least recently seen
+# tiles are dropped
+MAX_LOADED_PLACES = int(os.environ.get('EXPLORER_MAX_LOADED_PLACES', 2000))
+# Tile zooms used for searches; zoomed further in, the level-12 tiles are reused
+MIN_TILE_ZOOM = 3
+MAX_TILE_ZOOM = 12
+
+MAX_LATITUDE = 85.0511  # limit of the web mercator projection
+
+
+def _tile_xy(lat: float, lon: float, zoom: int) -> Tuple[int, int]:
+    n = 2 ** zoom
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    lon = max(-180.0, min(180.0, lon))
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(x, n - 1), min(y, n - 1)
+
+
+def tile_bounds(tile: Tile) -> Bounds:
+    """Return a tile's (south, west, north, east)"""
+    zoom, x, y = tile
+    n = 2 ** zoom
+
+    def lat(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+def _wrap_lon(lon: float) -> float:
+    """Longitude in [-180, 180]; the map reports e.g. 190 once panned past 180"""
+    if -180.0 <= lon <= 180.0:
+        return lon
+    return (lon + 180.0) % 360.0 - 180.0
+
+
+def tiles_for_view(bounds: Bounds, zoom: int, max_tiles: int = MAX_TILES) -> List[Tile]:
+    """Tiles covering ``bounds`` at a map zoom of ``zoom``, centre first
+
+    A view across the antimeridian (``west > east`` once wrapped) is covered
+    by the tiles of both of its sides.
+    """
+    south, west, north, east = bounds
+    if east - west >= 360.0:
+        west, east = -180.0, 180.0
+    else:
+        west, east = _wrap_lon(west), _wrap_lon(east)
+    spans = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+    tile_zoom = max(MIN_TILE_ZOOM, min(MAX_TILE_ZOOM, zoom - 1))
+    while True:
+        y0 = _tile_xy(north, 0.0, tile_zoom)[1]
+        y1 = _tile_xy(south, 0.0, tile_zoom)[1]
+        # Tile columns from the view's left edge to its right edge
+        columns = list(dict.fromkeys(
+            x for w, e in spans
+            for x in range(_tile_xy(0.0, w, tile_zoom)[0], _tile_xy(0.0, e, tile_zoom)[0] + 1)
+        ))
+        if len(columns) * (y1 - y0 + 1) <= max_tiles or tile_zoom == 0:
+            break
+        tile_zoom -= 1
+
+    # Distances run along the view, so the columns either side of the
+    # antimeridian count as neighbours
+    cx, cy = (len(columns) - 1) / 2, (y0 + y1) / 2
+    tiles = [(i, (tile_zoom, x, y)) for i, x in enumerate(columns) for y in range(y0, y1 + 1)]
+    # Centre tiles first, so what the user looks at fills in before the edges
+    tiles.sort(key=lambda item: (item[0] - cx) ** 2 + (item[1][2] - cy) ** 2)
+    return [tile for _, tile in tiles[:max_tiles]]
+
+
+def view_from_map_state(state: Optional[Dict]) -> Optional[Tuple[Bounds, int]]:
+    """Extract ``(bounds, zoom)`` from the dict st_folium returns, if it has them"""
+    if not state or not state.get('bounds') or state.get('zoom') is None:
+        return None
+    south_west = state['bounds'].get('_southWest') or {}
+    north_east = state['bounds'].get('_northEast') or {}
+    if south_west.get('lat') is None or north_east.get('lat') is None:
+        return None  # the map hasn't been laid out yet
+    bounds = (south_west['lat'], south_west['lng'], north_east['lat'], north_east['lng'])
+    return bounds, int(state['zoom'])
+
+
+class LoadedPlaces:
+    """Places one session has loaded for a country and place type, by tile
+
+    Holds at most ``max_places`` places. Past that the tiles seen least
+    recently are dropped, and fetched again (usually from the result cache)
+    if the map returns to them.
+    """
+
+    def __init__(self, places: Iterable[Dict] = (), place_type: Optional[str] = None,
+                 max_places: int = MAX_LOADED_PLACES):
+        # numpy is only imported once a map is shown
+        from places import PlaceSet
+
+        self.place_type = place_type
+        self.max_places = max_places
+        # Places by the tile they came from, least recently seen first; the
+        # country-wide search the map starts with is kept under None
+        self._by_tile: 'OrderedDict[Optional[Tile], PlaceSet]' = OrderedDict()
+        self._by_tile[None] = PlaceSet.from_dicts(places, place_type)
+        self.places = self._by_tile[None].dedup()
+
+    @property
+    def tiles(self) -> Set[Tile]:
+        return {tile for tile in self._by_tile if tile is not None}
+
+    def missing(self, tiles: Iterable[Tile]) -> List[Tile]:
+        """The given tiles that aren't loaded; the loaded ones count as just seen"""
+        missing = []
+        for tile in tiles:
+            if tile in self._by_tile:
+                self._by_tile.move_to_end(tile)
+            else:
+                missing.append(tile)
+        return missing
+
+    def merge(self, places: Iterable[Dict], tile: Optional[Tile] = None) -> int:
+        """Add places (from ``tile``, if given); returns how many were new"""
+        from places import PlaceSet
+
+        before = len(self.places)
+        new = PlaceSet.from_dicts(places, self.place_type)
+        if tile in self._by_tile:
+            new = PlaceSet.concat([self._by_tile.pop(tile), new])
+        self._by_tile[tile] = new
+
+        total = sum(len(places) for places in self._by_tile.values())
+        while total > self.max_places and len(self._by_tile) > 1:
+            total -= len(self._by_tile.popitem(last=False)[1])
+        self.places = PlaceSet.concat(list(self._by_tile.values())).dedup()
+        return max(0, len(self.places) - before)
+
+    def all(self) -> 'PlaceSet':
+        return self.places
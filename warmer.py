@@ -0,0 +1,160 @@
+"""Refresh the most requested cached responses before they expire
+
+Every request that goes through the response cache is recorded with its hit
+count. The warmer takes the hottest entries (summaries, Wikidata facts,
+Wikivoyage extracts, country centres and places searches alike), replays
+the ones that will expire within ``refresh_window`` of their TTL, and
+stores the fresh response. Popular countries therefore never expire and a
+refresh never happens on a user's request.
+
+Run it inside the app (``EXPLORER_WARM_INTERVAL`` seconds between passes,
+0 disables it) or as a separate process against the same cache directory::
+
+    python warmer.py --once --top 200 --budget 100
+    python warmer.py --interval 300
+
+When replicas share a store (``EXPLORER_SHARED_STORE``), each entry is
+claimed for one refresh window, so only one replica refreshes it and the
+others pick up the result from the shared tier.
+"""
+
+import argparse
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from metrics import get_metrics
+from response_cache import ResponseCache, get_cache
+from shared_store import SharedStore
+
+# Fetches a response from a cached request's (endpoint, params)
+Fetcher = Callable[[str, Dict], object]
+
+
+def default_fetchers() -> Dict[str, Fetcher]:
+    """Return a fetcher for each source the apps cache"""
+    from geocoding import PRIORITY_WARM, get_geocode_scheduler
+
+    # The client is only built (and httpx imported) when a pass needs it
+    def wikimedia(endpoint: str, params: Dict):
+        from http_client import get_wikimedia_client
+        return get_wikimedia_client().get_json(endpoint, params)
+
+    def nominatim(endpoint: str, params: Dict):
+        # Lowest priority, so user lookups always go first
+        kwargs = {'viewbox': tuple(params['viewbox'])} if params.get('viewbox') else {}
+        return get_geocode_scheduler().geocode(
+            params['q'], PRIORITY_WARM, limit=params.get('limit', 1), timeout=15, **kwargs)
+
+    return {'wikipedia': wikimedia, 'wikivoyage': wikimedia, 'wikidata': wikimedia,
+            'nominatim': nominatim}
+
+
+class CacheWarmer:
+    """Keep the top ``top`` cache entries fresh, spending at most ``budget`` requests a pass"""
+
+    def __init__(self, cache: Optional[ResponseCache] = None,
+                 fetchers: Optional[Dict[str, Fetcher]] = None, top: int = 200,
+                 budget: int = 100, refresh_window: float = 0.2,
+                 shared: Optional[SharedStore] = None):
+        self.cache = cache or get_cache()
+        self.shared = shared if shared is not None else self.cache.shared
+        self.fetchers = fetchers if fetchers is not None else default_fetchers()
+        self.top = top
+        self.budget = budget
+        self.refresh_window = refresh_window
+        self.stats = {'passes': 0, 'refreshed': 0, 'failed': 0, 'deferred': 0, 'claimed': 0}
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def due(self, now: Optional[float] = None) -> List[Dict]:
+        """Hot entries that expire within the refresh window, hottest first"""
+        now = time.time() if now is None else now
+        return [
+            entry for entry in self.cache.hot_entries(self.top)
+            if entry['source'] in self.fetchers
+            and entry['expires'] - now <= self.refresh_window * self.cache.ttl_for(entry['source'])
+        ]
+
+    def run_once(self) -> Dict:
+        """Refresh due entries within the request budget and return this pass's counts"""
+        due = self.due()
+        counts = {'refreshed': 0, 'failed': 0, 'deferred': max(0, len(due) - self.budget), 'claimed': 0}
+        for entry in due[:self.budget]:
+            if self._stop.is_set():
+                break
+            if not self._claim(entry):
+                counts['claimed'] += 1  # another replica is refreshing it
+                continue
+            try:
+                value = self.fetchers[entry['source']](entry['endpoint'], entry['params'])
+            except Exception:
+                counts['failed'] += 1
+                continue
+            self.cache.set(entry['key'], value, entry['source'],
+                           entry['endpoint'], entry['params'], entry['lang'])
+            counts['refreshed'] += 1
+
+        self.stats['passes'] += 1
+        for name, count in counts.items():
+            self.stats[name] += count
+        return counts
+
+    def _claim(self, entry: Dict) -> bool:
+        """Claim an entry's refresh for this replica until the next refresh window"""
+        if self.shared is None:
+            return True
+        # The claim is never released, so replicas whose own copy is still
+        # stale don't refresh it again this window
+        window = self.refresh_window * self.cache.ttl_for(entry['source'])
+        try:
+            return self.shared.acquire('warm:' + entry['key'], window) is not None
+        except Exception:
+            return True
+
+    def _loop(self, interval: float):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                pass  # try again next pass
+            self._stop.wait(interval)
+
+    def start(self, interval: float = 300):
+        """Run passes every ``interval`` seconds on a daemon thread"""
+        get_metrics().register('warmer', lambda: dict(self.stats))
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, args=(interval,),
+                                            name='cache-warmer', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Refresh the hottest cached responses ahead of expiry')
+    parser.add_argument('--top', type=int, default=200, help='number of hottest entries to keep warm')
+    parser.add_argument('--budget', type=int, default=100, help='maximum requests per pass')
+    parser.add_argument('--window', type=float, default=0.2,
+                        help='refresh entries within this fraction of their TTL from expiry')
+    parser.add_argument('--interval', type=float, default=300, help='seconds between passes')
+    parser.add_argument('--once', action='store_true', help='run a single pass and exit')
+    args = parser.parse_args(argv)
+
+    warmer = CacheWarmer(top=args.top, budget=args.budget, refresh_window=args.window)
+    while True:
+        counts = warmer.run_once()
+        print(f"refreshed {counts['refreshed']}, failed {counts['failed']}, "
+              f"deferred {counts['deferred']}", file=sys.stderr)
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
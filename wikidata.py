@@ -0,0 +1,165 @@
+"""Wikidata entity resolution with batched label lookups"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+WIKIDATA_API = "https://www.wikidata.org/w/api.php"
+
+# Claims we turn into quick facts. Quantity claims are returned as the raw
+# amount string, item claims are resolved to a label.
+QUANTITY_FACTS = {
+    'P1082': 'population',
+}
+ITEM_FACTS = {
+    'P36': 'capital',
+    'P38': 'currency',
+    'P35': 'head_of_state',
+}
+
+# wbgetentities accepts at most 50 ids per call
+MAX_IDS = 50
+
+
+def best_statement(statements: List[Dict]) -> Optional[Dict]:
+    """Pick the preferred-rank statement, falling back to the first normal one"""
+    usable = [s for s in statements if s.get('rank') != 'deprecated'
+              and 'datavalue' in s.get('mainsnak', {})]
+    for statement in usable:
+        if statement.get('rank') == 'preferred':
+            return statement
+    return usable[0] if usable else None
+
+
+class LabelCache:
+    """Thread-safe LRU of (QID, lang) -> label"""
+
+    def __init__(self, max_items: int = 4096):
+        self.max_items = max_items
+        self._labels: 'OrderedDict[Tuple[str, str], str]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, qid: str, lang: str) -> Optional[str]:
+        with self._lock:
+            label = self._labels.get((qid, lang))
+            if label is not None:
+                self._labels.move_to_end((qid, lang))
+            return label
+
+    def put(self, qid: str, lang: str, label: str):
+        with self._lock:
+            self._labels[(qid, lang)] = label
+            self._labels.move_to_end((qid, lang))
+            while len(self._labels) > self.max_items:
+                self._labels.popitem(last=False)
+
+
+# Shared by every resolver in the process
+LABELS = LabelCache()
+
+
+class WikidataResolver:
+    """Resolve a country name to its quick facts in two round trips
+
+    1. ``wbgetentities`` by enwiki sitelink with ``props=claims`` only, so
+       labels, aliases, descriptions and sitelinks for every language are
+       never downloaded (falls back to ``wbsearchentities`` when the name
+       isn't an article title).
+    2. One pipe-joined ``wbgetentities`` with ``props=labels`` for every QID
+       referenced by the facts we show, skipped entirely when the labels are
+       already cached.
+    """
+
+    def __init__(self, get_json: Callable[[Dict], Dict], labels: LabelCache = LABELS):
+        self.get_json = get_json
+        self.labels = labels
+
+    def find_entity(self, country: str) -> Tuple[Optional[str], Dict]:
+        """Return (QID, claims) for a country name"""
+        data = self.get_json({
+            'action': 'wbgetentities',
+            'format': 'json',
+            'sites': 'enwiki',
+            'titles': country,
+            'normalize': 1,
+            'props': 'claims',
+        })
+        for qid, entity in data.get('entities', {}).items():
+            if 'missing' not in entity and qid.startswith('Q'):
+                return qid, entity.get('claims', {})
+
+        search = self.get_json({
+            'action': 'wbsearchentities',
+            'format': 'json',
+            'search': country,
+            'language': 'en',
+            'type': 'item',
+            'limit': 1,
+        })
+        if not search.get('search'):
+            return None, {}
+        qid = search['search'][0]['id']
+        data = self.get_json({
+            'action': 'wbgetentities',
+            'format': 'json',
+            'ids': qid,
+            'props': 'claims',
+        })
+        return qid, data.get('entities', {}).get(qid, {}).get('claims', {})
+
+    def get_labels(self, qids: Iterable[str], lang: str = 'en') -> Dict[str, str]:
+        """Return labels for many QIDs, fetching only the uncached ones"""
+        labels = {}
+        missing = []
+        for qid in dict.fromkeys(qids):
+            label = self.labels.get(qid, lang)
+            if label is None:
+                missing.append(qid)
+            else:
+                labels[qid] = label
+
+        for start in range(0, len(missing), MAX_IDS):
+            batch = missing[start:start + MAX_IDS]
+            data = self.get_json({
+                'action': 'wbgetentities',
+                'format': 'json',
+                'ids': '|'.join(batch),
+                'props': 'labels',
+                'languages': lang,
+                'languagefallback': 1,
+            })
+            for qid, entity in data.get('entities', {}).items():
+                entity_labels = entity.get('labels', {})
+                if lang in entity_labels:
+                    label = entity_labels[lang]['value']
+                elif entity_labels:
+                    label = next(iter(entity_labels.values()))['value']
+                else:
+                    continue
+                self.labels.put(qid, lang, label)
+                labels[qid] = label
+        return labels
+
+    def get_facts(self, country: str, lang: str = 'en') -> Dict:
+        """Return quick facts for a country, e.g. population and capital"""
+        qid, claims = self.find_entity(country)
+        if qid is None:
+            return {}
+
+        info = {'qid': qid}
+        for prop, name in QUANTITY_FACTS.items():
+            statement = best_statement(claims.get(prop, []))
+            if statement:
+                info[name] = statement['mainsnak']['datavalue']['value']['amount']
+
+        referenced = {}
+        for prop, name in ITEM_FACTS.items():
+            statement = best_statement(claims.get(prop, []))
+            if statement:
+                referenced[name] = statement['mainsnak']['datavalue']['value']['id']
+
+        labels = self.get_labels(referenced.values(), lang)
+        for name, value_qid in referenced.items():
+            if value_qid in labels:
+                info[name] = labels[value_qid]
+        return info